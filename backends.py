@@ -0,0 +1,217 @@
+import ctypes
+import itertools
+import os
+import struct
+import time
+
+import numpy as np
+
+from common import FMR_TEMPLATE_SIZE, log_debug
+from fmr import FMR_MAGIC
+from frame_gate import FrameGate
+
+class FPSPLIT_INFO(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [("x", ctypes.c_int), ("y", ctypes.c_int), ("top", ctypes.c_int), ("left", ctypes.c_int), ("angle", ctypes.c_int), ("quality", ctypes.c_int), ("pOutBuf", ctypes.POINTER(ctypes.c_ubyte))]
+
+# =============================================
+# ANTARMUKA BACKEND
+# =============================================
+class FingerprintBackend:
+    """Antarmuka scanner + algoritma di belakang FingerprintDevice.
+
+    Nilai kembalian mengikuti konvensi DLL aslinya: *_init() mengembalikan 1 jika berhasil,
+    open_algorithm() mengembalikan handle (0 = gagal), split() mengembalikan (kode, jumlah jari)
+    dengan kode 0 = berhasil, create_template() bukan nol jika berhasil.
+    """
+    name = "base"
+
+    def livescan_init(self): raise NotImplementedError
+    def mosaic_init(self): raise NotImplementedError
+    def open_algorithm(self): raise NotImplementedError
+    def close_algorithm(self, handle): raise NotImplementedError
+    def get_raw_frame(self, channel, buffer): raise NotImplementedError
+    def finger_quality(self, buffer, w, h): raise NotImplementedError
+    def split(self, buffer, w, h, out_w, out_h, info_array): raise NotImplementedError
+    def create_template(self, handle, image_buffer, template_buffer): raise NotImplementedError
+    def compare(self, handle, template1, template2): raise NotImplementedError
+
+# =============================================
+# BACKEND DLL WINDOWS (PRODUKSI)
+# =============================================
+class DllBackend(FingerprintBackend):
+    """Backend asli: GALSXXYY (scanner), Gamc (kualitas), FpSplit, ZAZ_FpStdLib dan imagecut.
+
+    Setiap DLL dimuat saat pertama kali dipakai (bukan saat import), sehingga agent sudah melayani
+    HTTP sebelum driver scanner siap dan DLL yang tidak pernah dipanggil tidak dimuat sama sekali.
+    """
+    name = "dll"
+    # atribut -> (file DLL, argtypes per fungsi)
+    LIBRARIES = {
+        "gals_dll": ("GALSXXYY.dll", {"LIVESCAN_GetFPRawData": [ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte)]}),
+        "gamc_dll": ("Gamc.dll", {"MOSAIC_FingerQuality": [ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int]}),
+        "zaz_dll": ("ZAZ_FpStdLib.dll", {
+            "ZAZ_FpStdLib_CreateISOTemplate": [ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte)],
+            "ZAZ_FpStdLib_CompareTemplates": [ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte)],
+            "ZAZ_FpStdLib_CloseDevice": [ctypes.c_int],
+        }),
+        "fpsplit_dll": ("FpSplit.dll", {"FPSPLIT_DoSplit": [ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                                            ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(FPSPLIT_INFO)]}),
+        "imagecut_dll": ("imagecut.dll", {"imagecut": [ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte),
+                                                       ctypes.c_int, ctypes.c_int, ctypes.c_int]}),
+    }
+
+    def __init__(self, dll_dir):
+        self.dll_dir = dll_dir
+        missing = [f for f, _ in self.LIBRARIES.values() if not os.path.exists(os.path.join(dll_dir, f))]
+        if missing: raise FileNotFoundError(f"DLL tidak ditemukan di {dll_dir}: {', '.join(missing)}")
+
+    def __getattr__(self, name):
+        # Hanya dipanggil bila atribut belum ada: DLL dimuat sekali lalu disimpan di __dict__.
+        # Tanpa lock: pemuatan ganda dari dua thread mengembalikan handle modul yang sama.
+        if name not in DllBackend.LIBRARIES: raise AttributeError(name)
+        filename, argtypes = DllBackend.LIBRARIES[name]
+        started = time.perf_counter()
+        library = ctypes.WinDLL(os.path.join(self.dll_dir, filename))
+        for function, types in argtypes.items(): getattr(library, function).argtypes = types
+        log_debug(f"{filename} loaded in {(time.perf_counter() - started) * 1000:.1f} ms")
+        self.__dict__[name] = library
+        return library
+
+    @property
+    def loaded_libraries(self):
+        return [self.LIBRARIES[name][0] for name in self.LIBRARIES if name in self.__dict__]
+
+    def livescan_init(self): return self.gals_dll.LIVESCAN_Init()
+    def mosaic_init(self): return self.gamc_dll.MOSAIC_Init()
+    def open_algorithm(self): return self.zaz_dll.ZAZ_FpStdLib_OpenDevice()
+    def close_algorithm(self, handle): self.zaz_dll.ZAZ_FpStdLib_CloseDevice(handle)
+    def get_raw_frame(self, channel, buffer): return self.gals_dll.LIVESCAN_GetFPRawData(channel, buffer) == 1
+    def finger_quality(self, buffer, w, h): return self.gamc_dll.MOSAIC_FingerQuality(buffer, w, h)
+
+    def split(self, buffer, w, h, out_w, out_h, info_array):
+        finger_num = ctypes.c_int(0)
+        ret = self.fpsplit_dll.FPSPLIT_DoSplit(buffer, w, h, 1, out_w, out_h, ctypes.byref(finger_num), info_array)
+        return ret, finger_num.value
+
+    def create_template(self, handle, image_buffer, template_buffer):
+        return self.zaz_dll.ZAZ_FpStdLib_CreateISOTemplate(handle, image_buffer, template_buffer)
+
+    def compare(self, handle, template1, template2):
+        return self.zaz_dll.ZAZ_FpStdLib_CompareTemplates(handle, template1, template2)
+
+# =============================================
+# BACKEND REPLAY (LINUX/CI & BENCHMARK)
+# =============================================
+_SYNTHETIC_GRID = (90, 64)  # Gambar jari 360x256 diperkecil 4x menjadi bit template
+_SYNTHETIC_BODY = _SYNTHETIC_GRID[0] * _SYNTHETIC_GRID[1] // 8
+_SYNTHETIC_HEADER = 28
+
+def write_replay_file(path, frames):
+    """Menulis frame uint8 (masing-masing HxW) berurutan sebagai file rekaman untuk ReplayBackend."""
+    with open(path, 'wb') as f:
+        for frame in frames:
+            f.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+
+class ReplayBackend(FingerprintBackend):
+    """Memutar ulang frame mentah dari file memory-mapped, dengan pengganti deterministik untuk
+    split, pembuatan template dan perbandingan. Tidak butuh Windows, DLL maupun scanner.
+
+    File rekaman berisi frame width x height uint8 berurutan; setiap channel punya kursor sendiri
+    dan berputar kembali ke awal setelah frame terakhir.
+    """
+    name = "replay"
+
+    def __init__(self, path, width=1600, height=1500, frame_interval=0.0, init_delay=0.0):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.frame_interval = frame_interval
+        self.init_delay = init_delay  # Detik LIVESCAN_Init memblokir (meniru driver scanner nyata)
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        frame_size = width * height
+        if raw.size < frame_size: raise ValueError(f"File replay tidak berisi frame {width}x{height}: {path}")
+        self.frames = raw[:raw.size // frame_size * frame_size].reshape(-1, height, width)
+        # Satu penghitung per channel; next() atomik sehingga channel bisa dibaca dari thread OS berbeda
+        self._cursors = {}
+        self._gate = FrameGate()
+        log_debug(f"Replay backend loaded {len(self.frames)} frame(s) from {path}")
+
+    def livescan_init(self):
+        if self.init_delay: _blocking_sleep(self.init_delay)
+        return 1
+
+    def mosaic_init(self): return 1
+    def open_algorithm(self): return 1
+    def close_algorithm(self, handle): pass
+
+    def get_raw_frame(self, channel, buffer):
+        index = next(self._cursors.setdefault(channel, itertools.count())) % len(self.frames)
+        if self.frame_interval: time.sleep(self.frame_interval)
+        np.copyto(np.ctypeslib.as_array(buffer).reshape(self.height, self.width), self.frames[index])
+        return True
+
+    def finger_quality(self, buffer, w, h):
+        image = np.ctypeslib.as_array(buffer).reshape(h, w)
+        return min(100, int(self._gate.foreground_ratio(image) * 250))
+
+    def split(self, buffer, w, h, out_w, out_h, info_array):
+        """Pengganti FPSPLIT: jari = rentang kolom berurutan yang berisi blok foreground."""
+        image = np.ctypeslib.as_array(buffer).reshape(h, w)
+        cell = self._gate.step * self._gate.block
+        mask = self._gate.block_mask(image)
+        column_hits = mask.sum(axis=0) >= 2
+        runs, start = [], None
+        for col, hit in enumerate(list(column_hits) + [False]):
+            if hit and start is None: start = col
+            elif not hit and start is not None:
+                runs.append((start, col))
+                start = None
+        runs = runs[:len(info_array)]
+
+        for i, (c0, c1) in enumerate(runs):
+            run_rows = np.nonzero(mask[:, c0:c1].any(axis=1))[0]
+            cx = int((c0 + c1) * cell / 2)
+            cy = int((run_rows.min() + run_rows.max() + 1) * cell / 2)
+            left = min(max(0, cx - out_w // 2), w - out_w)
+            top = min(max(0, cy - out_h // 2), h - out_h)
+            crop = np.ascontiguousarray(image[top:top + out_h, left:left + out_w])
+            ctypes.memmove(info_array[i].pOutBuf, crop.ctypes.data, out_w * out_h)
+            info_array[i].x, info_array[i].y, info_array[i].left, info_array[i].top = cx, cy, left, top
+            info_array[i].quality = int(mask[:, c0:c1].mean() * 100)
+        return 0, len(runs)
+
+    def create_template(self, handle, image_buffer, template_buffer):
+        """Template FMR semu: header ISO + bit gambar jari yang diperkecil (gambar mirip -> template mirip)."""
+        size = ctypes.sizeof(image_buffer)
+        height = size // 256
+        image = np.ctypeslib.as_array(image_buffer).reshape(height, 256).astype(np.float32)
+        if image.std() < 1.0: return 0
+        grid = image.reshape(_SYNTHETIC_GRID[0], height // _SYNTHETIC_GRID[0], _SYNTHETIC_GRID[1], 256 // _SYNTHETIC_GRID[1]).mean(axis=(1, 3))
+        bits = grid > np.median(grid)
+        minutiae = int(np.clip(np.count_nonzero(bits[:, 1:] != bits[:, :-1]) // 40, 10, 120))
+        header = FMR_MAGIC + b" 20\x00" + struct.pack(">IHHHHHBB", FMR_TEMPLATE_SIZE, 0, 256, height, 197, 197, 1, 0)
+        header += struct.pack(">BBBB", 0, 0, int(bits.mean() * 100), minutiae)
+        body = np.packbits(bits).tobytes()
+        ctypes.memset(template_buffer, 0, FMR_TEMPLATE_SIZE)
+        ctypes.memmove(template_buffer, header + body, len(header) + len(body))
+        return 1
+
+    def compare(self, handle, template1, template2):
+        a = int.from_bytes(bytes(memoryview(template1).cast('B')[_SYNTHETIC_HEADER:_SYNTHETIC_HEADER + _SYNTHETIC_BODY]), 'little')
+        b = int.from_bytes(bytes(memoryview(template2).cast('B')[_SYNTHETIC_HEADER:_SYNTHETIC_HEADER + _SYNTHETIC_BODY]), 'little')
+        diff = bin(a ^ b).count('1')
+        return max(0, int(100 - 200 * diff / (_SYNTHETIC_BODY * 8)))
+
+def _blocking_sleep(seconds):
+    # time.sleep asli, bukan versi hijau hasil monkey_patch: init_delay harus memblokir seperti DLL sungguhan
+    try: from eventlet.patcher import original
+    except ImportError: return time.sleep(seconds)
+    original('time').sleep(seconds)
+
+def create_backend(name, dll_dir=None, replay_path=None, **options):
+    if name == "dll": return DllBackend(dll_dir)
+    if name == "replay":
+        if not replay_path: raise ValueError("FP_REPLAY_PATH wajib diisi untuk backend replay")
+        return ReplayBackend(replay_path, **options)
+    raise ValueError(f"Backend tidak dikenal: {name}")
@@ -0,0 +1,22 @@
+"""Frame sintetis 1600x1500 untuk benchmark: platen kosong, jari parsial, slap 4 jari, dua jempol."""
+import numpy as np
+
+WIDTH, HEIGHT = 1600, 1500
+
+_LAYOUTS = {
+    "partial": ([(800, 700)], (150, 200)),
+    "slap": ([(380, 760), (680, 640), (980, 660), (1280, 780)], (120, 300)),
+    "thumbs": ([(520, 750), (1080, 750)], (200, 380)),
+}
+
+def synthetic_frame(rng, kind, period=4.5, tilt=0.3):
+    """period/tilt mengatur pola ridge; nilai berbeda meniru jari orang yang berbeda."""
+    frame = rng.normal(235, 3, (HEIGHT, WIDTH)).clip(0, 255).astype(np.uint8)
+    if kind == "empty": return frame
+    yy, xx = np.mgrid[0:HEIGHT, 0:WIDTH]
+    ridges = (np.sin((xx + yy * tilt) / period) > 0)
+    centers, radius = _LAYOUTS[kind]
+    for cx, cy in centers:
+        mask = ((xx - cx) / radius[0]) ** 2 + ((yy - cy) / radius[1]) ** 2 <= 1
+        frame[mask & ridges] = 40
+    return frame
@@ -0,0 +1,98 @@
+"""Benchmark alokasi & salinan buffer ctypes: pola lama (c_ubyte * n)(*data) vs pool + from_buffer.
+
+Contoh:
+    python benchmarks/bench_buffers.py --frames 50 --compares 20000
+"""
+import argparse
+import ctypes
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buffers import BufferPool, as_ubyte_array, copy_stats
+from common import FMR_TEMPLATE_SIZE
+
+FRAME_SIZE = 1600 * 1500
+SPLIT_SIZE = 256 * 360
+
+def measure(label, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    print(f"{label:<34}{elapsed:>10.4f}s  peak={peak / 1e6:>8.2f} MB  live_blocks={blocks}")
+    return elapsed
+
+def capture_loop_legacy(frames, qualities):
+    best_image = None
+    best_quality = 0
+    for i in range(frames):
+        data = (ctypes.c_ubyte * FRAME_SIZE)()
+        if qualities[i] > best_quality:
+            best_quality = qualities[i]
+            best_image = bytes(data)
+    # _process_captured_image membongkar setiap byte sebagai argumen Python
+    return (ctypes.c_ubyte * len(best_image))(*best_image)
+
+def capture_loop_pooled(pool, frames, qualities):
+    best_image = None
+    best_quality = 0
+    data = pool.acquire()
+    for i in range(frames):
+        if qualities[i] > best_quality:
+            best_quality = qualities[i]
+            best_image, data = data, (best_image if best_image is not None else pool.acquire())
+    result = as_ubyte_array(best_image, FRAME_SIZE)
+    pool.release(data)
+    pool.release(best_image)
+    return result
+
+def split_buffers_pooled(pool):
+    with pool.borrow(10) as split_buffers:
+        return [as_ubyte_array(buf, SPLIT_SIZE) for buf in split_buffers]
+
+def compare_wrap_legacy(gallery, count):
+    for i in range(count):
+        chunk = bytes(gallery[i * FMR_TEMPLATE_SIZE:(i + 1) * FMR_TEMPLATE_SIZE])
+        (ctypes.c_ubyte * FMR_TEMPLATE_SIZE)(*chunk)
+
+def compare_wrap_zero_copy(gallery, count):
+    view = memoryview(gallery)
+    for i in range(count):
+        as_ubyte_array(view[i * FMR_TEMPLATE_SIZE:(i + 1) * FMR_TEMPLATE_SIZE], FMR_TEMPLATE_SIZE)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--compares", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    qualities = [rng.randint(0, 100) for _ in range(args.frames)]
+    gallery = bytearray(rng.getrandbits(8) for _ in range(args.compares * FMR_TEMPLATE_SIZE))
+
+    print(f"frames={args.frames} compares={args.compares}")
+    measure("capture loop, legacy", lambda: capture_loop_legacy(args.frames, qualities))
+    pool = BufferPool(FRAME_SIZE, count=2, name="frame")
+    measure("capture loop, pooled", lambda: capture_loop_pooled(pool, args.frames, qualities))
+    print(f"  frame pool: {pool.stats()}")
+
+    measure("split image wrap, legacy (x10)", lambda: [(ctypes.c_ubyte * SPLIT_SIZE)(*bytes(SPLIT_SIZE)) for _ in range(10)])
+    split_pool = BufferPool(SPLIT_SIZE, count=10, name="split")
+    measure("split image wrap, pooled (x10)", lambda: split_buffers_pooled(split_pool))
+    print(f"  split pool: {split_pool.stats()}")
+
+    measure("gallery compare wrap, legacy", lambda: compare_wrap_legacy(gallery, args.compares))
+    measure("gallery compare wrap, zero-copy", lambda: compare_wrap_zero_copy(gallery, args.compares))
+    print(f"  copy stats: {copy_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark identifikasi cascade multi-jari: jumlah perbandingan per identifikasi vs pemindaian penuh semua jari.
+
+Probe adalah slap 4 jari kanan (atau kiri) dari user acak dengan derau bit berbeda per jari; kualitas
+FPSPLIT disimulasikan berbanding terbalik dengan derau sehingga jari terbaik dibandingkan lebih dulu.
+
+Contoh:
+    python benchmarks/bench_cascade.py --users 2000 --probes 30
+    python benchmarks/bench_cascade.py --reject-score 0   # tanpa penolakan dini (semua user ke tahap 2)
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bench_prefilter import make_probe, make_template
+from cascade import CascadeMatcher
+from common import FMR_TEMPLATE_SIZE
+from fmr import ENROLLMENT_FINGER_ORDER, ISO_FINGER_POSITIONS
+from gallery import GalleryCache
+from matcher import MatchEngine, NumpyXorComparator
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--reject-score", type=int, default=20)
+    parser.add_argument("--max-survivors", type=int, default=64)
+    parser.add_argument("--noise", type=float, nargs=2, default=[0.08, 0.22], help="rentang derau bit per jari probe")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    users = []
+    for u in range(args.users):
+        combined = b"".join(make_template(rng, ISO_FINGER_POSITIONS[pos], rng.randint(40, 100), rng.randint(20, 80)) for pos in ENROLLMENT_FINGER_ORDER)
+        users.append({"name": f"user{u}", "id_number": str(u), "combined_template_base64": base64.b64encode(combined).decode()})
+    cache = GalleryCache("http://unused")
+    cache.load_users(users)
+    gallery = cache.snapshot()
+    all_slots = np.asarray(gallery.live_slots, dtype=np.int64)
+
+    engine = MatchEngine(NumpyXorComparator(), workers=1)
+    matcher = CascadeMatcher(args.reject_score, args.max_survivors)
+    full_time = cascade_time = 0.0
+    full_compares = cascade_compares = full_correct = cascade_correct = survivors = 0
+    for _ in range(args.probes):
+        truth = rng.randrange(args.users)
+        hand = rng.choice(["right", "left"])
+        # Urutan split kiri ke kanan: telunjuk..kelingking kanan, kelingking..telunjuk kiri
+        keys = [f"{hand}_{f}" for f in ("index", "middle", "ring", "little")]
+        if hand == "left": keys.reverse()
+        probes, fingers = [], []
+        for split_index, key in enumerate(keys):
+            slot = all_slots[truth * len(ENROLLMENT_FINGER_ORDER) + ENROLLMENT_FINGER_ORDER.index(key)]
+            stored = bytes(gallery.buffer[slot * FMR_TEMPLATE_SIZE:(slot + 1) * FMR_TEMPLATE_SIZE])
+            noise = rng.uniform(*args.noise)
+            probes.append(make_probe(rng, stored, noise, 5, False))
+            fingers.append((split_index, int(100 - noise * 300)))
+
+        # Pembanding: setiap jari probe terhadap seluruh galeri, skor terbaik per user
+        started = time.perf_counter()
+        scores = engine.score_all(probes, gallery.buffer, [all_slots] * len(probes))
+        best = np.zeros(args.users, dtype=np.int32)
+        owners = np.frombuffer(gallery.slot_owner[:gallery.slot_count], dtype=np.int32)[all_slots]
+        for probe_scores in scores: np.maximum.at(best, owners, np.asarray(probe_scores, dtype=np.int32))
+        full_time += time.perf_counter() - started
+        full_compares += len(probes) * len(all_slots)
+        full_correct += int(np.argmax(best)) == truth
+
+        started = time.perf_counter()
+        outcome = matcher.identify(engine, probes, fingers, len(probes), gallery)
+        cascade_time += time.perf_counter() - started
+        cascade_compares += outcome.stage1_compares + outcome.stage2_compares
+        cascade_correct += bool(outcome.shortlist) and outcome.shortlist[0].user_index == truth
+        survivors += outcome.survivors
+
+    print(f"users={args.users} templates={len(all_slots)} probes={args.probes} reject_score={args.reject_score}")
+    print(f"full scan compares/id  : {full_compares / args.probes:10.0f}  avg {full_time / args.probes * 1000:8.2f} ms  top-1 {full_correct}/{args.probes}")
+    print(f"cascade compares/id    : {cascade_compares / args.probes:10.0f}  avg {cascade_time / args.probes * 1000:8.2f} ms  top-1 {cascade_correct}/{args.probes}")
+    print(f"compare reduction      : {full_compares / cascade_compares:.1f}x  (survivors/id {survivors / args.probes:.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark kapasitas DevicePool: throughput capture+split+template dengan 1..N scanner replay paralel.
+
+Setiap perangkat membaca channel-nya sendiri dari file replay yang sama dan menjalankan job capture
+berurutan lewat scheduler-nya. --frame-interval dan --processing-delay meniru laju scanner dan biaya
+DLL yang memblokir (di thread OS), sehingga skala kapasitas terhadap jumlah scanner terlihat.
+
+Contoh:
+    python benchmarks/bench_device_pool.py --devices 1 2 4 --captures 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pipeline import TimingBackend, build_replay_file
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--captures", type=int, default=5, help="capture per perangkat")
+    parser.add_argument("--empty-frames", type=int, default=6)
+    parser.add_argument("--frame-interval", type=float, default=0.03, help="detik per frame scanner")
+    parser.add_argument("--processing-delay", type=float, default=0.05, help="detik tambahan per split & per template")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    replay_path = os.path.join(tmp_dir.name, "frames.raw")
+    build_replay_file(replay_path, args.empty_frames)
+    os.environ["FP_BACKEND"] = "replay"
+    os.environ["FP_REPLAY_PATH"] = replay_path
+    os.environ["FP_CHANNELS"] = ",".join(str(c) for c in range(max(args.devices)))
+    os.environ["FP_TEMPLATE_STORE"] = ""
+    os.environ["FP_ENROLLMENT_UPLOAD"] = "0"
+    os.environ["FP_ENROLLMENT_SPILL"] = os.path.join(tmp_dir.name, "spill")
+    import local_agent as agent
+
+    agent.socketio.emit = lambda event, payload=None, **kwargs: None
+    agent.CAPTURE_DELAY_AFTER_QUALITY_MET = 0.0
+    agent.backend.frame_interval = args.frame_interval
+    delays = {"split": args.processing_delay, "create_template": args.processing_delay}
+    pool = agent.device_pool
+    for device in pool:
+        device.backend = TimingBackend(agent.backend, delays)
+    if not pool.initialize_all()["success"]: sys.exit("Inisialisasi perangkat gagal")
+    pool.start()
+
+    baseline = None
+    for count in args.devices:
+        devices = list(pool)[:count]
+        started = time.perf_counter()
+        jobs = [device.scheduler.submit("capture", device._capture_job, agent.CaptureType.RIGHT_FOUR, 1)
+                for _ in range(args.captures) for device in devices]
+        for job in jobs: job.wait()
+        elapsed = time.perf_counter() - started
+        failed = [job.to_dict() for job in jobs if job.state.value != "succeeded"]
+        if failed: sys.exit(f"Capture gagal: {failed[0]}")
+        throughput = len(jobs) / elapsed
+        baseline = baseline or throughput / count
+        print(f"devices={count:<3} captures={len(jobs):<4} elapsed={elapsed:7.2f} s  {throughput:6.2f} capture/s  "
+              f"scaling={throughput / baseline:5.2f}x (ideal {count}x)")
+
+    for device in pool: device.scheduler.stop()
+    agent.match_engine.shutdown()
+    tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark frame gating: biaya FrameGate.classify vs penilaian kualitas penuh per frame.
+
+Frame sintetis (platen kosong, jari parsial, slap penuh) dibuat bila --frames-file tidak diberikan.
+--frames-file adalah file mentah berisi frame 1600x1500 uint8 berurutan (hasil rekaman scanner).
+
+Contoh:
+    python benchmarks/bench_frame_gate.py --frames 200 --empty-share 0.8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from frame_gate import FrameClass, FrameGate
+from _synthetic import HEIGHT, WIDTH, synthetic_frame
+
+def full_frame_quality(frame):
+    """Pengganti MOSAIC_FingerQuality: energi gradien pada resolusi penuh."""
+    f = frame.astype(np.int16)
+    return int(np.abs(np.diff(f, axis=1)).mean() + np.abs(np.diff(f, axis=0)).mean())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--empty-share", type=float, default=0.8)
+    parser.add_argument("--frames-file")
+    args = parser.parse_args()
+
+    if args.frames_file:
+        recorded = np.memmap(args.frames_file, dtype=np.uint8, mode='r')
+        frames = recorded[:recorded.size // (WIDTH * HEIGHT) * WIDTH * HEIGHT].reshape(-1, HEIGHT, WIDTH)
+        stream = [frames[i % len(frames)] for i in range(args.frames)]
+    else:
+        rng = np.random.default_rng(3)
+        samples = {kind: synthetic_frame(rng, kind) for kind in ("empty", "partial", "slap")}
+        kinds = rng.choice(["empty", "partial", "slap"], size=args.frames,
+                           p=[args.empty_share, (1 - args.empty_share) / 2, (1 - args.empty_share) / 2])
+        stream = [samples[k] for k in kinds]
+        for kind, frame in samples.items():
+            print(f"{kind:<8} -> {FrameGate().classify(frame).value}")
+
+    started = time.perf_counter()
+    for frame in stream: full_frame_quality(frame)
+    ungated = time.perf_counter() - started
+
+    gate = FrameGate()
+    scored = 0
+    started = time.perf_counter()
+    for frame in stream:
+        if gate.classify(frame) is FrameClass.CANDIDATE:
+            full_frame_quality(frame)
+            scored += 1
+    gated = time.perf_counter() - started
+
+    print(f"frames={len(stream)} scored={scored} classes={gate.stats}")
+    print(f"ungated : {ungated / len(stream) * 1000:.2f} ms/frame ({len(stream) / ungated:.1f} fps max)")
+    print(f"gated   : {gated / len(stream) * 1000:.2f} ms/frame ({len(stream) / gated:.1f} fps max)")
+
+if __name__ == "__main__":
+    main()
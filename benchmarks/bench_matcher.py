@@ -0,0 +1,63 @@
+"""Benchmark mesin pencocokan 1:N bershard dengan comparator pengganti (bisa jalan di Linux).
+
+Contoh:
+    python benchmarks/bench_matcher.py --gallery 20000 --workers 1 4 --mode process
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import FMR_TEMPLATE_SIZE
+from matcher import MatchEngine, NumpyXorComparator, XorComparator
+
+COMPARATORS = {"xor": XorComparator, "numpy": NumpyXorComparator}
+
+def build_gallery(size, seed=1234):
+    rng = random.Random(seed)
+    return bytearray(b"".join(rng.getrandbits(8 * FMR_TEMPLATE_SIZE).to_bytes(FMR_TEMPLATE_SIZE, 'little') for _ in range(size)))
+
+def run_case(engine, probe, buffer, slots, repeat):
+    timings = []
+    outcome = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        outcome = engine.find_first([probe], memoryview(buffer), slots, 55)
+        timings.append(time.perf_counter() - started)
+    return min(timings), outcome
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--gallery", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--comparator", choices=sorted(COMPARATORS), default="xor")
+    parser.add_argument("--shard-size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    buffer = build_gallery(args.gallery)
+    slots = tuple(range(args.gallery))
+    hit_slot = int(args.gallery * 0.75)
+    cases = {
+        "miss": bytes(FMR_TEMPLATE_SIZE),
+        "hit@75%": bytes(buffer[hit_slot * FMR_TEMPLATE_SIZE:(hit_slot + 1) * FMR_TEMPLATE_SIZE]),
+    }
+
+    print(f"gallery={args.gallery} mode={args.mode} comparator={args.comparator} shard_size={args.shard_size}")
+    print(f"{'case':<10}{'workers':>8}{'best_s':>10}{'compares/s':>14}{'compares':>10}{'slot':>8}")
+    for workers in args.workers:
+        engine = MatchEngine(COMPARATORS[args.comparator](), workers=workers, shard_size=args.shard_size,
+                             mode=args.mode, comparator_factory=COMPARATORS[args.comparator])
+        try:
+            for name, probe in cases.items():
+                elapsed, outcome = run_case(engine, probe, buffer, slots, args.repeat)
+                print(f"{name:<10}{workers:>8}{elapsed:>10.4f}{outcome.compares / elapsed:>14.0f}{outcome.compares:>10}{str(outcome.slot):>8}")
+        finally:
+            engine.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Benchmark pipeline per tahap di atas ReplayBackend: capture, split, template, enrollment 4-4-2 dan 1:N.
+
+Agent dijalankan tanpa Windows/DLL/scanner (FP_BACKEND=replay). Frame sintetis ditulis ke file
+replay sementara kecuali --replay-file diberikan. Setiap pemanggilan backend diukur, sehingga
+regresi per tahap terlihat terpisah dari total waktu capture.
+
+Contoh:
+    python benchmarks/bench_pipeline.py --captures 5 --gallery-sizes 1000 10000
+    python benchmarks/bench_pipeline.py --processing-delay 0.2 --frame-interval 0.05   # biaya DLL & laju scanner nyata
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from _synthetic import synthetic_frame
+from backends import ReplayBackend, write_replay_file
+from common import FMR_TEMPLATE_SIZE
+
+class TimingBackend:
+    """Membungkus backend dan mencatat durasi setiap pemanggilan per nama metode.
+
+    delays menambahkan waktu blok tetap per metode (mis. meniru FPSPLIT/ZAZ yang lebih lambat dari stand-in replay).
+    """
+
+    def __init__(self, inner, delays=None):
+        self.inner = inner
+        self.timings = {}
+        self.delays = delays or {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not callable(attr): return attr
+        def timed(*args):
+            started = time.perf_counter()
+            if name in self.delays: _blocking_sleep(self.delays[name])
+            try: return attr(*args)
+            finally: self.timings.setdefault(name, []).append(time.perf_counter() - started)
+        return timed
+
+def report(label, samples):
+    if not samples:
+        print(f"{label:<24} (tidak ada sampel)")
+        return
+    ms = np.asarray(samples) * 1000
+    print(f"{label:<24} n={len(ms):<6} mean={ms.mean():8.2f} ms  p95={np.percentile(ms, 95):8.2f} ms  {1000 / ms.mean():9.1f}/s")
+
+def _blocking_sleep(seconds):
+    # time.sleep asli (bukan versi eventlet) agar meniru DLL yang memblokir thread
+    import eventlet
+    eventlet.patcher.original('time').sleep(seconds)
+
+def build_enrollment_file(path):
+    """Urutan slap kiri, slap kanan, dua jempol dengan platen kosong di antaranya."""
+    rng = np.random.default_rng(6)
+    empty = lambda: synthetic_frame(rng, "empty")
+    write_replay_file(path, [empty(), synthetic_frame(rng, "slap"), empty(), empty(), synthetic_frame(rng, "slap", period=6.0),
+                             empty(), empty(), synthetic_frame(rng, "thumbs"), empty(), empty()])
+
+def build_replay_file(path, empty_frames):
+    rng = np.random.default_rng(5)
+    frames = [synthetic_frame(rng, "empty") for _ in range(empty_frames)]
+    frames.append(synthetic_frame(rng, "partial"))
+    frames.append(synthetic_frame(rng, "slap"))
+    write_replay_file(path, frames)
+
+def random_template(rng, header):
+    body = FMR_TEMPLATE_SIZE - len(header)
+    return header + rng.getrandbits(8 * body).to_bytes(body, 'little')
+
+def make_user(name, templates):
+    return {"name": name, "id_number": name, "combined_template_base64": base64.b64encode(b"".join(templates)).decode()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--replay-file", help="file frame 1600x1500 uint8 berurutan (rekaman scanner)")
+    parser.add_argument("--empty-frames", type=int, default=6, help="frame platen kosong sebelum jari diletakkan")
+    parser.add_argument("--captures", type=int, default=3)
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--identifications", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--enrollments", type=int, default=2)
+    parser.add_argument("--processing-delay", type=float, default=0.0, help="detik tambahan per split & per template")
+    parser.add_argument("--frame-interval", type=float, default=0.0, help="detik per frame scanner (replay)")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    replay_path = args.replay_file
+    if not replay_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        replay_path = os.path.join(tmp_dir.name, "frames.raw")
+        build_replay_file(replay_path, args.empty_frames)
+
+    os.environ["FP_BACKEND"] = "replay"
+    os.environ["FP_REPLAY_PATH"] = replay_path
+    os.environ["FP_TEMPLATE_STORE"] = ""  # galeri sintetis tidak ditulis ke template store lokal
+    os.environ["FP_ENROLLMENT_UPLOAD"] = "0"  # tanpa server Node.js: enrollment tidak diupload/di-spill ke disk
+    # Direktori spill sesi enrollment sendiri, terpisah dari agent yang mungkin sedang berjalan
+    spill_dir = tempfile.TemporaryDirectory()
+    os.environ["FP_ENROLLMENT_SPILL"] = spill_dir.name
+    import local_agent as agent
+
+    events = []
+    agent.socketio.emit = lambda event, payload=None, **kwargs: events.append((event, payload))
+    agent.CAPTURE_DELAY_AFTER_QUALITY_MET = 0.0
+    agent.match_engine.workers = args.workers
+    device = agent.device_pool.default
+    delays = {"split": args.processing_delay, "create_template": args.processing_delay} if args.processing_delay else None
+    agent.backend.frame_interval = args.frame_interval
+    timing = TimingBackend(agent.backend, delays)
+    device.backend = timing
+    agent.match_engine.comparator._backend = timing
+    device.initialize_device()
+
+    # --- Capture + enrollment slap (split & template) ---
+    capture_times = []
+    for _ in range(args.captures):
+        events.clear()
+        started = time.perf_counter()
+        device._stream_and_capture_task(agent.CaptureType.RIGHT_FOUR, is_enrollment=True)
+        capture_times.append(time.perf_counter() - started)
+        result = next((p for e, p in events if e == 'capture_result'), None)
+        if not result or not result["success"]: sys.exit(f"Capture gagal: {result}")
+    probes = [device.enrollment_session.templates[f"fmr_{pos}"] for pos in device._get_finger_positions(agent.CaptureType.RIGHT_FOUR)]
+
+    print(f"backend=replay frames={len(agent.backend.frames)} captures={args.captures} workers={args.workers}")
+    report("capture (total)", capture_times)
+    report("get_raw_frame", timing.timings.get("get_raw_frame"))
+    report("finger_quality", timing.timings.get("finger_quality"))
+    report("split", timing.timings.get("split"))
+    report("create_template", timing.timings.get("create_template"))
+    print(f"frame gate               {device.frame_gate.stats}")
+
+    # --- Enrollment 4-4-2 terpipa (scheduler + pemrosesan latar belakang) ---
+    if args.enrollments:
+        enroll_path = os.path.join(tmp_dir.name if tmp_dir else tempfile.gettempdir(), "enrollment.raw")
+        build_enrollment_file(enroll_path)
+        enroll_timing = TimingBackend(ReplayBackend(enroll_path, frame_interval=args.frame_interval), delays)
+        device.backend = enroll_timing
+        agent.socketio.start_background_task(device.scheduler.run)
+        enroll_times = []
+        for _ in range(args.enrollments):
+            started = time.perf_counter()
+            job = device.scheduler.get(device.start_enrollment_sequence()["job_id"])
+            job.wait()
+            enroll_times.append(time.perf_counter() - started)
+            if job.state.value != "succeeded": sys.exit(f"Enrollment gagal: {job.to_dict()}")
+        processing = sum(enroll_timing.timings.get("split", [])) + sum(enroll_timing.timings.get("create_template", []))
+        report("enrollment 4-4-2", enroll_times)
+        print(f"  processing per enrollment (split+template): {processing / args.enrollments * 1000:.1f} ms, overlapped with capture")
+        device.scheduler.stop()
+        device.backend = timing
+
+    # --- Identifikasi 1:N pada beberapa ukuran galeri ---
+    rng = random.Random(11)
+    header = probes[0][:28]
+    for size in args.gallery_sizes:
+        users = [make_user(f"user{u}", [random_template(rng, header) for _ in range(10)]) for u in range(size - 1)]
+        # Kombinasi 10 jari berurutan enrollment: jari kanan berada di urutan 5..8
+        target = [random_template(rng, header) for _ in range(4)] + probes + [random_template(rng, header) for _ in range(2)]
+        users.insert(rng.randrange(size), make_user("target", target))
+        agent.gallery_cache.load_users(users)
+
+        samples = []
+        timing.timings["compare"] = []
+        device.identify_options["cache"] = False  # Probe yang sama diulang: ukur pemindaian, bukan cache hasil
+        for _ in range(args.identifications):
+            events.clear()
+            started = time.perf_counter()
+            device._perform_1_to_n_match(probes)
+            samples.append(time.perf_counter() - started)
+            result = next((p for e, p in events if e == 'identification_result'), None)
+            if not result or result.get("id_number") != "target": sys.exit(f"Identifikasi salah: {result}")
+        report(f"1:N users={size}", samples)
+        report("  compare", timing.timings["compare"])
+
+        device.identify_options["cache"] = True
+        retries = []
+        for attempt in range(2):
+            started = time.perf_counter()
+            device._perform_1_to_n_match(probes)
+            if attempt: retries.append(time.perf_counter() - started)
+        report("  retry (result cache)", retries)
+
+    agent.match_engine.shutdown()
+    if tmp_dir: tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
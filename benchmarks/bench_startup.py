@@ -0,0 +1,107 @@
+"""Benchmark cold start agent: waktu dari proses dijalankan sampai /api/health menjawab dan /api/ready bernilai 200.
+
+Agent dijalankan sebagai proses terpisah di atas ReplayBackend dengan template store berisi --users user
+sintetis (warm start galeri tanpa server Node.js). Dengan --max-ready-seconds skrip keluar dengan kode 1
+bila rata-rata cold start melebihi batas, sehingga bisa dipakai sebagai pemeriksaan regresi startup.
+
+--init-delay membuat LIVESCAN_Init replay memblokir selama N detik seperti driver scanner nyata. /api/health
+harus tetap menjawab selama inisialisasi perangkat berjalan; bila tidak (hub eventlet terblokir) skrip gagal.
+
+Contoh:
+    python benchmarks/bench_startup.py --runs 5 --users 5000
+    python benchmarks/bench_startup.py --max-ready-seconds 3
+    python benchmarks/bench_startup.py --init-delay 2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import build_replay_file
+from bench_store import make_user
+from gallery import GalleryCache
+from template_store import TemplateStore
+
+def poll(url, started, timeout, accept=(200,)):
+    """Detik sejak started sampai url menjawab dengan salah satu status accept, beserta isi jawabannya."""
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status in accept: return time.perf_counter() - started, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code in accept: return time.perf_counter() - started, json.loads(e.read())
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} tidak siap dalam {timeout} detik")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--users", type=int, default=2000, help="user di template store (10 jari per user)")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--init-delay", type=float, default=1.0, help="detik LIVESCAN_Init replay memblokir")
+    parser.add_argument("--max-ready-seconds", type=float, help="batas rata-rata cold start sampai ready (kode keluar 1 bila lewat)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store_dir = os.path.join(directory, "store")
+        cache = GalleryCache(None, store=TemplateStore(store_dir))
+        rng = random.Random(11)
+        cache.load_users([make_user(rng, i, 10) for i in range(args.users)])
+        replay_path = os.path.join(directory, "frames.raw")
+        build_replay_file(replay_path, 2)
+        env = dict(os.environ, FP_BACKEND="replay", FP_REPLAY_PATH=replay_path, FP_TEMPLATE_STORE=store_dir, FP_ENROLLMENT_UPLOAD="0",
+                   FP_ENROLLMENT_SPILL=os.path.join(directory, "spill"), FP_PORT=str(args.port), FP_REPLAY_INIT_DELAY=str(args.init_delay),
+                   PYTHONDONTWRITEBYTECODE="1")
+        base = f"http://127.0.0.1:{args.port}/api"
+
+        health_times, ready_times, during_init, steps = [], [], [], {}
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            agent = subprocess.Popen([sys.executable, os.path.join(ROOT, "local_agent.py")], env=env, cwd=directory,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                health_seconds, report = poll(f"{base}/health", started, args.timeout)
+                # Jawaban /api/health saat startup task sedang menginisialisasi perangkat (galeri sudah dipetakan)
+                answered = 0
+                while not report["ready"]:
+                    done = report["startup"]["steps"]
+                    answered += report["startup"]["state"] == "running" and "gallery_warm_start" in done and "device_init" not in done
+                    _, report = poll(f"{base}/health", started, args.timeout)
+                ready_seconds, _ = poll(f"{base}/ready", started, args.timeout)
+            finally:
+                agent.terminate()
+                agent.wait()
+            health_times.append(health_seconds)
+            ready_times.append(ready_seconds)
+            during_init.append(answered)
+            for name, step in report["startup"]["steps"].items(): steps.setdefault(name, []).append(step["seconds"])
+
+    average = lambda values: sum(values) / len(values)
+    print(f"runs={args.runs} users={args.users} templates={args.users * 10}")
+    print(f"process start -> /api/health up : avg {average(health_times):6.3f} s  max {max(health_times):6.3f} s")
+    print(f"process start -> /api/ready 200 : avg {average(ready_times):6.3f} s  max {max(ready_times):6.3f} s")
+    for name, values in steps.items(): print(f"  startup step {name:<20}: avg {average(values):6.3f} s")
+    print(f"/api/health answers during device init: {during_init}")
+    failed = False
+    if args.init_delay > 0 and min(during_init) == 0:
+        print("FAIL: /api/health did not answer while devices were initializing (hub blocked)")
+        failed = True
+    if args.max_ready_seconds is not None and average(ready_times) > args.max_ready_seconds:
+        print(f"FAIL: cold start {average(ready_times):.3f} s > {args.max_ready_seconds} s")
+        failed = True
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
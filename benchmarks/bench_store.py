@@ -0,0 +1,59 @@
+"""Benchmark warm start galeri: memetakan template store lokal vs decode respons /get-all-templates.
+
+Juga mengukur biaya commit delta kecil (fsync) yang dibayar setiap sinkronisasi.
+
+Contoh:
+    python benchmarks/bench_store.py --users 2000 20000
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import FMR_TEMPLATE_SIZE
+from gallery import GalleryCache
+from template_store import TemplateStore
+
+def make_user(rng, index, fingers):
+    combined = rng.getrandbits(8 * FMR_TEMPLATE_SIZE * fingers).to_bytes(FMR_TEMPLATE_SIZE * fingers, 'little')
+    return {"name": f"user{index}", "id_number": f"id{index}", "combined_template_base64": base64.b64encode(combined).decode()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--fingers", type=int, default=10)
+    parser.add_argument("--delta", type=int, default=5, help="user per commit delta")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    for size in args.users:
+        users = [make_user(rng, i, args.fingers) for i in range(size)]
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            cold = GalleryCache(None, store=TemplateStore(directory))
+            cold.load_users(users)
+            cold_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            # Jalur yang sama dengan sync() delta: indeks salinan + pertukaran referensi + commit store
+            with cold._write_lock:
+                cold._install(cold._build_index(users[:args.delta], []), cold.etag, cold.version)
+            commit_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            warm = GalleryCache(None, store=TemplateStore(directory))
+            snapshot = warm.snapshot()
+            warm_seconds = time.perf_counter() - started
+            if not snapshot.is_loaded or warm.get_status()["users"] != size: sys.exit("Warm start tidak memuat galeri")
+
+            print(f"users={size:<7} templates={snapshot.slot_count:<8} decode+persist={cold_seconds * 1000:9.1f} ms  "
+                  f"warm start={warm_seconds * 1000:8.1f} ms  commit delta({args.delta})={commit_seconds * 1000:7.1f} ms")
+            del cold, warm, snapshot
+
+if __name__ == "__main__":
+    main()
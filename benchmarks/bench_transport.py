@@ -0,0 +1,82 @@
+"""Benchmark transport: ukuran & latensi data enrollment dan galeri, JSON base64 vs msgpack (+PNG).
+
+Data enrollment sintetis: 3 slap 1600x1500, 10 gambar jari 256x360 dan 10 template 1 KB.
+Waktu encode = sisi agent, waktu decode = sisi klien (server Node.js / browser).
+
+Contoh:
+    python benchmarks/bench_transport.py --users 5000
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack
+import numpy as np
+
+from _synthetic import synthetic_frame
+from common import FMR_TEMPLATE_SIZE
+from transport import enrollment_json, iter_enrollment_msgpack, read_enrollment_stream
+
+RAW = (1600, 1500)
+SPLIT = (256, 360)
+
+def image_shape(raw):
+    return RAW if len(raw) == RAW[0] * RAW[1] else SPLIT
+
+def enrollment_data(rng):
+    slaps = {f"img_slap_{kind}": synthetic_frame(rng, "thumbs" if kind == "two_thumbs" else "slap", period=4.0 + i)
+             for i, kind in enumerate(["left_four", "right_four", "two_thumbs"])}
+    images = {key: frame.tobytes() for key, frame in slaps.items()}
+    fingers = [frame[400:400 + SPLIT[1], 200 + 300 * (i % 4):200 + 300 * (i % 4) + SPLIT[0]] for i, frame in enumerate(list(slaps.values()) * 4)][:10]
+    for i, finger in enumerate(fingers): images[f"img_finger_{i}"] = np.ascontiguousarray(finger).tobytes()
+    templates = {f"fmr_finger_{i}": rng.bytes(FMR_TEMPLATE_SIZE) for i in range(10)}
+    return templates, images
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def row(label, size, encode, decode):
+    print(f"{label:<26} {size / 1e6:9.2f} MB   encode {encode * 1000:8.1f} ms   decode {decode * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000, help="jumlah user galeri (10 template per user)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    templates, images = enrollment_data(np.random.default_rng(1))
+    print("-- /api/get_enrollment_data --")
+    body, enc = timed(lambda: json.dumps(enrollment_json(templates, images)).encode(), args.repeat)
+    _, dec = timed(lambda: {k: base64.b64decode(v) for k, v in json.loads(body)["images_base64"].items()}, args.repeat)
+    row("json + base64", len(body), enc, dec)
+    for image_format in ("raw", "png"):
+        chunks, enc = timed(lambda: list(iter_enrollment_msgpack(templates, images, image_shape, image_format)), args.repeat)
+        decoded, dec = timed(lambda: read_enrollment_stream(chunks), args.repeat)
+        assert decoded["images"] == images and decoded["templates"] == templates
+        row(f"msgpack stream ({image_format})", sum(len(c) for c in chunks), enc, dec)
+
+    print(f"-- /get-all-templates ({args.users} users) --")
+    rng = random.Random(2)
+    users = [{"name": f"user{u}", "id_number": str(u), "combined_template": rng.randbytes(10 * FMR_TEMPLATE_SIZE)} for u in range(args.users)]
+    json_users = [{"name": u["name"], "id_number": u["id_number"], "combined_template_base64": base64.b64encode(u["combined_template"]).decode()} for u in users]
+    body, enc = timed(lambda: json.dumps({"success": True, "data": json_users}).encode(), args.repeat)
+    _, dec = timed(lambda: [base64.b64decode(u["combined_template_base64"]) for u in json.loads(body)["data"]], args.repeat)
+    row("json + base64", len(body), enc, dec)
+    body, enc = timed(lambda: msgpack.packb({"success": True, "data": users}, use_bin_type=True), args.repeat)
+    _, dec = timed(lambda: msgpack.unpackb(body, raw=False), args.repeat)
+    row("msgpack (raw bytes)", len(body), enc, dec)
+
+if __name__ == "__main__":
+    main()
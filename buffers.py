@@ -0,0 +1,74 @@
+import ctypes
+import threading
+from contextlib import contextmanager
+
+# Penghitung global agar jumlah salinan terlihat di benchmark dan /api/status
+COPY_STATS = {"zero_copy": 0, "copied": 0}
+
+class BufferPool:
+    """Pool array ctypes.c_ubyte berukuran tetap yang dialokasikan sekali lalu dipakai ulang."""
+
+    def __init__(self, size, count=0, name="buffer"):
+        self.size = size
+        self.name = name
+        self._array_type = ctypes.c_ubyte * size
+        self._free = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+        for _ in range(count):
+            self._free.append(self._allocate())
+
+    def _allocate(self):
+        self.allocated += 1
+        return self._array_type()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            return self._allocate()
+
+    def release(self, buf):
+        if buf is None: return
+        if ctypes.sizeof(buf) != ctypes.sizeof(self._array_type):
+            raise ValueError(f"Ukuran buffer tidak cocok untuk pool {self.name}")
+        with self._lock:
+            self._free.append(buf)
+
+    @contextmanager
+    def borrow(self, count=1):
+        bufs = [self.acquire() for _ in range(count)]
+        try:
+            yield bufs[0] if count == 1 else bufs
+        finally:
+            for buf in bufs: self.release(buf)
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "allocated": self.allocated, "reused": self.reused, "free": len(self._free)}
+
+def as_ubyte_array(data, size=None, offset=0):
+    """Membungkus data sebagai array c_ubyte tanpa menyalin.
+
+    Objek writable (bytearray, memoryview writable, array ctypes, ndarray) dibungkus dengan
+    from_buffer. Objek read-only seperti bytes disalin sekali via from_buffer_copy (memcpy),
+    bukan dengan membongkar setiap byte sebagai argumen Python.
+    """
+    if size is None:
+        size = memoryview(data).nbytes - offset
+    array_type = ctypes.c_ubyte * size
+    if isinstance(data, array_type) and offset == 0:
+        COPY_STATS["zero_copy"] += 1
+        return data
+    try:
+        wrapped = array_type.from_buffer(data, offset)
+        COPY_STATS["zero_copy"] += 1
+        return wrapped
+    except TypeError:
+        COPY_STATS["copied"] += 1
+        return array_type.from_buffer_copy(data, offset)
+
+def copy_stats():
+    return dict(COPY_STATS)
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fmr import ENROLLMENT_FINGER_ORDER, ISO_FINGER_POSITIONS, THUMB_POSITIONS
+
+# Satu user di shortlist. finger_scores mengikuti urutan probe asli (0 = tidak dibandingkan);
+# fused_score adalah rata-rata jari yang benar-benar dibandingkan (fingers_compared).
+ShortlistEntry = namedtuple("ShortlistEntry", ["user_index", "stage1_score", "finger_scores", "fused_score", "best_score", "fingers_compared"])
+CascadeResult = namedtuple("CascadeResult", ["shortlist", "probe_order", "stage1_compares", "stage2_compares", "users", "survivors",
+                                             "stage1_seconds", "stage2_seconds"])
+_CascadeIndex = namedtuple("_CascadeIndex", ["generation", "slots", "positions", "owners"])
+
+# Kode posisi ISO per urutan jari di combined template (untuk slot tanpa posisi di header FMR)
+_ORDER_POSITIONS = np.array([ISO_FINGER_POSITIONS[key] for key in ENROLLMENT_FINGER_ORDER] + [0], dtype=np.uint8)
+
+def slap_positions(split_index, slap_size):
+    """Posisi ISO yang mungkin untuk jari ke-split_index (kiri ke kanan di gambar) dari sebuah slap.
+
+    Slap 4 jari berisi telunjuk..kelingking kanan (2..5) atau kelingking..telunjuk kiri (10..7),
+    sama seperti urutan hasil split saat enrollment. Untuk jumlah jari lain posisinya tidak diketahui.
+    """
+    if slap_size == 4: return (2 + split_index, 10 - split_index)
+    return None
+
+class CascadeMatcher:
+    """Identifikasi multi-jari bertingkat dengan penolakan dini.
+
+    Tahap 1: hanya probe dengan kualitas FPSPLIT terbaik yang dibandingkan, terhadap slot galeri yang
+    posisinya cocok. User dengan skor tahap 1 di bawah reject_score langsung dibuang. Tahap 2: probe
+    lainnya hanya dibandingkan dengan jari user yang tersisa (paling banyak max_survivors), lalu skor
+    per jari yang dibandingkan digabung (rata-rata). User dengan satu jari di atas match_score selalu
+    diurutkan di depan agar tidak terpotong dari shortlist oleh user yang sedang-sedang saja di semua jari.
+    """
+
+    def __init__(self, reject_score=20, max_survivors=64, shortlist_size=10, match_score=55):
+        self.reject_score = reject_score
+        self.match_score = match_score
+        self.max_survivors = max_survivors
+        self.shortlist_size = shortlist_size
+        self._index = None
+        self._lock = threading.Lock()
+        self.stats = {"identifications": 0, "compared": 0, "possible": 0, "users": 0, "rejected": 0}
+
+    def _ensure_index(self, gallery):
+        # Tanpa lock (dipanggil dari thread pekerja): pembangunan ganda hanya membuang kerja, hasilnya sama
+        index = self._index
+        if index is not None and index.generation == gallery.generation: return index
+        count = gallery.slot_count
+        live = np.asarray(gallery.live_slots, dtype=np.int64)
+        header_positions = np.frombuffer(gallery.slot_position[:count], dtype=np.uint8)[live]
+        fingers = np.frombuffer(gallery.slot_finger[:count], dtype=np.uint8)[live]
+        order_positions = _ORDER_POSITIONS[np.minimum(fingers, len(_ORDER_POSITIONS) - 1)]
+        positions = np.where(header_positions > 0, header_positions, order_positions)
+        owners = np.frombuffer(gallery.slot_owner[:count], dtype=np.int32)[live]
+        index = _CascadeIndex(gallery.generation, live, positions, owners)
+        self._index = index
+        return index
+
+    def _compatible(self, index, split_index, slap_size, user_mask=None):
+        keep = np.ones(len(index.slots), dtype=bool)
+        allowed = slap_positions(split_index, slap_size)
+        if allowed: keep &= np.isin(index.positions, allowed) | (index.positions == 0)
+        elif slap_size >= 3: keep &= ~np.isin(index.positions, THUMB_POSITIONS)  # Slap 3-4 jari tidak berisi jempol
+        if user_mask is not None: keep &= user_mask[index.owners]
+        return index.slots[keep], index.owners[keep]
+
+    def identify(self, engine, probes, fingers, slap_size, gallery):
+        """probes: template probe; fingers: (indeks split, kualitas FPSPLIT) per probe. Aman di thread pekerja."""
+        index = self._ensure_index(gallery)
+        user_count = len(gallery.users)
+        order = sorted(range(len(probes)), key=lambda i: (-fingers[i][1], i))
+
+        # --- Tahap 1: jari terbaik vs jari galeri berposisi cocok ---
+        started = time.perf_counter()
+        first = order[0]
+        slots, owners = self._compatible(index, fingers[first][0], slap_size)
+        scores = np.asarray(engine.score_all([probes[first]], gallery.buffer, [slots])[0], dtype=np.int32)
+        stage1 = np.full(user_count, -1, dtype=np.int32)
+        np.maximum.at(stage1, owners, scores)
+        compared_users = np.nonzero(stage1 >= 0)[0]
+        survivors = compared_users[stage1[compared_users] >= self.reject_score]
+        survivors = survivors[np.argsort(-stage1[survivors], kind='stable')][:self.max_survivors]
+        stage1_compares, stage1_seconds = len(slots), time.perf_counter() - started
+
+        # --- Tahap 2: probe lainnya hanya terhadap user yang lolos ---
+        started = time.perf_counter()
+        finger_scores = np.zeros((len(survivors), len(probes)), dtype=np.int32)
+        finger_scores[:, first] = stage1[survivors]
+        # Jari tanpa slot berposisi cocok di galeri user tidak dibandingkan dan tidak ikut dirata-rata
+        compared = np.zeros((len(survivors), len(probes)), dtype=bool)
+        compared[:, first] = True
+        stage2_compares = 0
+        rest = order[1:]
+        if len(survivors) and rest:
+            user_mask = np.zeros(user_count, dtype=bool)
+            user_mask[survivors] = True
+            candidates = [self._compatible(index, fingers[i][0], slap_size, user_mask) for i in rest]
+            rest_scores = engine.score_all([probes[i] for i in rest], gallery.buffer, [c[0] for c in candidates])
+            for probe_index, (rest_slots, rest_owners), probe_scores in zip(rest, candidates, rest_scores):
+                stage2_compares += len(rest_slots)
+                best = np.zeros(user_count, dtype=np.int32)
+                np.maximum.at(best, rest_owners, np.asarray(probe_scores, dtype=np.int32))
+                finger_scores[:, probe_index] = best[survivors]
+                has_finger = np.zeros(user_count, dtype=bool)
+                has_finger[rest_owners] = True
+                compared[:, probe_index] = has_finger[survivors]
+        stage2_seconds = time.perf_counter() - started
+
+        counts = compared.sum(axis=1)
+        fused = finger_scores.sum(axis=1) / np.maximum(counts, 1)
+        best_scores = finger_scores.max(axis=1) if len(probes) else np.zeros(len(survivors), dtype=np.int32)
+        ranking = np.lexsort((-best_scores, -fused, ~(best_scores > self.match_score)))[:self.shortlist_size]
+        shortlist = [ShortlistEntry(int(survivors[r]), int(finger_scores[r, first]), finger_scores[r].tolist(),
+                                    round(float(fused[r]), 2), int(best_scores[r]), int(counts[r])) for r in ranking]
+        return CascadeResult(shortlist, [fingers[i][0] for i in order], stage1_compares, stage2_compares,
+                             len(compared_users), len(survivors), stage1_seconds, stage2_seconds)
+
+    def record(self, result, possible):
+        with self._lock:
+            self.stats["identifications"] += 1
+            self.stats["compared"] += result.stage1_compares + result.stage2_compares
+            self.stats["possible"] += possible
+            self.stats["users"] += result.users
+            self.stats["rejected"] += result.users - result.survivors
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["compare_reduction"] = stats["possible"] / stats["compared"] if stats["compared"] else 0.0
+        stats["rejection_rate"] = stats["rejected"] / stats["users"] if stats["users"] else 0.0
+        return stats
@@ -0,0 +1,17 @@
+import time
+import traceback
+
+# Ukuran satu template ISO FMR yang dihasilkan ZAZ_FpStdLib
+FMR_TEMPLATE_SIZE = 1024
+
+def log_debug(message):
+    """Fungsi pembantu untuk logging debug"""
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[DEBUG][{timestamp}] {message}")
+
+def log_error(message, error=None):
+    """Fungsi pembantu untuk logging error"""
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[ERROR][{timestamp}] {message}")
+    if error:
+        print(traceback.format_exc())
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from common import FMR_TEMPLATE_SIZE, log_debug
+
+def load_template_dump(path):
+    """Membaca dump template berformat respons /get-all-templates ({"data": [...]} atau list user)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        payload = json.load(f)
+    users = payload.get('data') if isinstance(payload, dict) else payload
+    if not isinstance(users, list): raise ValueError(f"Format dump template tidak dikenal: {path}")
+    return users
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class DedupJob:
+    """Job deduplikasi N:N atas galeri: mencari orang yang terdaftar dengan dua ID berbeda.
+
+    Setiap baris (user i) dibandingkan dengan semua user j > i memakai MatchEngine.score_all.
+    blocking="position" hanya membandingkan jari pada posisi yang sama, blocking="all" semua
+    pasangan template. Progres disimpan ke checkpoint sehingga job bisa dilanjutkan setelah restart.
+    """
+
+    def __init__(self, gallery, engine, threshold=55, blocking="position", checkpoint_path=None, report_path=None,
+                 progress=None, run_in_thread=None, checkpoint_interval=5.0):
+        if blocking not in ("position", "all"): raise ValueError(f"Mode blocking tidak valid: {blocking}")
+        self.gallery = gallery
+        self.engine = engine
+        self.threshold = threshold
+        self.blocking = blocking
+        self.checkpoint_path = checkpoint_path
+        self.report_path = report_path
+        self.progress = progress or (lambda status: None)
+        self.run_in_thread = run_in_thread or (lambda fn, *args: fn(*args))
+        self.checkpoint_interval = checkpoint_interval
+        self.cancelled = False
+        self.state = "pending"
+        self._build_rows()
+        self.next_row = 0
+        self.compares = 0
+        self.edges = {}  # (id_a, id_b) -> skor tertinggi
+
+    def _build_rows(self):
+        # Tabel slot -> id_number dan nama dibekukan sekali di sini; job tidak membaca users/slot_owner galeri lagi
+        gallery = self.gallery
+        users = gallery.users
+        user_slots = {}
+        for slot in gallery.live_slots:
+            owner = gallery.slot_owner[slot]
+            if 0 <= owner < len(users) and users[owner] is not None: user_slots.setdefault(owner, []).append(slot)
+        self.rows = sorted(user_slots)
+        self.user_slots = user_slots
+        self.row_ids = tuple(users[u]['id_number'] for u in self.rows)
+        self.names = {users[u]['id_number']: users[u]['name'] for u in self.rows}
+        slot_ids = [None] * gallery.slot_count
+        for row, user in enumerate(self.rows):
+            for slot in user_slots[user]: slot_ids[slot] = self.row_ids[row]
+        self.slot_ids = tuple(slot_ids)
+
+        # Blok kandidat: per kunci posisi, slot diurutkan berdasarkan baris agar "user j > i"
+        # cukup diambil dengan satu pencarian biner
+        self.slot_key = {}
+        groups = {}
+        for row, user in enumerate(self.rows):
+            for slot in user_slots[user]:
+                key = self._block_key(slot)
+                self.slot_key[slot] = key
+                groups.setdefault(key, ([], []))
+                groups[key][0].append(row)
+                groups[key][1].append(slot)
+        self.blocks = {key: (np.asarray(rows, dtype=np.int64), np.asarray(slots, dtype=np.int64)) for key, (rows, slots) in groups.items()}
+        ids = "\n".join(str(id_number) for id_number in self.row_ids)
+        self.signature = hashlib.sha1(ids.encode('utf-8')).hexdigest()
+
+    def _block_key(self, slot):
+        if self.blocking == "all": return "all"
+        # Kode posisi ISO dari header, atau urutan jari di combined template bila tidak ada
+        position = self.gallery.slot_position[slot]
+        return ("iso", position) if position else ("order", self.gallery.slot_finger[slot])
+
+    # ---------------------------------------------
+    # Checkpoint
+    # ---------------------------------------------
+    def _config(self):
+        return {"signature": self.signature, "blocking": self.blocking, "threshold": self.threshold}
+
+    def resume(self):
+        """Melanjutkan dari checkpoint bila konfigurasi & isi galeri sama. True jika checkpoint dipakai."""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path): return False
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("config") != self._config():
+            log_debug("Dedup checkpoint ignored: gallery or settings changed.")
+            return False
+        self.next_row = checkpoint["next_row"]
+        self.compares = checkpoint.get("compares", 0)
+        self.edges = {(a, b): score for a, b, score in checkpoint["edges"]}
+        log_debug(f"Resuming dedup job at row {self.next_row}/{len(self.rows)}.")
+        return True
+
+    def _save_checkpoint(self):
+        if not self.checkpoint_path: return
+        _write_json_atomic(self.checkpoint_path, {
+            "config": self._config(),
+            "next_row": self.next_row,
+            "compares": self.compares,
+            "edges": [[a, b, score] for (a, b), score in self.edges.items()],
+        })
+
+    # ---------------------------------------------
+    # Eksekusi
+    # ---------------------------------------------
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        self.state = "running"
+        last_checkpoint = time.time()
+        total = len(self.rows)
+        while self.next_row < total:
+            if self.cancelled:
+                self.state = "cancelled"
+                self._save_checkpoint()
+                self.progress(self.get_status())
+                return None
+            self._process_row(self.next_row)
+            self.next_row += 1
+            if time.time() - last_checkpoint >= self.checkpoint_interval:
+                self._save_checkpoint()
+                last_checkpoint = time.time()
+            self.progress(self.get_status())
+
+        self._save_checkpoint()
+        report = self.build_report()
+        if self.report_path: _write_json_atomic(self.report_path, report)
+        self.state = "finished"
+        self.progress(self.get_status())
+        return report
+
+    def _process_row(self, row):
+        gallery = self.gallery
+        user = self.rows[row]
+        probe_slots = self.user_slots[user]
+        probes = [bytes(gallery.buffer[s * FMR_TEMPLATE_SIZE:(s + 1) * FMR_TEMPLATE_SIZE]) for s in probe_slots]
+        candidates = []
+        for slot in probe_slots:
+            rows, slots = self.blocks[self.slot_key[slot]]
+            candidates.append(slots[np.searchsorted(rows, row, side='right'):])
+        if not any(len(c) for c in candidates): return
+
+        scores = self.run_in_thread(self.engine.score_all, probes, gallery.buffer, candidates)
+        self.compares += sum(len(c) for c in candidates)
+        user_id = self.row_ids[row]
+        for slots, probe_scores in zip(candidates, scores):
+            for slot, score in zip(slots.tolist(), probe_scores):
+                if score <= self.threshold: continue
+                other_id = self.slot_ids[slot]
+                key = (user_id, other_id)
+                if score > self.edges.get(key, 0): self.edges[key] = score
+
+    # ---------------------------------------------
+    # Laporan
+    # ---------------------------------------------
+    def build_report(self):
+        """Mengelompokkan pasangan duplikat menjadi cluster (union-find)."""
+        parent = {}
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        for a, b in self.edges:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b: parent[root_b] = root_a
+
+        names = self.names
+        clusters = {}
+        for member in parent:
+            clusters.setdefault(find(member), []).append(member)
+        cluster_list = []
+        for members in clusters.values():
+            members = sorted(members, key=str)
+            member_set = set(members)
+            pairs = [{"a": a, "b": b, "score": score} for (a, b), score in self.edges.items() if a in member_set]
+            cluster_list.append({
+                "members": [{"id_number": m, "name": names.get(m)} for m in members],
+                "pairs": sorted(pairs, key=lambda p: -p["score"]),
+                "max_score": max(p["score"] for p in pairs),
+            })
+        cluster_list.sort(key=lambda c: -c["max_score"])
+        return {
+            "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "users": len(self.rows),
+            "blocking": self.blocking,
+            "threshold": self.threshold,
+            "compares": self.compares,
+            "duplicate_pairs": len(self.edges),
+            "clusters": cluster_list,
+        }
+
+    def get_status(self):
+        return {
+            "state": self.state,
+            "rows_done": self.next_row,
+            "rows_total": len(self.rows),
+            "compares": self.compares,
+            "duplicate_pairs": len(self.edges),
+        }
@@ -0,0 +1,195 @@
+import mmap
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from common import log_debug, log_error
+
+class EnrollmentSession:
+    """Data satu enrollment: template di memori, gambar mentah di memori sampai memory_budget byte.
+
+    Gambar yang melebihi anggaran (terutama slap 1600x1500 ~2,4 MB) ditambahkan ke satu file
+    sementara per sesi dan dibaca kembali lewat mmap saat diminta, sehingga memori resident
+    per sesi tetap terbatas berapa pun jumlah sesi yang sedang berjalan.
+    """
+
+    def __init__(self, session_id, device_id, spill_dir, memory_budget):
+        self.id = session_id
+        self.device_id = device_id
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.created = self.touched = time.time()
+        self.complete = False
+        self.active = False  # True selama job enrollment masih mengisi sesi: tidak dievict maupun kedaluwarsa
+        self.templates = {}
+        self._images = {}       # kunci -> bytes (di memori) atau (offset, panjang) di file spill
+        self._memory_bytes = 0
+        self._spill_file = None
+        self._spill_bytes = 0
+
+    def add_template(self, key, template):
+        self.templates[key] = template
+        self.touched = time.time()
+
+    def add_image(self, key, raw):
+        self.touched = time.time()
+        if raw is None: return
+        if key in self._images: self._discard(key)  # Slap yang diambil ulang menimpa gambar sebelumnya
+        if self._memory_bytes + len(raw) <= self.memory_budget or self.spill_dir is None:
+            self._images[key] = raw
+            self._memory_bytes += len(raw)
+            return
+        if self._spill_file is None:
+            self._spill_file = tempfile.NamedTemporaryFile(prefix=f"enroll-{self.id}-", suffix=".raw", dir=self.spill_dir, delete=False)
+        self._spill_file.seek(0, os.SEEK_END)
+        offset = self._spill_file.tell()
+        self._spill_file.write(raw)
+        self._spill_file.flush()
+        self._images[key] = (offset, len(raw))
+        self._spill_bytes += len(raw)
+
+    def _discard(self, key):
+        value = self._images.pop(key)
+        if isinstance(value, tuple): self._spill_bytes -= value[1]  # Ruang di file spill tidak dipakai ulang
+        else: self._memory_bytes -= len(value)
+
+    def read_image(self, key):
+        value = self._images[key]
+        if not isinstance(value, tuple): return value
+        offset, length = value
+        with mmap.mmap(self._spill_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[offset:offset + length]
+
+    @property
+    def images(self):
+        """Mapping baca-saja kunci -> bytes; gambar yang di-spill dibaca dari disk saat diakses."""
+        return _SessionImages(self)
+
+    @property
+    def image_count(self):
+        return len(self._images)
+
+    def close(self):
+        self._images.clear()
+        self.templates = {}
+        self._memory_bytes = self._spill_bytes = 0
+        if self._spill_file is None: return
+        path = self._spill_file.name
+        self._spill_file.close()
+        self._spill_file = None
+        try: os.remove(path)
+        except OSError as e: log_error(f"Could not remove enrollment spill file {path}: {e}")
+
+    def get_stats(self):
+        return {"id": self.id, "device_id": self.device_id, "complete": self.complete, "active": self.active, "templates": len(self.templates),
+                "images": len(self._images), "memory_bytes": self._memory_bytes, "spill_bytes": self._spill_bytes,
+                "age": round(time.time() - self.created, 1)}
+
+class _SessionImages(Mapping):
+    def __init__(self, session):
+        self._session = session
+
+    def __getitem__(self, key):
+        return self._session.read_image(key)
+
+    def __iter__(self):
+        return iter(list(self._session._images))
+
+    def __len__(self):
+        return len(self._session._images)
+
+class EnrollmentSessionStore:
+    """Sesi enrollment per ID: beberapa operator/perangkat tidak saling menimpa data.
+
+    Sesi dihapus setelah datanya diambil, saat enrollment gagal, atau bila tidak disentuh selama ttl
+    detik (sesi yang ditinggalkan). Bila jumlah sesi melebihi max_sessions, sesi tertua yang tidak
+    sedang diisi job enrollment dibuang.
+    """
+
+    def __init__(self, spill_dir=None, memory_budget=1 << 20, ttl=600.0, max_sessions=32):
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "fetched": 0, "discarded": 0, "expired": 0, "evicted": 0}
+        if spill_dir: os.makedirs(spill_dir, exist_ok=True)
+
+    def remove_stale_files(self):
+        """Menghapus file spill dari proses sebelumnya (crash). Hanya dipanggil saat startup agent: import modul
+        (benchmark, proses pekerja pencocokan) tidak boleh menghapus file milik agent yang sedang berjalan."""
+        if not self.spill_dir: return
+        for name in os.listdir(self.spill_dir):
+            if not name.startswith("enroll-"): continue
+            try: os.remove(os.path.join(self.spill_dir, name))
+            except OSError: pass
+
+    def create(self, device_id, session_id=None, active=False):
+        session = EnrollmentSession(session_id or uuid.uuid4().hex[:12], device_id, self.spill_dir, self.memory_budget)
+        session.active = active
+        self.expire()
+        with self._lock:
+            self._sessions[session.id] = session
+            self.stats["created"] += 1
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                # Enrollment yang sedang berjalan tidak dibuang; batas boleh terlampaui bila semuanya aktif
+                victim = next((s for s in self._sessions.values() if not s.active), None)
+                if victim is None: break
+                del self._sessions[victim.id]
+                evicted.append(victim)
+                self.stats["evicted"] += 1
+        for old in evicted:
+            log_error(f"Enrollment session limit reached, evicted session {old.id}.")
+            old.close()
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def latest(self, device_id, complete=True):
+        """Sesi terbaru milik perangkat (untuk klien lama tanpa session_id)."""
+        with self._lock:
+            return next((s for s in reversed(self._sessions.values()) if s.device_id == device_id and s.complete == complete), None)
+
+    def take(self, session_id):
+        """Mengeluarkan sesi dari store; pemanggil menutupnya setelah datanya terkirim."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None: self.stats["fetched"] += 1
+        return session
+
+    def discard(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None: self.stats["discarded"] += 1
+        if session is not None: session.close()
+
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if not s.active and now - s.touched > self.ttl]
+            for session in expired: del self._sessions[session.id]
+            self.stats["expired"] += len(expired)
+        for session in expired:
+            log_debug(f"Enrollment session {session.id} expired ({'complete' if session.complete else 'unfinished'}).")
+            session.close()
+        return len(expired)
+
+    def run(self, sleep, interval=30.0):
+        while True:
+            sleep(interval)
+            try: self.expire()
+            except Exception as e: log_error("Enrollment session expiry failed", e)
+
+    def get_stats(self):
+        with self._lock:
+            sessions = [s.get_stats() for s in self._sessions.values()]
+        return dict(self.stats, active=len(sessions), memory_bytes=sum(s["memory_bytes"] for s in sessions),
+                    spill_bytes=sum(s["spill_bytes"] for s in sessions), sessions=sessions)
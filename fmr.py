@@ -0,0 +1,29 @@
+import struct
+from collections import namedtuple
+
+# Field header ISO/IEC 19794-2 yang relevan untuk prefilter kandidat
+FmrHeader = namedtuple("FmrHeader", ["finger_position", "quality", "minutiae_count"])
+
+FMR_MAGIC = b"FMR\x00"
+_RECORD_HEADER_SIZE = 24
+_FINGER_VIEW_HEADER = struct.Struct(">BBBB")  # posisi, view/impression, kualitas, jumlah minutiae
+
+# Kode posisi jari ISO untuk kunci posisi yang dipakai alur enrollment
+ISO_FINGER_POSITIONS = {
+    "right_thumb": 1, "right_index": 2, "right_middle": 3, "right_ring": 4, "right_little": 5,
+    "left_thumb": 6, "left_index": 7, "left_middle": 8, "left_ring": 9, "left_little": 10,
+}
+THUMB_POSITIONS = (1, 6)
+# Urutan jari di combined template hasil enrollment 4-4-2 (slot_finger galeri -> kunci posisi)
+ENROLLMENT_FINGER_ORDER = ["left_index", "left_middle", "left_ring", "left_little", "right_index", "right_middle",
+                           "right_ring", "right_little", "right_thumb", "left_thumb"]
+
+EMPTY_HEADER = FmrHeader(0, 0, 0)
+
+def read_fmr_header(buf, offset=0):
+    """Membaca posisi jari, kualitas dan jumlah minutiae dari template FMR. EMPTY_HEADER jika bukan FMR."""
+    view = memoryview(buf)
+    if bytes(view[offset:offset + 4]) != FMR_MAGIC or len(view) < offset + _RECORD_HEADER_SIZE + _FINGER_VIEW_HEADER.size:
+        return EMPTY_HEADER
+    position, _, quality, minutiae_count = _FINGER_VIEW_HEADER.unpack_from(view, offset + _RECORD_HEADER_SIZE)
+    return FmrHeader(position, quality, minutiae_count)
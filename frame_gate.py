@@ -0,0 +1,91 @@
+from enum import Enum
+
+import numpy as np
+
+class FrameClass(Enum):
+    EMPTY = "empty"
+    PARTIAL = "partial"
+    CANDIDATE = "candidate"
+
+class FrameGate:
+    """Pra-seleksi frame murah (NumPy) sebelum MOSAIC_FingerQuality.
+
+    Frame di-downsample dengan stride lalu dibagi menjadi blok; blok dengan deviasi standar tinggi
+    berisi pola ridge. Rasio blok tersebut (foreground) menentukan kelas frame. Tidak bergantung
+    pada polaritas gambar karena yang diukur kontras lokal, bukan tingkat keabuan.
+
+    candidate_ratio berlaku untuk slap 4 jari; capture dengan jari lebih sedikit (jempol, identifikasi
+    satu jari) memakai ambang yang diskalakan dengan jumlah jari yang diharapkan.
+    """
+
+    def __init__(self, step=4, block=8, min_block_std=12.0, partial_ratio=0.02, candidate_ratio=0.08):
+        self.step = step
+        self.block = block
+        self.min_block_std = min_block_std
+        self.partial_ratio = partial_ratio
+        self.candidate_ratio = candidate_ratio
+        self.stats = {c.value: 0 for c in FrameClass}
+
+    def block_mask(self, frame):
+        """Mask 2D blok foreground; satu sel mewakili (step*block)^2 piksel frame asli."""
+        sample = frame[::self.step, ::self.step]
+        rows = sample.shape[0] // self.block * self.block
+        cols = sample.shape[1] // self.block * self.block
+        blocks = sample[:rows, :cols].reshape(rows // self.block, self.block, cols // self.block, self.block).astype(np.float32)
+        return blocks.std(axis=(1, 3)) > self.min_block_std
+
+    def foreground_ratio(self, frame):
+        mask = self.block_mask(frame)
+        return float(np.count_nonzero(mask)) / mask.size
+
+    def candidate_ratio_for(self, fingers):
+        return max(self.partial_ratio, self.candidate_ratio * min(fingers, 4) / 4)
+
+    def classify(self, frame, fingers=4):
+        return self.classify_ratio(frame, fingers)[0]
+
+    def classify_ratio(self, frame, fingers=4):
+        """Mengembalikan (kelas, rasio foreground); fingers adalah jumlah jari yang diharapkan di frame."""
+        ratio = self.foreground_ratio(frame)
+        if ratio < self.partial_ratio: frame_class = FrameClass.EMPTY
+        elif ratio < self.candidate_ratio_for(fingers): frame_class = FrameClass.PARTIAL
+        else: frame_class = FrameClass.CANDIDATE
+        self.stats[frame_class.value] += 1
+        return frame_class, ratio
+
+class FrameRing:
+    """N frame kandidat terakhir tanpa salinan: buffer capture ditukar dengan slot tertua.
+
+    Frame dengan kualitas terbaik tidak pernah dikeluarkan, sehingga best() selalu tersedia.
+    """
+
+    def __init__(self, capacity=4):
+        if capacity < 2: raise ValueError("Kapasitas FrameRing minimal 2")
+        self.capacity = capacity
+        self._entries = []  # [buffer, quality, seq]
+        self._seq = 0
+
+    def push(self, buffer, quality):
+        """Menyimpan buffer; mengembalikan buffer yang dikeluarkan (untuk dipakai ulang) atau None."""
+        self._seq += 1
+        evicted = None
+        if len(self._entries) >= self.capacity:
+            best = max(self._entries, key=lambda e: e[1])
+            victim = min((e for e in self._entries if e is not best), key=lambda e: e[2])
+            self._entries.remove(victim)
+            evicted = victim[0]
+        self._entries.append([buffer, quality, self._seq])
+        return evicted
+
+    def best(self):
+        if not self._entries: return None, 0
+        buffer, quality, _ = max(self._entries, key=lambda e: (e[1], e[2]))
+        return buffer, quality
+
+    def drain(self):
+        buffers = [e[0] for e in self._entries]
+        self._entries = []
+        return buffers
+
+    def __len__(self):
+        return len(self._entries)
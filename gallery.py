@@ -0,0 +1,295 @@
+import base64
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from common import FMR_TEMPLATE_SIZE, log_debug, log_error
+from fmr import read_fmr_header
+from metrics import METRICS
+from node_client import NodeClient
+from transport import binary_accept_header, decode_response
+
+# Snapshot galeri yang aman dibaca tanpa lock. Indeks slot & user tidak pernah diubah setelah dipasang
+# (copy-on-write, lihat _GalleryIndex); buffer tidak pernah di-resize di tempat dan slot yang sudah ada
+# tidak ditimpa, jadi pembaca lama tetap memegang data yang valid selama sinkronisasi berjalan.
+GallerySnapshot = namedtuple("GallerySnapshot", ["buffer", "slot_count", "slot_owner", "slot_finger", "slot_position", "slot_quality",
+                                                 "slot_minutiae", "users", "live_slots", "generation", "is_loaded"])
+
+class _GalleryIndex:
+    """Indeks slot & user satu versi galeri. Setelah dipasang di GalleryCache tidak diubah lagi: sinkronisasi
+    menyalin indeks aktif, mengubah salinannya di thread pekerja, lalu menukar referensinya di bawah lock."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.slot_count = 0
+        self.slot_owner = array('i')   # slot -> indeks user, -1 jika sudah dihapus
+        self.slot_finger = array('B')  # slot -> urutan jari di dalam combined template
+        # Field header FMR per slot untuk prefilter kandidat (lihat prefilter.py)
+        self.slot_position = array('B')
+        self.slot_quality = array('B')
+        self.slot_minutiae = array('B')
+        self.users = []                # indeks user -> {"name", "id_number"} atau None
+        self.user_index = {}           # id_number -> indeks user
+        self.user_slots = {}           # indeks user -> range slot (slot satu user selalu berurutan)
+        self.dead_slots = 0
+        self.live_slots = ()
+
+    def copy(self):
+        # Salinan array/list/dict dangkal (memcpy); dict user sendiri tidak pernah diubah, hanya diganti
+        new = _GalleryIndex(self.buffer)
+        new.slot_count, new.dead_slots = self.slot_count, self.dead_slots
+        new.slot_owner, new.slot_finger = self.slot_owner[:], self.slot_finger[:]
+        new.slot_position, new.slot_quality, new.slot_minutiae = self.slot_position[:], self.slot_quality[:], self.slot_minutiae[:]
+        new.users, new.user_index, new.user_slots = list(self.users), dict(self.user_index), dict(self.user_slots)
+        return new
+
+    def finish(self):
+        self.live_slots = tuple(i for i in range(self.slot_count) if self.slot_owner[i] >= 0)
+        return self
+
+class GalleryCache:
+    """Galeri template resident: template didekode sekali ke satu buffer kontigu + indeks user.
+
+    Perubahan (sinkronisasi, load_users) dibangun di luar lock, di run_in_thread, dan berjalan satu per satu
+    (_write_lock); hub eventlet hanya menukar referensi indeks. TemplateStore hanya disentuh oleh penulis itu.
+    """
+
+    def __init__(self, base_url, timeout=10, initial_capacity=1024, store=None, client=None, defer_warm_start=False, run_in_thread=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        # base_url None: galeri lokal saja (dump template, benchmark), tanpa sinkronisasi
+        self._client = client or (NodeClient(base_url, read_timeout=timeout) if base_url else None)
+        self._lock = threading.Lock()        # Melindungi referensi indeks aktif & metadata
+        self._write_lock = threading.Lock()  # Satu penulis pada satu waktu (dipegang di greenlet, bukan di thread pekerja)
+        self._store = store  # TemplateStore opsional: buffer galeri berupa mmap file di disk
+        # Decode, pembangunan indeks dan commit store berjalan di sini (mis. tpool.execute) agar tidak membekukan hub
+        self._run_in_thread = run_in_thread or (lambda fn, *args: fn(*args))
+        self.generation = 0
+        self.etag = None
+        self.version = None
+        self.last_sync = None
+        self.last_error = None  # Kesalahan sinkronisasi terakhir (diisi pemanggil sync), None bila berhasil
+        self.is_loaded = False
+        self._initial_capacity = initial_capacity
+        self._warmed = False
+        # Galeri kosong sampai warm_start() dipanggil (background task saat boot)
+        self._index = _GalleryIndex(bytearray(0))
+        if not defer_warm_start: self.warm_start()
+
+    def warm_start(self):
+        """Memetakan template store, atau menyiapkan galeri kosong. Idempoten; sync/load_users memanggilnya lebih dulu."""
+        with self._lock:
+            if not self._warmed:
+                if not (self._store and self._load_store()): self._index = _GalleryIndex(self._new_buffer(self._initial_capacity))
+                self._warmed = True
+            return self.is_loaded
+
+    def _new_buffer(self, capacity):
+        capacity = max(capacity, 1)
+        return self._store.begin_generation(capacity) if self._store else bytearray(capacity * FMR_TEMPLATE_SIZE)
+
+    def _load_store(self):
+        """Warm start: galeri dipetakan langsung dari template store tanpa decode maupun salinan."""
+        stored = self._store.load()
+        if stored is None: return False
+        index = _GalleryIndex(stored.buffer)
+        count = stored.slot_count
+        meta = stored.slot_meta
+        index.slot_finger = array('B', meta[0::4])
+        index.slot_position = array('B', meta[1::4])
+        index.slot_quality = array('B', meta[2::4])
+        index.slot_minutiae = array('B', meta[3::4])
+        index.slot_owner = array('i', [-1]) * count
+        live = 0
+        for id_number, name, start, n in stored.users:
+            user_idx = len(index.users)
+            index.users.append({"name": name, "id_number": id_number})
+            index.user_index[id_number] = user_idx
+            index.user_slots[user_idx] = range(start, start + n)
+            index.slot_owner[start:start + n] = array('i', [user_idx]) * n
+            live += n
+        index.slot_count = count
+        index.dead_slots = count - live
+        self._index = index.finish()
+        self.version = stored.version
+        self.etag = stored.etag
+        self.is_loaded = True
+        self.generation += 1
+        return True
+
+    # ---------------------------------------------
+    # Akses baca
+    # ---------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            index = self._index
+            return GallerySnapshot(memoryview(index.buffer), index.slot_count, index.slot_owner, index.slot_finger,
+                                   index.slot_position, index.slot_quality, index.slot_minutiae,
+                                   index.users, index.live_slots, self.generation, self.is_loaded)
+
+    def get_status(self):
+        with self._lock:
+            index = self._index
+            return {
+                "loaded": self.is_loaded,
+                "users": len(index.user_index),
+                "templates": index.slot_count - index.dead_slots,
+                "version": self.version,
+                "last_sync": self.last_sync,
+                "last_error": self.last_error,
+                "store": self._store.get_stats() if self._store else None,
+            }
+
+    # ---------------------------------------------
+    # Sinkronisasi dengan server Node.js
+    # ---------------------------------------------
+    def sync(self):
+        """Sinkronisasi inkremental. Mengembalikan True jika isi galeri berubah."""
+        self.warm_start()
+        with self._write_lock:
+            # msgpack dengan template mentah bila server mendukungnya; JSON base64 tetap diterima
+            headers = {'Accept': binary_accept_header()}
+            params = {}
+            if self.etag: headers['If-None-Match'] = self.etag
+            if self.version is not None and self.is_loaded: params['since'] = self.version
+
+            started = time.time()
+            with METRICS.time("fp_gallery_fetch_seconds"):
+                response = self._client.get("/get-all-templates", headers=headers, params=params)
+                if response.status_code == 304:
+                    self.last_sync = time.time()
+                    return False
+                response.raise_for_status()
+                payload = self._run_in_thread(decode_response, response.headers.get('Content-Type'), response.content)
+
+            if not payload or not payload.get('success'):
+                raise Exception("Respons galeri dari server Node.js tidak valid")
+
+            with METRICS.time("fp_gallery_decode_seconds"):
+                deleted = (payload.get('deleted') or []) if payload.get('delta') and self.is_loaded else None
+                index = self._run_in_thread(self._build_index, payload.get('data') or [], deleted)
+            self._install(index, response.headers.get('ETag'), payload.get('version'))
+        self.last_sync = time.time()
+        log_debug(f"Gallery synced in {time.time() - started:.3f}s: {self.get_status()}")
+        return True
+
+    def load_users(self, users):
+        """Memuat galeri penuh dari list user berformat /get-all-templates (mis. dump template tersimpan)."""
+        self.warm_start()
+        with self._write_lock:
+            self._install(self._run_in_thread(self._build_index, users, None), self.etag, self.version)
+
+    def _install(self, index, etag, version):
+        """Memasang indeks baru (satu pertukaran referensi), lalu commit ke template store di thread pekerja."""
+        with self._lock:
+            self._index = index
+            self.etag, self.version = etag, version
+            self.is_loaded = True
+            self.generation += 1
+        if self._store: self._run_in_thread(self._persist, index.slot_count, version, etag)
+
+    def _build_index(self, users, deleted_ids=None):
+        """Decode + indeks baru: galeri penuh bila deleted_ids None, selain itu delta atas salinan indeks aktif.
+        Tanpa lock (aman di thread pekerja): pemanggil memegang _write_lock sehingga tidak ada penulis lain."""
+        decoded = self._decode_users(users)
+        if deleted_ids is None:
+            index = _GalleryIndex(self._new_buffer(sum(len(chunks) for _, chunks in decoded)))
+        else:
+            index = self._index.copy()
+            for id_number in deleted_ids:
+                self._remove(index, id_number)
+        for user, chunks in decoded:
+            self._upsert(index, user, chunks)
+        if index.dead_slots > 1024 and index.dead_slots > index.slot_count // 2:
+            index = self._compacted(index)
+        return index.finish()
+
+    def _decode_users(self, users):
+        """(user, chunk template) per user; tanpa state bersama, aman di thread pekerja."""
+        return [(user, self._decode_user(user)) for user in users]
+
+    def _decode_user(self, user):
+        stored_bytes = user.get('combined_template')  # Respons msgpack: bytes mentah
+        if stored_bytes is None:
+            stored_b64 = user.get('combined_template_base64')
+            if not stored_b64: return []
+            stored_bytes = base64.b64decode(stored_b64)
+        chunks = []
+        for i in range(0, len(stored_bytes), FMR_TEMPLATE_SIZE):
+            chunk = stored_bytes[i:i + FMR_TEMPLATE_SIZE]
+            if len(chunk) != FMR_TEMPLATE_SIZE:
+                log_error(f"Incomplete stored template chunk found for user {user.get('id_number')} at offset {i}. Skipping this chunk.")
+                continue
+            chunks.append(chunk)
+        return chunks
+
+    # ---------------------------------------------
+    # Mutasi salinan indeks yang belum dipasang (hanya oleh pemegang _write_lock)
+    # ---------------------------------------------
+    def _upsert(self, index, user, chunks):
+        id_number = user.get('id_number')
+        user_idx = index.user_index.get(id_number)
+        if user_idx is None:
+            user_idx = len(index.users)
+            index.users.append(None)
+            index.user_index[id_number] = user_idx
+        else:
+            self._release_slots(index, user_idx)
+        index.users[user_idx] = {"name": user.get('name'), "id_number": id_number}
+
+        self._ensure_capacity(index, index.slot_count + len(chunks))
+        first_slot = index.slot_count
+        slot_meta = bytearray()
+        for finger_idx, chunk in enumerate(chunks):
+            offset = index.slot_count * FMR_TEMPLATE_SIZE
+            index.buffer[offset:offset + FMR_TEMPLATE_SIZE] = chunk
+            header = read_fmr_header(chunk)
+            index.slot_owner.append(user_idx)
+            index.slot_finger.append(finger_idx)
+            index.slot_position.append(header.finger_position)
+            index.slot_quality.append(header.quality)
+            index.slot_minutiae.append(header.minutiae_count)
+            slot_meta += bytes((finger_idx, header.finger_position, header.quality, header.minutiae_count))
+            index.slot_count += 1
+        index.user_slots[user_idx] = range(first_slot, index.slot_count)
+        if self._store: self._store.record_put(id_number, user.get('name'), first_slot, bytes(slot_meta))
+
+    def _remove(self, index, id_number):
+        user_idx = index.user_index.pop(id_number, None)
+        if user_idx is None: return
+        self._release_slots(index, user_idx)
+        index.users[user_idx] = None
+        if self._store: self._store.record_delete(id_number)
+
+    def _release_slots(self, index, user_idx):
+        for slot in index.user_slots.pop(user_idx, []):
+            index.slot_owner[slot] = -1
+            index.dead_slots += 1
+
+    def _ensure_capacity(self, index, slot_count):
+        # Slot baru ditulis di belakang slot_count snapshot yang ada; buffer yang lebih besar selalu objek baru
+        needed = slot_count * FMR_TEMPLATE_SIZE
+        if needed <= len(index.buffer): return
+        if self._store:
+            index.buffer = self._store.grow(slot_count)
+            return
+        new_buffer = bytearray(max(needed, len(index.buffer) * 2))
+        used = index.slot_count * FMR_TEMPLATE_SIZE
+        new_buffer[:used] = index.buffer[:used]
+        index.buffer = new_buffer
+
+    def _compacted(self, index):
+        log_debug(f"Compacting gallery: {index.dead_slots} dead slot(s) of {index.slot_count}.")
+        compacted = _GalleryIndex(self._new_buffer(index.slot_count - index.dead_slots))
+        for old_idx, user in enumerate(index.users):
+            if user is None: continue
+            chunks = [bytes(index.buffer[slot * FMR_TEMPLATE_SIZE:(slot + 1) * FMR_TEMPLATE_SIZE]) for slot in index.user_slots.get(old_idx, [])]
+            self._upsert(compacted, user, chunks)
+        return compacted
+
+    def _persist(self, slot_count, version, etag):
+        try:
+            self._store.commit(slot_count, version, etag)
+        except Exception as e:
+            log_error("Failed to persist gallery to the local template store", e)
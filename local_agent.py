@@ -1,24 +1,49 @@
-import ctypes
+# Menggunakan eventlet untuk performa WebSocket yang lebih baik
+# Pastikan untuk menginstal: pip install eventlet
+# monkey_patch harus mendahului semua import lain: lock yang sudah dibuat modul lain (numpy, flask, ...)
+# tidak ikut di-green-kan, dan eventlet harus menelusuri semua objek di heap untuk mencarinya (lambat)
 import os
+# Server Node.js ada di localhost: resolver DNS hijau eventlet (dnspython, ~0,2 detik import) tidak dibutuhkan
+os.environ.setdefault("EVENTLET_NO_GREENDNS", "yes")
+import eventlet
+eventlet.monkey_patch()
+from eventlet import tpool
+
+import ctypes
+import functools
+import json
+import random
 import sys
+import tempfile
 import time
 import threading
-import traceback
+from collections import OrderedDict, deque, namedtuple
 from enum import Enum
-import cv2
 import numpy as np
-import base64
-from flask import Flask, jsonify, request
-# Menggunakan eventlet untuk performa WebSocket yang lebih baik
-# Pastikan untuk menginstal: pip install eventlet
-import eventlet
-eventlet.monkey_patch()
-import requests
+from flask import Flask, Response, jsonify, request
 
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 # --- TAMBAHAN: Impor sqlite3 ---
 import sqlite3
 # -----------------------------
+from common import FMR_TEMPLATE_SIZE, log_debug, log_error
+from gallery import GalleryCache
+from template_store import TemplateStore
+from node_client import NodeClient, UploadQueue
+from enrollment_sessions import EnrollmentSessionStore
+from matcher import Comparator, MatchEngine
+from buffers import BufferPool, as_ubyte_array, copy_stats
+from fmr import read_fmr_header
+from prefilter import PrefilterIndex
+from cascade import CascadeMatcher
+from result_cache import ResultCache, ScoreCache
+from preview import PreviewPublisher
+from frame_gate import FrameClass, FrameGate, FrameRing
+from dedup import DedupJob, load_template_dump
+from backends import FPSPLIT_INFO, create_backend
+from metrics import METRICS, Trace
+from scheduler import JobScheduler, QueueFull
+from transport import MSGPACK_MIMETYPE, enrollment_json, iter_enrollment_msgpack, prefers_msgpack
 
 # =============================================
 # DEFINISI & KONFIGURASI
@@ -30,7 +55,55 @@ CAPTURE_DELAY_AFTER_QUALITY_MET = 2.0  # Detik
 # --- TAMBAHAN: Definisikan path database secara global ---
 NODE_SERVER_API_URL = 'http://localhost:3000/api'
 # ----------------------------------------------------
-FMR_TEMPLATE_SIZE = 1024 
+GALLERY_SYNC_INTERVAL = 30  # Detik
+# --- Klien server Node.js: koneksi keep-alive, timeout & retry GET dengan backoff ---
+NODE_CONNECT_TIMEOUT = 3.0
+NODE_READ_TIMEOUT = 10.0
+NODE_RETRIES = 3
+# --- Upload enrollment per slap ke Node.js di latar belakang. Nonaktif secara default sampai server Node.js
+#     menyediakan endpoint ENROLLMENT_UPLOAD_PATH; FP_ENROLLMENT_UPLOAD=1 mengaktifkan ---
+ENROLLMENT_UPLOAD_ENABLED = os.environ.get("FP_ENROLLMENT_UPLOAD", "0") == "1"
+ENROLLMENT_UPLOAD_PATH = "/enrollment-upload"
+UPLOAD_SPILL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_spool')
+UPLOAD_MEMORY_LIMIT = 64 << 20  # Byte antrean di memori sebelum upload ditulis ke UPLOAD_SPILL_DIR
+UPLOAD_SPILL_LIMIT = 1 << 30
+RAW_IMAGE_WIDTH, RAW_IMAGE_HEIGHT = 1600, 1500
+SPLIT_IMAGE_WIDTH, SPLIT_IMAGE_HEIGHT = 256, 360
+FRAME_RING_SIZE = 4  # Jumlah frame kandidat terakhir yang disimpan selama pengambilan
+# --- Mesin pencocokan 1:N: "thread" (default, DLL melepas GIL) atau "process" ---
+MATCH_EXECUTOR = "thread"
+MATCH_WORKERS = 4
+MATCH_SHARD_SIZE = 256
+# --- Mode identifikasi: "first" (kecocokan pertama > 55), "topk" (K kandidat terbaik + prefilter)
+#     atau "cascade" (jari berkualitas terbaik dulu, user lain ditolak dini, skor gabungan multi-jari) ---
+IDENTIFY_MODE = "first"
+IDENTIFY_TOP_K = 5
+PREFILTER_AUDIT_RATE = 0.05  # Porsi identifikasi top-K yang diaudit dengan pemindaian penuh
+CASCADE_REJECT_SCORE = 20  # Skor tahap 1 minimum agar user dibandingkan dengan jari lainnya
+CASCADE_MAX_SURVIVORS = 64
+CASCADE_SHORTLIST_SIZE = 10
+# --- Cache hasil identifikasi: percobaan ulang dengan jari yang sama tidak memindai galeri lagi ---
+RESULT_CACHE_SIZE = 256
+NEAR_DUPLICATE_WINDOW = 60.0  # Detik; probe lebih lama tidak dianggap capture ulang
+NEAR_DUPLICATE_SCORE = 80  # Skor 1:1 minimum antara probe baru & lama (threshold kecocokan 55)
+# --- Job deduplikasi N:N: checkpoint & laporan cluster duplikat ---
+DEDUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dedup')
+DEDUP_PROGRESS_INTERVAL = 0.5  # Detik antar event dedup_progress
+# --- Template store lokal (mmap) untuk warm start galeri; FP_TEMPLATE_STORE="" menonaktifkan ---
+TEMPLATE_STORE_DIR = os.environ.get("FP_TEMPLATE_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template_store'))
+# --- Penjadwal job: identifikasi yang datang saat perangkat sibuk masuk antrean ---
+IDENTIFY_QUEUE_LIMIT = 8
+PLATEN_CLEAR_TIMEOUT = 4.0  # Detik maksimum menunggu jari diangkat di antara langkah enrollment
+ENROLLMENT_MAX_ATTEMPTS = 3  # Pengambilan per slap sebelum enrollment dinyatakan gagal
+# --- Sesi enrollment: gambar mentah di atas anggaran memori per sesi ditulis ke file sementara ---
+ENROLLMENT_SPILL_DIR = os.environ.get("FP_ENROLLMENT_SPILL", os.path.join(tempfile.gettempdir(), 'fp_enrollment'))
+ENROLLMENT_SESSION_MEMORY = 1 << 20  # Byte gambar per sesi yang boleh tetap di memori
+ENROLLMENT_SESSION_TTL = 600.0  # Detik tanpa aktivitas sebelum sesi (selesai maupun ditinggalkan) dihapus
+ENROLLMENT_MAX_SESSIONS = 32
+# --- Startup: warm start galeri & inisialisasi perangkat berjalan di latar belakang setelah server HTTP hidup ---
+AUTO_INIT = os.environ.get("FP_AUTO_INIT", "1") != "0"  # FP_AUTO_INIT=0: perangkat diinisialisasi manual lewat /api/init
+AGENT_HOST = os.environ.get("FP_HOST", "127.0.0.1")
+AGENT_PORT = int(os.environ.get("FP_PORT", "5000"))
 
 class CaptureType(Enum):
     LEFT_FOUR = "left_four"
@@ -40,123 +113,178 @@ class CaptureType(Enum):
     IDENTIFY = "identify_any"
     # --------------------------------------------------
 
-def log_debug(message):
-    """Fungsi pembantu untuk logging debug"""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[DEBUG][{timestamp}] {message}")
+# Jumlah jari yang diharapkan per capture (ambang CANDIDATE frame_gate); identifikasi menerima satu jari apa pun
+EXPECTED_FINGERS = {CaptureType.LEFT_FOUR: 4, CaptureType.RIGHT_FOUR: 4, CaptureType.TWO_THUMBS: 2, CaptureType.IDENTIFY: 1}
+
+# Hasil tahap split & template (dihitung di thread pekerja, diterapkan di greenlet)
+# qualities: kualitas FPSPLIT per posisi, dipakai mode cascade untuk memilih jari yang dibandingkan lebih dulu
+SlapResult = namedtuple("SlapResult", ["ret", "finger_num", "templates", "images", "slap_image", "timings", "qualities"])
 
-def log_error(message, error=None):
-    """Fungsi pembantu untuk logging error"""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[ERROR][{timestamp}] {message}")
-    if error:
-        print(traceback.format_exc())
+# Langkah enrollment 4-4-2: (step, tipe capture, instruksi, instruksi setelah langkah sebelumnya berhasil)
+ENROLLMENT_STEPS = [
+    (1, CaptureType.LEFT_FOUR, "Letakkan 4 Jari Kiri Anda...", None),
+    (2, CaptureType.RIGHT_FOUR, "Sekarang, letakkan 4 Jari Kanan Anda...", "Berhasil! Angkat jari Anda sebelum jari kanan..."),
+    (3, CaptureType.TWO_THUMBS, "Terakhir, letakkan 2 Jempol Anda...", "Berhasil! Angkat jari Anda sebelum jempol..."),
+]
 
 # =============================================
-# PEMUATAN DLL & DEFINISI STRUKTUR
+# PEMUATAN BACKEND (DLL ATAU REPLAY)
 # =============================================
-try:
-    log_debug("Starting DLL loading process...")
-    
-    dll_path = os.path.dirname(os.path.abspath(__file__))
-    zaz_dll_path = os.path.join(dll_path, 'ZAZ_FpStdLib.dll')
-    gals_dll_path = os.path.join(dll_path, 'GALSXXYY.dll')
-    gamc_dll_path = os.path.join(dll_path, 'Gamc.dll')
-    fpsplit_dll_path = os.path.join(dll_path, 'FpSplit.dll')
-    imagecut_dll_path = os.path.join(dll_path, 'imagecut.dll')
-
-    zaz_dll = ctypes.WinDLL(zaz_dll_path)
-    gals_dll = ctypes.WinDLL(gals_dll_path)
-    gamc_dll = ctypes.WinDLL(gamc_dll_path)
-    fpsplit_dll = ctypes.WinDLL(fpsplit_dll_path)
-    imagecut_dll = ctypes.WinDLL(imagecut_dll_path)
-    
-    log_debug("Configuring DLL function argument types...")
-    gals_dll.LIVESCAN_GetFPRawData.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte)]
-    gamc_dll.MOSAIC_FingerQuality.argtypes = [ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int]
-    zaz_dll.ZAZ_FpStdLib_CreateISOTemplate.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte)]
-    zaz_dll.ZAZ_FpStdLib_CompareTemplates.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte)]
-    imagecut_dll.imagecut.argtypes = [ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int, ctypes.c_int]
-    
-    log_debug("DLL loading and configuration completed successfully")
+# FP_BACKEND=replay memutar ulang frame rekaman (FP_REPLAY_PATH) tanpa Windows/DLL/scanner
+FP_BACKEND = os.environ.get("FP_BACKEND", "dll")
+FP_REPLAY_PATH = os.environ.get("FP_REPLAY_PATH")
+# Channel scanner yang dipakai, satu worker per channel (mis. FP_CHANNELS=0,1,2)
+FP_CHANNELS = [int(c) for c in os.environ.get("FP_CHANNELS", "0").split(",") if c.strip()] or [0]
 
+try:
+    backend = create_backend(FP_BACKEND, dll_dir=os.path.dirname(os.path.abspath(__file__)), replay_path=FP_REPLAY_PATH,
+                             **({"width": RAW_IMAGE_WIDTH, "height": RAW_IMAGE_HEIGHT, "init_delay": float(os.environ.get("FP_REPLAY_INIT_DELAY", "0"))}
+                                if FP_BACKEND == "replay" else {}))
 except Exception as e:
     log_error("CRITICAL ERROR LOADING DLLs. Pastikan semua DLL ada dan Anda menggunakan interpreter Python 32-bit.", e)
     sys.exit(1)
 
-class FPSPLIT_INFO(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [("x", ctypes.c_int), ("y", ctypes.c_int), ("top", ctypes.c_int), ("left", ctypes.c_int), ("angle", ctypes.c_int), ("quality", ctypes.c_int), ("pOutBuf", ctypes.POINTER(ctypes.c_ubyte))]
-
-fpsplit_dll.FPSPLIT_DoSplit.argtypes = [ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(FPSPLIT_INFO)]
-
 # =============================================
 # KELAS PERANGKAT SIDIK JARI
 # =============================================
 class FingerprintDevice:
-    def __init__(self):
-        log_debug("Initializing FingerprintDevice...")
+    """Satu scanner (channel LIVESCAN) dengan state, buffer, ambang kualitas dan antrean job sendiri."""
+
+    def __init__(self, pool, channel=0):
+        self.pool = pool
+        self.backend = pool.backend
+        self.channel = channel
+        self.device_id = str(channel)
+        self.room = f"device:{self.device_id}"  # Room socket.io untuk event perangkat ini
+        log_debug(f"Initializing FingerprintDevice {self.device_id} (channel {channel})...")
         self.device_handle = None
         self.is_initialized = False
+        self.init_error = None  # Pesan kegagalan inisialisasi terakhir (untuk /api/health)
         self.quality_threshold = 40
         self.capture_timeout = 15
         self.fog_removal = False
-        self.is_capturing = False
         self.capture_lock = threading.Lock()
+        # Tahap pemrosesan (FPSPLIT + ZAZ) berjalan satu per satu walau capture berikutnya sudah dimulai
+        self.processing_lock = threading.Lock()
+        # Capture, enrollment dan identifikasi berjalan sebagai job berurutan (scanner dipakai eksklusif)
+        self.scheduler = JobScheduler(on_update=lambda job: self.emit('job_update', job.to_dict()),
+                                      queue_limits={"identify": IDENTIFY_QUEUE_LIMIT})
         self.template1 = None
         self.template2 = None
-        self.enrollment_data = {}
-        self._clear_enrollment_data()
+        self.identify_options = {"mode": IDENTIFY_MODE, "k": IDENTIFY_TOP_K, "cache": True}
+        self._result_cache_entry = None  # (kunci, probe, parameter, generasi galeri) identifikasi yang sedang berjalan
+        self.trace = None  # Trace identifikasi yang sedang berjalan (opsional, dilampirkan ke identification_result)
+        self.enrollment_session = None  # EnrollmentSession yang sedang diisi oleh slap enrollment
+        # --- Buffer ctypes yang dialokasikan sekali dan dipakai ulang di seluruh pipeline ---
+        # +2: buffer capture aktif dan satu slap yang masih diproses di latar belakang
+        self.frame_pool = BufferPool(RAW_IMAGE_WIDTH * RAW_IMAGE_HEIGHT, count=FRAME_RING_SIZE + 2, name="frame")
+        # Frame kosong/parsial ditolak oleh frame_gate sebelum mencapai MOSAIC_FingerQuality
+        self.frame_gate = FrameGate()
+        self.split_pool = BufferPool(SPLIT_IMAGE_WIDTH * SPLIT_IMAGE_HEIGHT, count=10, name="split")
+        self.template_pool = BufferPool(FMR_TEMPLATE_SIZE, count=4, name="template")
+        self.preview = PreviewPublisher(self._emit_preview, run_in_thread=tpool.execute)
+
+    def emit(self, event, payload):
+        """Event perangkat dikirim ke room-nya, dengan device_id agar klien multi-scanner bisa membedakan."""
+        payload["device_id"] = self.device_id
+        socketio.emit(event, payload, to=self.room)
+
+    def _emit_preview(self, event, payload, **kwargs):
+        payload["device_id"] = self.device_id
+        socketio.emit(event, payload, **kwargs)
 
-    def _clear_enrollment_data(self):
-        log_debug("Clearing previous enrollment data.")
-        self.enrollment_data = {"templates": {}, "images": {}}
-    
     def get_status(self):
-        return {"initialized": self.is_initialized, "status": "ready" if self.is_initialized else "not initialized", "templates": {"template1": bool(self.template1), "template2": bool(self.template2)}}
+        return {"device_id": self.device_id, "channel": self.channel, "initialized": self.is_initialized, "status": "ready" if self.is_initialized else "not initialized", "templates": {"template1": bool(self.template1), "template2": bool(self.template2)}, "gallery": gallery_cache.get_status(), "buffers": self.get_buffer_stats(), "prefilter": prefilter_index.get_stats(), "cascade": cascade_matcher.get_stats(), "result_cache": result_cache.get_stats(), "uploads": upload_queue.get_stats() if upload_queue else None, "enrollment_sessions": enrollment_sessions.get_stats(), "preview": self.preview.get_stats(), "jobs": self.scheduler.get_status()}
+
+    def get_buffer_stats(self):
+        return {"frame": self.frame_pool.stats(), "split": self.split_pool.stats(), "template": self.template_pool.stats(), "copies": copy_stats(), "frame_gate": dict(self.frame_gate.stats)}
 
     def initialize_device(self):
         log_debug("Starting device initialization...")
         with self.capture_lock:
             try:
-                if gals_dll.LIVESCAN_Init() != 1: raise Exception("Inisialisasi Perangkat Keras Gagal")
-                if gamc_dll.MOSAIC_Init() != 1: raise Exception("Algoritma Mosaic Gagal")
-                self.device_handle = zaz_dll.ZAZ_FpStdLib_OpenDevice()
+                self.pool.initialize_backend()
+                # Handle algoritma per perangkat: pembuatan template berjalan paralel antar scanner
+                self.device_handle = tpool.execute(self.backend.open_algorithm)
                 if self.device_handle == 0: raise Exception("Inisialisasi Algoritma Gagal")
                 self.is_initialized = True
+                self.init_error = None
                 return {"success": True, "message": "Semua sistem berhasil diinisialisasi"}
             except Exception as e:
                 log_error("Initialization crashed", e)
                 self.is_initialized = False
+                self.init_error = str(e)
                 return {"success": False, "message": str(e)}
 
     def _stream_and_capture_task(self, capture_type, is_enrollment, template_no=None):
-        w, h = 1600, 1500
+        job = self.scheduler.current
+        try:
+            best_image, best_quality = self._capture_best_frame(capture_type)
+            if job is not None and job.cancelled: return False
+            if best_image is None:
+                log_error("No valid image could be captured.")
+                self.emit('capture_result', {'success': False, 'message': 'Gagal mengambil gambar.'})
+                return False
+            try:
+                return self._process_captured_image(best_image, RAW_IMAGE_WIDTH, RAW_IMAGE_HEIGHT, best_quality, capture_type, is_enrollment, template_no)
+            finally:
+                self.frame_pool.release(best_image)
+
+        except Exception as e:
+            log_error("Error during capture task", e)
+            self.emit('capture_result', {'success': False, 'message': 'Terjadi kesalahan saat pengambilan.'})
+            return False
+
+    def _capture_best_frame(self, capture_type):
+        """Streaming sampai kualitas terpenuhi. Mengembalikan (buffer, kualitas) frame terbaik atau (None, 0);
+        buffer menjadi milik pemanggil dan harus dikembalikan ke frame_pool."""
+        w, h = RAW_IMAGE_WIDTH, RAW_IMAGE_HEIGHT
         start_time = time.time()
-        best_quality = 0
-        best_image = None
         quality_met_time = None
+        # Frame kandidat disimpan di ring tanpa salinan; buffer capture ditukar dengan slot tertua
+        candidate_frames = FrameRing(FRAME_RING_SIZE)
+        fingers = EXPECTED_FINGERS.get(capture_type, 4)
+        # Frame parsial terluas, dinilai bila tidak ada frame kandidat sampai batas waktu
+        partial_frame, partial_ratio = None, 0.0
+        data = self.frame_pool.acquire()
+        frames_read = 0
+        completed = False
+        
+        job = self.scheduler.current
         
         log_debug(f"Starting stream & capture for type {capture_type.value}")
 
         try:
             while time.time() - start_time < self.capture_timeout:
-                if not self.is_capturing:
+                if job is not None and job.cancelled:
                     log_debug("Capture task was cancelled externally.")
                     break
 
-                data = (ctypes.c_ubyte * (w * h))()
-                if gals_dll.LIVESCAN_GetFPRawData(0, data) == 1:
+                # Di thread OS: selama DLL memblokir, scanner lain tetap membaca frame
+                with METRICS.time("fp_frame_read_seconds"):
+                    frame_ok = tpool.execute(self.backend.get_raw_frame, self.channel, data)
+                if not frame_ok:
+                    METRICS.get("fp_frames_dropped_total").inc(reason="read_failed", device=self.device_id)
+                else:
+                    frames_read += 1
                     np_image = np.ctypeslib.as_array(data).reshape((h, w))
-                    small_preview = cv2.resize(np_image, (400, 375))
-                    _, buffer = cv2.imencode('.jpg', small_preview)
-                    jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-                    socketio.emit('live_preview', {'image_data': 'data:image/jpeg;base64,' + jpg_as_text})
-
-                    quality = gamc_dll.MOSAIC_FingerQuality(data, w, h)
-                    if quality > best_quality:
-                        best_quality = quality
-                        best_image = bytes(data)
+                    # Preview hanya menyimpan frame terbaru; encode & kirim dilakukan oleh self.preview
+                    self.preview.submit(np_image)
+
+                    frame_class, ratio = self.frame_gate.classify_ratio(np_image, fingers)
+                    if frame_class is not FrameClass.CANDIDATE:
+                        METRICS.get("fp_frames_dropped_total").inc(reason=f"gate_{frame_class.value}", device=self.device_id)
+                        if frame_class is FrameClass.PARTIAL and ratio > partial_ratio:
+                            # Ditukar tanpa salinan, sama seperti ring kandidat
+                            partial_ratio = ratio
+                            partial_frame, data = data, partial_frame if partial_frame is not None else self.frame_pool.acquire()
+                        socketio.sleep(0)
+                        continue
+
+                    with METRICS.time("fp_quality_seconds"):
+                        quality = tpool.execute(self.backend.finger_quality, data, w, h)
+                    recycled = candidate_frames.push(data, quality)
+                    data = recycled if recycled is not None else self.frame_pool.acquire()
                     
                     if quality > self.quality_threshold and quality_met_time is None:
                         log_debug(f"Quality threshold met. Starting {CAPTURE_DELAY_AFTER_QUALITY_MET}s delay.")
@@ -166,23 +294,47 @@ class FingerprintDevice:
                         log_debug("Final capture delay passed.")
                         break
                 
-                socketio.sleep(0.1)
+                # Hanya memberi giliran ke greenlet lain; laju mengikuti scanner
+                socketio.sleep(0)
 
-            log_debug("Streaming loop finished.")
-            
-            if best_image:
-                self._process_captured_image(best_image, w, h, best_quality, capture_type, is_enrollment, template_no)
-            else:
-                log_error("No valid image could be captured.")
-                socketio.emit('capture_result', {'success': False, 'message': 'Gagal mengambil gambar.'})
+            if not len(candidate_frames) and partial_frame is not None and not (job is not None and job.cancelled):
+                log_debug(f"No candidate frame before timeout; scoring best partial frame (foreground {partial_ratio:.3f}).")
+                with METRICS.time("fp_quality_seconds"):
+                    quality = tpool.execute(self.backend.finger_quality, partial_frame, w, h)
+                candidate_frames.push(partial_frame, quality)
+                partial_frame = None
 
-        except Exception as e:
-            log_error("Error during capture task", e)
-            socketio.emit('capture_result', {'success': False, 'message': 'Terjadi kesalahan saat pengambilan.'})
+            elapsed = time.time() - start_time
+            log_debug(f"Streaming loop finished: {frames_read} frame(s) in {elapsed:.2f}s.")
+            METRICS.get("fp_frames_total").inc(frames_read, device=self.device_id)
+            if elapsed > 0: METRICS.get("fp_capture_fps").observe(frames_read / elapsed)
+            if self.trace is not None: self.trace.add("capture", elapsed, frames=frames_read, candidates=len(candidate_frames))
+            completed = not (job is not None and job.cancelled)
         finally:
-            if not is_enrollment:
-                self.is_capturing = False
-                log_debug("Capture flag set to False for manual capture/identification.")
+            self.frame_pool.release(data)
+            self.frame_pool.release(partial_frame)
+            best_image, best_quality = candidate_frames.best()
+            keep = best_image if completed and best_quality > 0 else None
+            for buf in candidate_frames.drain():
+                if buf is not keep: self.frame_pool.release(buf)
+        return keep, best_quality if keep is not None else 0
+
+    def _wait_for_platen_clear(self, timeout=PLATEN_CLEAR_TIMEOUT):
+        """Menunggu jari diangkat (frame kosong menurut frame_gate), pengganti jeda tetap antar langkah."""
+        job = self.scheduler.current
+        started = time.time()
+        with self.frame_pool.borrow() as data:
+            while time.time() - started < timeout:
+                if job is not None and job.cancelled: return False
+                if tpool.execute(self.backend.get_raw_frame, self.channel, data):
+                    np_image = np.ctypeslib.as_array(data).reshape((RAW_IMAGE_HEIGHT, RAW_IMAGE_WIDTH))
+                    self.preview.submit(np_image)
+                    if self.frame_gate.classify(np_image) is FrameClass.EMPTY:
+                        log_debug(f"Platen cleared after {time.time() - started:.2f}s.")
+                        return True
+                socketio.sleep(0)
+        log_debug("Platen not cleared before timeout; continuing.")
+        return True
 
     def _get_finger_positions(self, capture_type):
         if capture_type == CaptureType.LEFT_FOUR: return ["left_index", "left_middle", "left_ring", "left_little"]
@@ -191,290 +343,921 @@ class FingerprintDevice:
         if capture_type == CaptureType.IDENTIFY: return ["finger1", "finger2", "finger3", "finger4"]
         return []
 
-    def _process_captured_image(self, image_bytes, w, h, quality, capture_type, is_enrollment, template_no=None):
+    def _process_captured_image(self, image_buffer, w, h, quality, capture_type, is_enrollment, template_no=None):
         log_debug(f"Processing image for {capture_type.value} with quality {quality}")
-        
-        finger_num_ptr = ctypes.c_int(0)
+        with self.processing_lock, self.split_pool.borrow(10) as split_buffers, self.template_pool.borrow() as template:
+            # Split & template di thread OS; hasilnya diterapkan kembali di greenlet ini
+            result = tpool.execute(self._split_and_create_templates, image_buffer, w, h, capture_type, is_enrollment, split_buffers, template)
+        return self._apply_slap_result(result, capture_type, is_enrollment, template_no)
+
+    def _split_and_create_templates(self, image_buffer, w, h, capture_type, keep_images, split_buffers, template):
+        """Tahap komputasi murni (aman di thread pekerja): tidak meng-emit dan tidak mengubah state perangkat."""
+        timings = []
         info_array = (FPSPLIT_INFO * 10)()
-        split_buffers = [(ctypes.c_ubyte * (256 * 360))() for _ in range(10)]
         for i, buf in enumerate(split_buffers): info_array[i].pOutBuf = ctypes.cast(buf, ctypes.POINTER(ctypes.c_ubyte))
 
-        img_buffer_full = (ctypes.c_ubyte * len(image_bytes))(*image_bytes)
-        ret = fpsplit_dll.FPSPLIT_DoSplit(img_buffer_full, w, h, 1, 256, 360, ctypes.byref(finger_num_ptr), info_array)
-        finger_num = finger_num_ptr.value
-        
-        if ret != 0:
-            log_error(f"Fingerprint split failed. Code: {ret}")
-            socketio.emit('capture_result', {"success": False, "message": "Segmentasi sidik jari gagal."})
-            return
-
-        if capture_type != CaptureType.IDENTIFY:
-            finger_positions = self._get_finger_positions(capture_type)
-            if len(finger_positions) != finger_num:
-                socketio.emit('capture_result', {"success": False, "message": "Jumlah jari yang terdeteksi tidak cocok."})
-                return
-
-        if is_enrollment:
-            slap_key = f"img_slap_{capture_type.value}"
-            self.enrollment_data["images"][slap_key] = image_bytes
+        img_buffer_full = as_ubyte_array(image_buffer, w * h)
+        started = time.perf_counter()
+        ret, finger_num = self.backend.split(img_buffer_full, w, h, SPLIT_IMAGE_WIDTH, SPLIT_IMAGE_HEIGHT, info_array)
+        timings.append(("fp_split_seconds", "split", time.perf_counter() - started))
+        if ret != 0: return SlapResult(ret, finger_num, {}, {}, None, timings, {})
+        # Jumlah jari yang salah divalidasi di _apply_slap_result; template tidak perlu dibuat
+        if capture_type != CaptureType.IDENTIFY and finger_num != len(self._get_finger_positions(capture_type)):
+            return SlapResult(ret, finger_num, {}, {}, None, timings, {})
 
-        templates = []
+        # Satu-satunya salinan: buffer frame akan dipakai ulang oleh pengambilan berikutnya
+        slap_image = bytes(img_buffer_full) if keep_images else None
+        templates, images, qualities = {}, {}, {}
         for i in range(finger_num):
             position_key = self._get_finger_positions(capture_type)[i] if capture_type != CaptureType.IDENTIFY else f"probe_{i+1}"
             
             p_out_buf = info_array[i].pOutBuf
-            img_data_bytes = ctypes.string_at(p_out_buf, 256 * 360)
-            
-            if is_enrollment:
-                self.enrollment_data["images"][f"img_{position_key}"] = img_data_bytes
+            # View tanpa salinan ke buffer hasil split
+            img_buffer_single = ctypes.cast(p_out_buf, ctypes.POINTER(ctypes.c_ubyte * (SPLIT_IMAGE_WIDTH * SPLIT_IMAGE_HEIGHT))).contents
+            if keep_images: images[position_key] = bytes(img_buffer_single)
             
-            img_buffer_single = (ctypes.c_ubyte * len(img_data_bytes))(*img_data_bytes)
-            template = (ctypes.c_ubyte * 1024)()
-            if zaz_dll.ZAZ_FpStdLib_CreateISOTemplate(self.device_handle, img_buffer_single, template) != 0:
-                template_bytes = bytes(template)
-                templates.append(template_bytes)
-                if is_enrollment:
-                    self.enrollment_data["templates"][f"fmr_{position_key}"] = template_bytes
-
-        if not templates:
+            ctypes.memset(template, 0, FMR_TEMPLATE_SIZE)
+            started = time.perf_counter()
+            created = self.backend.create_template(self.device_handle, img_buffer_single, template)
+            timings.append(("fp_template_seconds", f"template_{position_key}", time.perf_counter() - started))
+            if created != 0:
+                templates[position_key] = bytes(template)
+                qualities[position_key] = info_array[i].quality
+        return SlapResult(ret, finger_num, templates, images, slap_image, timings, qualities)
+
+    def _apply_slap_result(self, result, capture_type, is_enrollment, template_no):
+        """Validasi & penerapan hasil split di greenlet: metrik, jumlah jari, urutan tangan kiri, emit."""
+        for metric, stage, seconds in result.timings:
+            METRICS.get(metric).observe(seconds)
+            if self.trace is not None: self.trace.add(stage, seconds)
+
+        if result.ret != 0:
+            log_error(f"Fingerprint split failed. Code: {result.ret}")
+            METRICS.get("fp_split_failures_total").inc(reason="split_error")
+            self.emit('capture_result', {"success": False, "message": "Segmentasi sidik jari gagal."})
+            return False
+
+        if capture_type != CaptureType.IDENTIFY:
+            finger_positions = self._get_finger_positions(capture_type)
+            if len(finger_positions) != result.finger_num:
+                METRICS.get("fp_split_failures_total").inc(reason="finger_count")
+                self.emit('capture_result', {"success": False, "message": "Jumlah jari yang terdeteksi tidak cocok."})
+                return False
+
+        if not result.templates:
             log_error("No valid templates were created from split images.")
-            socketio.emit('capture_result', {"success": False, "message": "Tidak dapat membuat template dari gambar."})
-            return
-            
+            self.emit('capture_result', {"success": False, "message": "Tidak dapat membuat template dari gambar."})
+            return False
+
+        templates, images = result.templates, result.images
         if capture_type == CaptureType.LEFT_FOUR and is_enrollment:
             log_debug("Reversing template and image order for left hand enrollment.")
             original_positions = self._get_finger_positions(capture_type)
-            reversed_positions = list(reversed(original_positions))
-            
-            # Buat salinan untuk menghindari masalah saat iterasi dan modifikasi
-            current_templates = self.enrollment_data["templates"].copy()
-            current_images = self.enrollment_data["images"].copy()
-            
-            for i in range(len(original_positions)):
-                original_pos_key = original_positions[i]
-                source_pos_key = reversed_positions[i]
-                
-                # Update FMR
-                self.enrollment_data["templates"][f"fmr_{original_pos_key}"] = current_templates[f"fmr_{source_pos_key}"]
-                # Update Gambar Jari
-                self.enrollment_data["images"][f"img_{original_pos_key}"] = current_images[f"img_{source_pos_key}"]
-            log_debug(f"Reversal complete. Final template keys for left hand: {list(self.enrollment_data['templates'].keys())}")
+            source_positions = dict(zip(original_positions, reversed(original_positions)))
+            templates = {pos: templates[src] for pos, src in source_positions.items() if src in templates}
+            images = {pos: images[src] for pos, src in source_positions.items() if src in images}
+            log_debug(f"Reversal complete. Final template keys for left hand: {['fmr_' + pos for pos in templates]}")
+
+        if is_enrollment:
+            # Capture enrollment di luar alur 4-4-2 tetap mendapat sesinya sendiri
+            if self.enrollment_session is None: self.enrollment_session = enrollment_sessions.create(self.device_id)
+            session = self.enrollment_session
+            session.add_image(f"img_slap_{capture_type.value}", result.slap_image)
+            for pos, image in images.items(): session.add_image(f"img_{pos}", image)
+            for pos, template in templates.items(): session.add_template(f"fmr_{pos}", template)
+            if upload_queue is not None: self._upload_slap(session, capture_type, templates, images, result.slap_image)
 
         if capture_type == CaptureType.IDENTIFY:
-            self._perform_1_to_n_match(templates)
-            return
+            # (indeks split, kualitas) per probe: urutan jari di slap menentukan posisi yang mungkin
+            probe_fingers = [(int(key.split("_")[1]) - 1, result.qualities.get(key, 0)) for key in templates]
+            self._perform_1_to_n_match(list(templates.values()), probe_fingers, result.finger_num)
+            # Pencocokan yang gagal (galeri belum dimuat, error) menandai job identifikasi gagal
+            job = self.scheduler.current
+            return job is None or job.error is None
 
         if not is_enrollment:
-            combined_templates = b"".join(templates)
+            combined_templates = b"".join(templates.values())
             if template_no == 1: self.template1 = combined_templates
             else: self.template2 = combined_templates
 
-        socketio.emit('capture_result', {"success": True, "message": f"Pengambilan {capture_type.name} berhasil.", "template_no": template_no})
+        self.emit('capture_result', {"success": True, "message": f"Pengambilan {capture_type.name} berhasil.", "template_no": template_no})
+        return True
 
     def create_template_manual(self, template_no, capture_type_str):
-        with self.capture_lock:
-            if not self.is_initialized: return {"success": False, "message": "Perangkat belum diinisialisasi."}
-            if self.is_capturing: return {"success": False, "message": "Proses lain sedang berjalan."}
-            try: capture_type = CaptureType(capture_type_str)
-            except ValueError: return {"success": False, "message": f"Tipe pengambilan tidak valid: {capture_type_str}"}
-            self.is_capturing = True
-        
-        socketio.start_background_task(self._stream_and_capture_task, capture_type, is_enrollment=False, template_no=template_no)
-        return {"success": True, "message": "Proses pengambilan manual dimulai..."}
+        if not self.is_initialized: return {"success": False, "message": "Perangkat belum diinisialisasi."}
+        try: capture_type = CaptureType(capture_type_str)
+        except ValueError: return {"success": False, "message": f"Tipe pengambilan tidak valid: {capture_type_str}"}
+        try: job = self.scheduler.submit("capture", self._capture_job, capture_type, template_no, exclusive=True)
+        except QueueFull as e: return {"success": False, "message": str(e)}
+        return {"success": True, "message": "Proses pengambilan manual dimulai...", "job_id": job.id}
+
+    def _capture_job(self, job, capture_type, template_no):
+        return self._stream_and_capture_task(capture_type, is_enrollment=False, template_no=template_no)
 
     def start_enrollment_sequence(self):
-        with self.capture_lock:
-            if not self.is_initialized: return {"success": False, "message": "Perangkat belum diinisialisasi."}
-            if self.is_capturing: return {"success": False, "message": "Proses lain sedang berjalan."}
-            self._clear_enrollment_data()
-        
-        socketio.start_background_task(self._enrollment_flow)
-        return {"success": True, "message": "Proses enrollment dimulai..."}
+        if not self.is_initialized: return {"success": False, "message": "Perangkat belum diinisialisasi."}
+        try: job = self.scheduler.submit("enroll", self._enrollment_flow, exclusive=True)
+        except QueueFull as e: return {"success": False, "message": str(e)}
+        return {"success": True, "message": "Proses enrollment dimulai...", "job_id": job.id}
 
-    def _enrollment_flow(self):
+    def _enrollment_flow(self, job):
+        """Enrollment 4-4-2 terpipa: frame terbaik tiap slap diproses di latar belakang sementara slap
+        berikutnya diambil. Slap yang gagal validasi diambil ulang tanpa mengulang slap lainnya."""
+        session = self.enrollment_session = enrollment_sessions.create(self.device_id, job.id, active=True)
+        pending = deque(ENROLLMENT_STEPS)
+        in_flight = []
+        attempts = {}
+        first = True
         try:
-            self.is_capturing = True
-            socketio.emit('enrollment_step', {"step": 1, "message": "Letakkan 4 Jari Kiri Anda..."})
-            self._stream_and_capture_task(CaptureType.LEFT_FOUR, is_enrollment=True)
-            while self.is_capturing: socketio.sleep(0.5)
-
-            self.is_capturing = True
-            socketio.emit('enrollment_step', {"step": 2, "message": "Berhasil! Jeda 4 detik sebelum jari kanan..."})
-            socketio.sleep(4)
-            socketio.emit('enrollment_step', {"step": 2, "message": "Sekarang, letakkan 4 Jari Kanan Anda..."})
-            self._stream_and_capture_task(CaptureType.RIGHT_FOUR, is_enrollment=True)
-            while self.is_capturing: socketio.sleep(0.5)
-
-            self.is_capturing = True
-            socketio.emit('enrollment_step', {"step": 3, "message": "Berhasil! Jeda 4 detik sebelum jempol..."})
-            socketio.sleep(4)
-            socketio.emit('enrollment_step', {"step": 3, "message": "Terakhir, letakkan 2 Jempol Anda..."})
-            self._stream_and_capture_task(CaptureType.TWO_THUMBS, is_enrollment=True)
-            while self.is_capturing: socketio.sleep(0.5)
-            
-            socketio.emit('enrollment_step', {"step": "finished", "message": "Semua sidik jari berhasil diambil!"})
+            while pending or in_flight:
+                # Hasil yang sudah selesai diperiksa sebelum capture berikutnya; tunggu hanya bila tidak ada slap tersisa
+                for item in list(in_flight):
+                    if pending and not item["done"].is_set(): continue
+                    item["done"].wait()
+                    in_flight.remove(item)
+                    if item["ok"]: continue
+                    step = item["step"]
+                    attempts[step[0]] = attempts.get(step[0], 1) + 1
+                    if attempts[step[0]] > ENROLLMENT_MAX_ATTEMPTS:
+                        log_error(f"Enrollment step {step[0]} failed {ENROLLMENT_MAX_ATTEMPTS} time(s); aborting.")
+                        return False
+                    log_debug(f"Re-capturing enrollment step {step[0]} ({step[1].value}), attempt {attempts[step[0]]}.")
+                    pending.appendleft(step)
+                if not pending: continue
+
+                step = pending.popleft()
+                number, capture_type, prompt, next_prompt = step
+                retry = attempts.get(number, 1) > 1
+                if not first:
+                    if next_prompt and not retry: self.emit('enrollment_step', {"step": number, "message": next_prompt})
+                    if not self._wait_for_platen_clear(): return False
+                first = False
+                self.emit('enrollment_step', {"step": number, "message": f"Ulangi: {prompt}" if retry else prompt, "retry": retry})
+
+                frame, quality = self._capture_best_frame(capture_type)
+                if job.cancelled:
+                    self.frame_pool.release(frame)
+                    return False
+                if frame is None:
+                    self.emit('capture_result', {'success': False, 'message': 'Gagal mengambil gambar.'})
+                    return False
+                in_flight.append(self._process_slap_in_background(step, frame, quality))
+
+            session.complete = True
+            uploading = self._upload_enrollment_complete(session)
+            self.emit('enrollment_step', {"step": "finished", "message": "Semua sidik jari berhasil diambil!",
+                                          "enrollment_id": session.id, "uploading": uploading})
+            return True
 
         except Exception as e:
             log_error("Enrollment flow failed", e)
-            socketio.emit('capture_result', {"success": False, "message": "Alur enrollment gagal."})
+            self.emit('capture_result', {"success": False, "message": "Alur enrollment gagal."})
+            return False
         finally:
-            self.is_capturing = False
-            log_debug("Enrollment flow finished. Capture flag set to False.")
+            # Jangan biarkan pemrosesan latar belakang menulis ke sesi setelah job selesai
+            for item in in_flight: item["done"].wait()
+            self.enrollment_session = None
+            session.active = False
+            # Data enrollment yang gagal/dibatalkan tidak pernah diambil: langsung dibuang
+            if not session.complete: enrollment_sessions.discard(session.id)
+
+    def _process_slap_in_background(self, step, frame, quality):
+        item = {"step": step, "done": threading.Event(), "ok": False}
+        def work():
+            try: item["ok"] = self._process_captured_image(frame, RAW_IMAGE_WIDTH, RAW_IMAGE_HEIGHT, quality, step[1], True)
+            except Exception as e:
+                log_error(f"Background processing of {step[1].value} failed", e)
+                self.emit('capture_result', {"success": False, "message": "Terjadi kesalahan saat pemrosesan."})
+            finally:
+                self.frame_pool.release(frame)
+                item["done"].set()
+        socketio.start_background_task(work)
+        return item
+
+    def _upload_slap(self, session, capture_type, templates, images, slap_image):
+        """Mengantrekan template & gambar satu slap untuk Node.js; browser tidak perlu menarik semuanya di akhir."""
+        images = dict({f"img_{pos}": image for pos, image in images.items()}, **{f"img_slap_{capture_type.value}": slap_image})
+        payload = {
+            "enrollment_id": session.id, "device_id": self.device_id, "part": capture_type.value,
+            "templates": {f"fmr_{pos}": template for pos, template in templates.items()},
+            "images": {key: dict(zip(("width", "height"), _image_shape(raw)), data=raw) for key, raw in images.items() if raw},
+        }
+        size = sum(len(t) for t in templates.values()) + sum(len(i) for i in images.values() if i)
+        upload_queue.put(f"{session.id}:{capture_type.value}", ENROLLMENT_UPLOAD_PATH, payload, size)
+
+    def _upload_enrollment_complete(self, session):
+        if upload_queue is None: return False
+        parts = [step[1].value for step in ENROLLMENT_STEPS]
+        upload_queue.put(f"{session.id}:complete", ENROLLMENT_UPLOAD_PATH,
+                         {"enrollment_id": session.id, "device_id": self.device_id, "part": "complete", "parts": parts}, 0)
+        return True
 
     def match_templates(self):
         log_debug("Starting manual template matching...")
         if not self.template1 or not self.template2:
             return {"success": False, "message": "Satu atau kedua template manual tidak ada."}
         try:
-            t1_buf = (ctypes.c_ubyte * len(self.template1))(*self.template1)
-            t2_buf = (ctypes.c_ubyte * len(self.template2))(*self.template2)
-            score = zaz_dll.ZAZ_FpStdLib_CompareTemplates(self.device_handle, t1_buf, t2_buf)
+            # Pasangan yang sama (berdasarkan hash konten) tidak dibandingkan ulang
+            score, cached = score_cache.get_or_compute(self.template1, self.template2, self._compare_pair)
             matched = score >= 45
-            log_debug(f"Manual match result: score={score}, matched={matched}")
-            return {"success": True, "score": score, "matched": matched}
+            log_debug(f"Manual match result: score={score}, matched={matched}, cached={cached}")
+            return {"success": True, "score": score, "matched": matched, "cached": cached}
         except Exception as e:
             log_error("Manual matching failed", e)
             return {"success": False, "message": f"Pencocokan manual gagal: {str(e)}"}
             
+    def _compare_pair(self, template1, template2):
+        return self.backend.compare(self.device_handle, as_ubyte_array(template1), as_ubyte_array(template2))
+
     # --- TAMBAHAN: Logika baru untuk identifikasi 1:N ---
-    def start_identification(self):
-        """Memulai proses identifikasi 1:N."""
-        with self.capture_lock:
-            if not self.is_initialized: return {"success": False, "message": "Perangkat belum diinisialisasi."}
-            if self.is_capturing: return {"success": False, "message": "Proses lain sedang berjalan."}
-            self.is_capturing = True
-        
-        socketio.emit('identification_step', {"message": "Letakkan jari apapun untuk identifikasi..."})
-        socketio.start_background_task(self._stream_and_capture_task, CaptureType.IDENTIFY, is_enrollment=False)
-        return {"success": True, "message": "Proses identifikasi dimulai..."}
+    def start_identification(self, options=None):
+        """Memulai proses identifikasi 1:N; bila perangkat sibuk, permintaan masuk antrean."""
+        options = options or {}
+        mode = options.get("mode", IDENTIFY_MODE)
+        if mode not in ("first", "topk", "cascade"): return {"success": False, "message": f"Mode identifikasi tidak valid: {mode}"}
+        if not self.is_initialized: return {"success": False, "message": "Perangkat belum diinisialisasi."}
+        job_options = {"mode": mode, "k": max(1, int(options.get("k", IDENTIFY_TOP_K))), "trace": bool(options.get("trace")),
+                       "cache": bool(options.get("cache", True))}
+        queued = self.scheduler.busy
+        try: job = self.scheduler.submit("identify", self._identify_job, options=job_options)
+        except QueueFull as e: return {"success": False, "message": str(e)}
+        message = "Identifikasi masuk antrean..." if queued else "Proses identifikasi dimulai..."
+        return {"success": True, "message": message, "job_id": job.id, "queued": queued}
+
+    def _identify_job(self, job):
+        self.identify_options = job.options
+        self.trace = Trace() if job.options["trace"] else None
+        try:
+            self.emit('identification_step', {"message": "Letakkan jari apapun untuk identifikasi...", "job_id": job.id})
+            return self._stream_and_capture_task(CaptureType.IDENTIFY, is_enrollment=False)
+        finally:
+            self.trace = None
+
+    def _perform_1_to_n_match(self, probe_templates, probe_fingers=None, slap_size=None):
+        """Mencocokkan probe_templates dengan galeri lokal yang disinkronkan dari server Node.js.
 
-    def _perform_1_to_n_match(self, probe_templates):
-        """Mencocokkan probe_templates dengan semua data di DB melalui server Node.js."""
+        probe_fingers: (indeks split, kualitas FPSPLIT) per probe, dipakai oleh mode cascade.
+        """
         log_debug(f"Starting 1:N match with {len(probe_templates)} probe template(s).")
         
         try:
-            # --- MODIFIKASI: Mengambil data template dari server Node.js ---
-            response = requests.get(f"{NODE_SERVER_API_URL}/get-all-templates")
-            response.raise_for_status() # Akan memunculkan HTTPError untuk status respons buruk (4xx atau 5xx)
-
-            all_users_data = response.json()
+            # --- MODIFIKASI: Memakai galeri resident, tidak lagi menunggu server Node.js ---
+            gallery = gallery_cache.snapshot()
+            if not gallery.is_loaded:
+                log_error("Identification failed: gallery has not been loaded from Node.js server yet.")
+                if not gallery_sync_state["running"]: socketio.start_background_task(_sync_gallery_once)
+                self._emit_identification_result({"success": False, "message": "Galeri template belum dimuat dari server Node.js."})
+                return
 
-            if not all_users_data or not all_users_data.get('success') or not all_users_data.get('data'):
-                log_error("Identification failed: No user data received from Node.js server or data is empty.")
-                socketio.emit('identification_result', {"success": False, "message": "Database kosong atau gagal mengambil data dari server Node.js."})
+            if not gallery.live_slots:
+                log_error("Identification failed: gallery is empty.")
+                self._emit_identification_result({"success": False, "message": "Database kosong atau gagal mengambil data dari server Node.js."})
                 return
 
-            all_users = all_users_data['data']
-            log_debug(f"Found {len(all_users)} users in Node.js database to check against.")
+            if self.identify_options.get("cache", True) and self._reuse_cached_result(probe_templates, gallery): return
 
-            for user in all_users:
-                for probe_template_bytes in probe_templates:
-                    # Probe template buffer must be of FMR_TEMPLATE_SIZE
-                    # This assumes the probe template itself is already a single 1024-byte template
-                    probe_buffer = (ctypes.c_ubyte * FMR_TEMPLATE_SIZE)(*probe_template_bytes)
+            log_debug(f"Checking against {len(gallery.live_slots)} template(s) in local gallery.")
 
-                    stored_combined_template_b64 = user.get('combined_template_base64')
-                    if not stored_combined_template_b64: continue
+            if self.identify_options["mode"] == "topk":
+                self._perform_top_k_match(probe_templates, gallery, self.identify_options["k"])
+                return
+            if self.identify_options["mode"] == "cascade":
+                if probe_fingers is None: probe_fingers = [(i, 0) for i in range(len(probe_templates))]
+                self._perform_cascade_match(probe_templates, probe_fingers, slap_size or len(probe_templates), gallery)
+                return
 
-                    stored_combined_template_bytes = base64.b64decode(stored_combined_template_b64)
-                    
-                    # Iterate through the combined template in chunks of FMR_TEMPLATE_SIZE
-                    # to compare against each individual stored finger template
-                    for i in range(0, len(stored_combined_template_bytes), FMR_TEMPLATE_SIZE):
-                        single_stored_template_bytes = stored_combined_template_bytes[i:i + FMR_TEMPLATE_SIZE]
-
-                        # Ensure the chunk is exactly FMR_TEMPLATE_SIZE, otherwise it might be incomplete
-                        if len(single_stored_template_bytes) != FMR_TEMPLATE_SIZE:
-                            log_error(f"Incomplete stored template chunk found for user {user.get('id_number')} at offset {i}. Skipping this chunk.")
-                            continue
-
-                        stored_buffer = (ctypes.c_ubyte * FMR_TEMPLATE_SIZE)(*single_stored_template_bytes)
-                        
-                        score = zaz_dll.ZAZ_FpStdLib_CompareTemplates(self.device_handle, probe_buffer, stored_buffer)
-                        
-                        if score > 55: 
-                            log_debug(f"MATCH FOUND! User: {user['name']}, ID: {user['id_number']}, Score: {score}")
-                            socketio.emit('identification_result', {
-                                "success": True,
-                                "found": True,
-                                "name": user['name'],
-                                "id_number": user['id_number'],
-                                "score": score
-                                })
-                            return # Hentikan setelah menemukan kecocokan pertama
+            # Pemindaian berjalan di thread OS (tpool) agar greenlet lain tidak ikut membeku
+            started = time.time()
+            with METRICS.time("fp_identify_seconds", self.trace, "match"):
+                outcome = tpool.execute(match_engine.find_first, probe_templates, gallery.buffer, gallery.live_slots, 55)
+            self._record_compare_rate(outcome.compares, time.time() - started)
+            log_debug(f"1:N scan finished in {time.time() - started:.3f}s with {outcome.compares} compare(s).")
+
+            owner = gallery.slot_owner[outcome.slot] if outcome.slot is not None else -1
+            if owner >= 0:
+                user = gallery.users[owner]
+                if user is not None:
+                    log_debug(f"MATCH FOUND! User: {user['name']}, ID: {user['id_number']}, Score: {outcome.score}")
+                    self._emit_identification_result({
+                        "success": True,
+                        "found": True,
+                        "name": user['name'],
+                        "id_number": user['id_number'],
+                        "score": outcome.score
+                        })
+                    return # Hentikan setelah menemukan kecocokan pertama
 
             log_debug("No match found after checking all records.")
-            socketio.emit('identification_result', { "success": True, "found": False, "message": "Sidik jari tidak ditemukan di dalam database."})
+            self._emit_identification_result({ "success": True, "found": False, "message": "Sidik jari tidak ditemukan di dalam database."})
 
-        except requests.exceptions.RequestException as e:
-            log_error(f"Failed to fetch templates from Node.js server: {e}")
-            socketio.emit('identification_result', {"success": False, "message": "Gagal terhubung ke server Node.js untuk data identifikasi."})
         except Exception as e:
             log_error("1:N matching process failed", e)
-            socketio.emit('identification_result', {"success": False, "message": "Terjadi error saat proses identifikasi."})
+            self._emit_identification_result({"success": False, "message": "Terjadi error saat proses identifikasi."})
+
+    def _result_cache_params(self):
+        """Parameter yang memengaruhi hasil identifikasi; perubahan lewat /api/config menghasilkan kunci cache baru."""
+        mode = self.identify_options["mode"]
+        if mode == "topk": return (mode, self.identify_options["k"], prefilter_index.min_quality, prefilter_index.minutiae_tolerance)
+        if mode == "cascade": return (mode, cascade_matcher.reject_score, cascade_matcher.max_survivors)
+        return (mode, None)
+
+    def _reuse_cached_result(self, probe_templates, gallery):
+        """Mengirim hasil tersimpan bila probe identik/near-duplicate dengan galeri yang sama; True bila terkirim."""
+        started = time.time()
+        self._result_cache_entry = None
+        params = self._result_cache_params()
+        # Perbandingan 1:1 near-duplicate memanggil DLL: di thread OS seperti pencocokan lainnya
+        key, hit = tpool.execute(result_cache.lookup, probe_templates, params, gallery.generation, self._compare_pair)
+        if self.trace is not None: self.trace.add("result_cache", time.time() - started, hit=hit.kind if hit else None)
+        if hit is None:
+            METRICS.get("fp_result_cache_total").inc(result="miss")
+            self._result_cache_entry = (key, probe_templates, params, gallery.generation)
+            return False
+        METRICS.get("fp_result_cache_total").inc(result=hit.kind)
+        log_debug(f"Identification served from result cache ({hit.kind}).")
+        self._emit_identification_result(dict(hit.payload, cached=hit.kind))
+        return True
+
+    def _emit_identification_result(self, payload):
+        """Mengirim identification_result, mencatat hasilnya di metrik dan melampirkan trace bila diminta."""
+        result = "error" if not payload.get("success") else ("found" if payload.get("found") else "not_found")
+        METRICS.get("fp_identifications_total").inc(result=result)
+        entry, self._result_cache_entry = self._result_cache_entry, None
+        # Disimpan sebelum trace/job_id/device_id ditambahkan: hanya hasil pencocokan yang dipakai ulang
+        if entry is not None and payload.get("success"): result_cache.store(entry[0], entry[1], entry[2], entry[3], dict(payload))
+        if self.trace is not None:
+            payload["trace"] = self.trace.as_dict()
+            self.trace = None
+        job = self.scheduler.current
+        if job is not None:
+            payload["job_id"] = job.id
+            job.result = payload
+            if not payload.get("success"): job.error = payload.get("message")
+        self.emit('identification_result', payload)
+
+    def _record_compare_rate(self, compares, elapsed):
+        if elapsed > 0 and compares: METRICS.get("fp_identify_compares_per_second").observe(compares / elapsed)
+
+    def _perform_top_k_match(self, probe_templates, gallery, k):
+        """Identifikasi top-K: prefilter header FMR, lalu skor ZAZ hanya untuk kandidat yang tersisa."""
+        started = time.time()
+        # Slap 4 jari tidak mungkin berisi jempol
+        exclude_thumbs = len(probe_templates) == 4
+        candidates = [prefilter_index.candidates(gallery, read_fmr_header(probe), exclude_thumbs) for probe in probe_templates]
+        if self.trace is not None: self.trace.add("prefilter", time.time() - started)
+        match_started = time.time()
+        with METRICS.time("fp_identify_seconds", self.trace, "match"):
+            scores = tpool.execute(match_engine.score_all, probe_templates, gallery.buffer, candidates)
+        ranked = prefilter_index.rank(candidates, scores, k)
+
+        compared = sum(len(c) for c in candidates)
+        self._record_compare_rate(compared, time.time() - match_started)
+        possible = len(probe_templates) * len(gallery.live_slots)
+        prefilter_index.record(compared, possible)
+        log_debug(f"Top-{k} scan finished in {time.time() - started:.3f}s: {compared}/{possible} compare(s) after prefilter.")
+
+        result_candidates = []
+        for candidate in ranked:
+            user = gallery.users[candidate.user_index]
+            if user is None: continue
+            result_candidates.append({"name": user['name'], "id_number": user['id_number'], "score": candidate.score, "matched": candidate.score > 55})
+
+        payload = {
+            "success": True,
+            "found": bool(result_candidates and result_candidates[0]["matched"]),
+            "candidates": result_candidates,
+            "prefilter": {"compared": compared, "possible": possible, "pruning_ratio": 1 - compared / possible if possible else 0.0},
+        }
+        if payload["found"]:
+            best = result_candidates[0]
+            log_debug(f"MATCH FOUND! User: {best['name']}, ID: {best['id_number']}, Score: {best['score']}")
+            payload.update({"name": best['name'], "id_number": best['id_number'], "score": best['score']})
+        else:
+            payload["message"] = "Sidik jari tidak ditemukan di dalam database."
+        self._emit_identification_result(payload)
+
+        if random.random() < PREFILTER_AUDIT_RATE:
+            socketio.start_background_task(self._audit_prefilter, probe_templates, gallery, ranked[0] if ranked else None)
+
+    def _perform_cascade_match(self, probe_templates, probe_fingers, slap_size, gallery):
+        """Identifikasi bertingkat: jari terbaik menolak sebagian besar user, sisanya diberi skor gabungan."""
+        started = time.time()
+        with METRICS.time("fp_identify_seconds", self.trace, "match"):
+            outcome = tpool.execute(cascade_matcher.identify, match_engine, probe_templates, probe_fingers, slap_size, gallery)
+        compared = outcome.stage1_compares + outcome.stage2_compares
+        self._record_compare_rate(compared, time.time() - started)
+        possible = len(probe_templates) * len(gallery.live_slots)
+        cascade_matcher.record(outcome, possible)
+        if self.trace is not None:
+            self.trace.add("cascade_stage1", outcome.stage1_seconds, compares=outcome.stage1_compares, users=outcome.users)
+            self.trace.add("cascade_stage2", outcome.stage2_seconds, compares=outcome.stage2_compares, survivors=outcome.survivors)
+        log_debug(f"Cascade scan finished in {time.time() - started:.3f}s: {compared}/{possible} compare(s), "
+                  f"{outcome.survivors}/{outcome.users} user(s) escalated.")
+
+        shortlist = []
+        for entry in outcome.shortlist:
+            user = gallery.users[entry.user_index]
+            if user is None: continue
+            shortlist.append({"name": user['name'], "id_number": user['id_number'], "stage1_score": entry.stage1_score,
+                              "finger_scores": entry.finger_scores, "fused_score": entry.fused_score,
+                              "fingers_compared": entry.fingers_compared, "score": entry.best_score,
+                              "matched": entry.best_score > cascade_matcher.match_score})
+        # Shortlist dicatat untuk audit: siapa saja yang lolos tahap 1 dan dengan skor berapa
+        log_debug(f"Cascade shortlist: {[(c['id_number'], c['stage1_score'], c['fused_score']) for c in shortlist]}")
+
+        # Kecocokan = jari mana pun di atas ambang; bila lebih dari satu user, skor jari tertinggi lalu skor gabungan
+        matched = [c for c in shortlist if c["matched"]]
+        payload = {
+            "success": True,
+            "found": bool(matched),
+            "shortlist": shortlist,
+            "cascade": {"probe_order": outcome.probe_order, "stage1_compares": outcome.stage1_compares,
+                        "stage2_compares": outcome.stage2_compares, "possible": possible, "users": outcome.users,
+                        "survivors": outcome.survivors, "reject_score": cascade_matcher.reject_score},
+        }
+        if matched:
+            best = max(matched, key=lambda c: (c["score"], c["fused_score"]))
+            log_debug(f"MATCH FOUND! User: {best['name']}, ID: {best['id_number']}, Score: {best['score']}, Fused: {best['fused_score']}")
+            payload.update({"name": best['name'], "id_number": best['id_number'], "score": best['score'], "fused_score": best['fused_score']})
+        else:
+            payload["message"] = "Sidik jari tidak ditemukan di dalam database."
+        self._emit_identification_result(payload)
+
+    def _audit_prefilter(self, probe_templates, gallery, pruned_top):
+        """Mengukur kehilangan akurasi prefilter dengan membandingkan terhadap pemindaian penuh."""
+        try:
+            all_slots = np.asarray(gallery.live_slots, dtype=np.int64)
+            full_candidates = [all_slots] * len(probe_templates)
+            scores = tpool.execute(match_engine.score_all, probe_templates, gallery.buffer, full_candidates)
+            full_ranked = prefilter_index.rank(full_candidates, scores, 1)
+            prefilter_index.record_audit(pruned_top, full_ranked[0] if full_ranked else None, 55)
+        except Exception as e:
+            log_error("Prefilter audit failed", e)
+
+class DevicePool:
+    """Satu FingerprintDevice per channel scanner. Backend DLL, mesin pencocokan dan galeri dipakai bersama;
+    LIVESCAN_Init/MOSAIC_Init dan handle algoritma untuk pencocokan 1:N hanya dibuka sekali."""
+
+    def __init__(self, backend, channels):
+        self.backend = backend
+        self.algorithm_handle = None
+        self._backend_ready = False
+        self._init_lock = threading.Lock()
+        self.devices = OrderedDict()
+        for channel in channels:
+            device = FingerprintDevice(self, channel)
+            self.devices[device.device_id] = device
+        # Endpoint & klien lama (tanpa device_id) memakai perangkat pertama
+        self.default = next(iter(self.devices.values()))
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def get(self, device_id=None):
+        if device_id is None: return self.default
+        return self.devices.get(str(device_id))
+
+    def initialize_backend(self):
+        with self._init_lock:
+            if self._backend_ready: return
+            # Init driver & pemuatan DLL memblokir: di thread OS agar hub tetap melayani /api/health selama init
+            if tpool.execute(self.backend.livescan_init) != 1: raise Exception("Inisialisasi Perangkat Keras Gagal")
+            if tpool.execute(self.backend.mosaic_init) != 1: raise Exception("Algoritma Mosaic Gagal")
+            self.algorithm_handle = tpool.execute(self.backend.open_algorithm)
+            if self.algorithm_handle == 0: raise Exception("Inisialisasi Algoritma Gagal")
+            self._backend_ready = True
+
+    @property
+    def backend_ready(self):
+        return self._backend_ready
+
+    def initialize_all(self):
+        results = {device.device_id: device.initialize_device() for device in self}
+        return {"success": all(r["success"] for r in results.values()), "devices": results}
+
+    def find_job(self, job_id):
+        for device in self:
+            job = device.scheduler.get(job_id)
+            if job is not None: return device, job
+        return None, None
+
+    def get_status(self):
+        return [{"device_id": d.device_id, "channel": d.channel, "initialized": d.is_initialized, "jobs": d.scheduler.get_status()} for d in self]
+
+    def start(self):
+        for device in self:
+            socketio.start_background_task(device.scheduler.run)
+            socketio.start_background_task(device.preview.run)
+
+# =============================================
+# GALERI TEMPLATE LOKAL & MESIN PENCOCOKAN
+# =============================================
+class ZazComparator(Comparator):
+    """Comparator berbasis ZAZ_FpStdLib_CompareTemplates (atau pengganti dari backend replay)."""
+
+    def __init__(self, backend, handle_getter, owned_handle=None):
+        self._backend = backend
+        self._handle_getter = handle_getter
+        self._owned_handle = owned_handle  # Handle yang dibuka khusus untuk comparator ini, ditutup oleh close()
+
+    def prepare(self, template):
+        return as_ubyte_array(template, FMR_TEMPLATE_SIZE)
+
+    def compare(self, probe, stored):
+        # stored adalah memoryview ke buffer galeri (bytearray atau mmap template store), dibungkus tanpa salinan
+        return self._backend.compare(self._handle_getter(), probe, as_ubyte_array(stored, FMR_TEMPLATE_SIZE))
+
+    def close(self):
+        handle, self._owned_handle = self._owned_handle, None
+        if handle: self._backend.close_algorithm(handle)
+
+def _open_zaz_comparator():
+    """Factory untuk mode proses & job dedup: comparator dengan handle algoritmanya sendiri (ditutup lewat close())."""
+    handle = backend.open_algorithm()
+    return ZazComparator(backend, lambda: handle, owned_handle=handle)
+
+def _open_template_store():
+    if not TEMPLATE_STORE_DIR: return None
+    try:
+        return TemplateStore(TEMPLATE_STORE_DIR)
+    except OSError as e:
+        log_error(f"Template store at {TEMPLATE_STORE_DIR} unavailable, gallery stays in memory only: {e}")
+        return None
+
+node_client = NodeClient(NODE_SERVER_API_URL, NODE_CONNECT_TIMEOUT, NODE_READ_TIMEOUT, NODE_RETRIES)
+upload_queue = UploadQueue(node_client, UPLOAD_SPILL_DIR, UPLOAD_MEMORY_LIMIT, UPLOAD_SPILL_LIMIT, sleep=socketio.sleep,
+                           run_in_thread=tpool.execute) if ENROLLMENT_UPLOAD_ENABLED else None
+enrollment_sessions = EnrollmentSessionStore(ENROLLMENT_SPILL_DIR, ENROLLMENT_SESSION_MEMORY, ENROLLMENT_SESSION_TTL, ENROLLMENT_MAX_SESSIONS)
+# Template store dipetakan oleh _startup_task, bukan saat import
+gallery_cache = GalleryCache(NODE_SERVER_API_URL, store=_open_template_store(), client=node_client, defer_warm_start=True,
+                             run_in_thread=tpool.execute)
+prefilter_index = PrefilterIndex()
+cascade_matcher = CascadeMatcher(CASCADE_REJECT_SCORE, CASCADE_MAX_SURVIVORS, CASCADE_SHORTLIST_SIZE)
+result_cache = ResultCache(RESULT_CACHE_SIZE, NEAR_DUPLICATE_WINDOW, NEAR_DUPLICATE_SCORE,
+                           threading_module=eventlet.patcher.original('threading'))
+score_cache = ScoreCache()
+match_engine = MatchEngine(ZazComparator(backend, lambda: device_pool.algorithm_handle), workers=MATCH_WORKERS, shard_size=MATCH_SHARD_SIZE,
+                           mode=MATCH_EXECUTOR, comparator_factory=_open_zaz_comparator,
+                           threading_module=eventlet.patcher.original('threading'))
+
+gallery_sync_state = {"running": False}
+
+def _sync_gallery_once():
+    # Satu sinkronisasi pada satu waktu: identifikasi beruntun saat galeri belum dimuat tidak memicu sync paralel
+    if gallery_sync_state["running"]: return False
+    gallery_sync_state["running"] = True
+    try:
+        changed = gallery_cache.sync()
+        gallery_cache.last_error = None
+        return changed
+    except Exception as e:
+        log_error(f"Failed to sync gallery from Node.js server: {e}")
+        gallery_cache.last_error = str(e)
+        return False
+    finally:
+        gallery_sync_state["running"] = False
+
+def _gallery_sync_loop():
+    """Memuat galeri sekali saat startup, lalu sinkronisasi inkremental secara berkala."""
+    while True:
+        _sync_gallery_once()
+        socketio.sleep(GALLERY_SYNC_INTERVAL)
+
+# =============================================
+# STARTUP LATAR BELAKANG & HEALTH/READINESS
+# =============================================
+PROCESS_STARTED = time.time()
+startup_state = {"state": "pending", "steps": {}, "ready_at": None}
+
+def _startup_step(name, fn):
+    started = time.perf_counter()
+    try:
+        result = fn()
+        startup_state["steps"][name] = {"seconds": round(time.perf_counter() - started, 3), "ok": True}
+        return result
+    except Exception as e:
+        log_error(f"Startup step {name} failed", e)
+        startup_state["steps"][name] = {"seconds": round(time.perf_counter() - started, 3), "ok": False, "error": str(e)}
+        return None
+
+def _startup_task():
+    """Warm start galeri (template store) lalu inisialisasi perangkat, tanpa menahan server HTTP.
+
+    Galeri dipetakan lebih dulu karena murah dan sudah cukup untuk identifikasi begitu perangkat siap;
+    sinkronisasi dengan server Node.js baru dimulai setelahnya (bisa lambat bila server belum hidup).
+    """
+    startup_state["state"] = "running"
+    _startup_step("enrollment_spill_cleanup", enrollment_sessions.remove_stale_files)
+    # Keduanya dipanggil dari greenlet karena memakai lock yang sudah di-green-kan; pemanggilan backend
+    # yang memblokir di dalam initialize_device berjalan lewat tpool
+    _startup_step("gallery_warm_start", gallery_cache.warm_start)
+    if AUTO_INIT: _startup_step("device_init", device_pool.initialize_all)
+    startup_state["state"] = "done"
+    socketio.start_background_task(_gallery_sync_loop)
+    log_debug(f"Startup finished in {time.time() - PROCESS_STARTED:.2f}s: {startup_state['steps']}")
+
+def _component_state(ok, failed=False):
+    return "ready" if ok else ("failed" if failed else "starting")
+
+def _health_components():
+    devices = {d.device_id: {"state": _component_state(d.is_initialized, d.init_error is not None), "error": d.init_error} for d in device_pool}
+    backend_failed = not device_pool.backend_ready and any(d.init_error for d in device_pool)
+    gallery = gallery_cache.get_status()
+    uploads = upload_queue.get_stats() if upload_queue else None
+    node_ok = gallery["last_sync"] is not None and gallery_cache.last_error is None and (uploads is None or uploads["node_available"])
+    node_failed = gallery_cache.last_error is not None or (uploads is not None and not uploads["node_available"])
+    return {
+        "backend": {"state": _component_state(device_pool.backend_ready, backend_failed), "name": backend.name,
+                    "libraries": getattr(backend, "loaded_libraries", None)},
+        "devices": devices,
+        "gallery": {"state": _component_state(gallery["loaded"]), "users": gallery["users"], "templates": gallery["templates"],
+                    "source": "node" if gallery["last_sync"] else ("store" if gallery["loaded"] else None)},
+        "node": {"state": _component_state(node_ok, node_failed), "last_sync": gallery["last_sync"],
+                 "error": gallery_cache.last_error or (uploads or {}).get("last_error")},
+        "uploads": {"state": "disabled"} if uploads is None else {"state": _component_state(uploads["node_available"], not uploads["node_available"]), "pending": uploads["pending"]},
+        "enrollment_sessions": {"state": "ready", "active": enrollment_sessions.get_stats()["active"]},
+    }
+
+def _readiness(components):
+    """Siap menerima capture & identifikasi: backend, minimal satu perangkat, dan galeri sudah dimuat."""
+    waiting = [name for name, ok in (("backend", components["backend"]["state"] == "ready"),
+                                     ("devices", any(d["state"] == "ready" for d in components["devices"].values())),
+                                     ("gallery", components["gallery"]["state"] == "ready")) if not ok]
+    if not waiting and startup_state["ready_at"] is None:
+        startup_state["ready_at"] = time.time()
+        log_debug(f"Agent ready {startup_state['ready_at'] - PROCESS_STARTED:.2f}s after process start.")
+    return waiting
+
+# =============================================
+# JOB DEDUPLIKASI N:N
+# =============================================
+dedup_state = {"job": None, "last_emit": 0.0}
+
+def _emit_dedup_progress(status):
+    now = time.time()
+    if status["state"] == "running" and now - dedup_state["last_emit"] < DEDUP_PROGRESS_INTERVAL: return
+    dedup_state["last_emit"] = now
+    socketio.emit('dedup_progress', status)
+
+def _run_dedup_job(job):
+    try:
+        report = job.run()
+        if report is not None:
+            log_debug(f"Dedup job finished: {report['duplicate_pairs']} duplicate pair(s) in {len(report['clusters'])} cluster(s).")
+    except Exception as e:
+        log_error("Dedup job failed", e)
+        job.state = "failed"
+        socketio.emit('dedup_progress', job.get_status())
+    finally:
+        job.engine.shutdown()  # Termasuk menutup handle ZAZ yang dibuka untuk job ini
+
+def start_dedup_job(options):
+    current = dedup_state["job"]
+    if current is not None and current.state in ("pending", "running"):
+        return {"success": False, "message": "Job deduplikasi sedang berjalan."}
+
+    if options.get("dump_path"):
+        # Dump template tersimpan: tidak butuh scanner maupun server Node.js
+        dump_gallery = GalleryCache(None)
+        dump_gallery.load_users(load_template_dump(options["dump_path"]))
+        gallery = dump_gallery.snapshot()
+    else:
+        gallery = gallery_cache.snapshot()
+        if not gallery.is_loaded: return {"success": False, "message": "Galeri template belum dimuat dari server Node.js."}
+
+    os.makedirs(DEDUP_DIR, exist_ok=True)
+    engine = MatchEngine(_open_zaz_comparator(), workers=match_engine.workers, shard_size=MATCH_SHARD_SIZE,
+                         threading_module=eventlet.patcher.original('threading'))
+    try:
+        job = DedupJob(gallery, engine, threshold=int(options.get("threshold", 55)), blocking=options.get("blocking", "position"),
+                       checkpoint_path=os.path.join(DEDUP_DIR, 'checkpoint.json'), report_path=os.path.join(DEDUP_DIR, 'report.json'),
+                       progress=_emit_dedup_progress, run_in_thread=tpool.execute)
+        resumed = job.resume() if options.get("resume", True) else False
+    except Exception:
+        engine.shutdown()  # Handle ZAZ milik job ikut ditutup
+        raise
+    dedup_state["job"] = job
+    socketio.start_background_task(_run_dedup_job, job)
+    return {"success": True, "message": "Job deduplikasi dimulai...", "resumed": resumed, "status": job.get_status()}
 
 # =============================================
 # FLASK & SOCKETIO ENDPOINTS
 # =============================================
-fingerprint_device = FingerprintDevice()
+device_pool = DevicePool(backend, FP_CHANNELS)
 
-@app.route('/api/status')
-def status(): return jsonify(fingerprint_device.get_status())
+def device_route(rule, **options):
+    """Endpoint perangkat: /api/<rule> untuk perangkat default dan /api/devices/<device_id>/<rule>."""
+    def decorator(view):
+        @functools.wraps(view)
+        def resolve(device_id=None, **kwargs):
+            device = device_pool.get(device_id)
+            if device is None: return jsonify({"success": False, "message": f"Perangkat tidak ditemukan: {device_id}"}), 404
+            return view(device, **kwargs)
+        app.route(f'/api/{rule}', **options)(resolve)
+        app.route(f'/api/devices/<device_id>/{rule}', **options)(resolve)
+        return resolve
+    return decorator
 
-@app.route('/api/init', methods=['POST'])
-def init_device(): return jsonify(fingerprint_device.initialize_device())
+@app.route('/api/devices')
+def list_devices(): return jsonify({"success": True, "devices": device_pool.get_status()})
 
-@app.route('/api/config', methods=['POST'])
-def config():
+@app.route('/api/devices/init', methods=['POST'])
+def init_all_devices(): return jsonify(device_pool.initialize_all())
+
+@device_route('status')
+def status(device): return jsonify(device.get_status())
+
+@device_route('init', methods=['POST'])
+def init_device(device): return jsonify(device.initialize_device())
+
+@device_route('config', methods=['POST'])
+def config(device):
     data = request.get_json()
-    if "quality_threshold" in data: fingerprint_device.quality_threshold = int(data["quality_threshold"])
-    if "fog_removal" in data: fingerprint_device.fog_removal = bool(data["fog_removal"])
-    if "capture_timeout" in data: fingerprint_device.capture_timeout = int(data["capture_timeout"])
+    # Per perangkat
+    if "quality_threshold" in data: device.quality_threshold = int(data["quality_threshold"])
+    if "fog_removal" in data: device.fog_removal = bool(data["fog_removal"])
+    if "capture_timeout" in data: device.capture_timeout = int(data["capture_timeout"])
+    if "gate_candidate_ratio" in data: device.frame_gate.candidate_ratio = float(data["gate_candidate_ratio"])
+    # Bersama untuk semua perangkat
+    if "match_workers" in data: match_engine.workers = max(1, int(data["match_workers"]))
+    if "prefilter_min_quality" in data: prefilter_index.min_quality = int(data["prefilter_min_quality"])
+    if "prefilter_minutiae_tolerance" in data: prefilter_index.minutiae_tolerance = float(data["prefilter_minutiae_tolerance"])
+    if "cascade_reject_score" in data: cascade_matcher.reject_score = int(data["cascade_reject_score"])
+    if "cascade_max_survivors" in data: cascade_matcher.max_survivors = max(1, int(data["cascade_max_survivors"]))
     return jsonify({"success": True, "message": "Pengaturan diperbarui"})
 
-@app.route('/api/create_template', methods=['POST'])
-def create_template_manual():
+@app.route('/api/health')
+def health():
+    """Liveness: selalu 200 selama proses melayani HTTP, dengan state setiap komponen."""
+    components = _health_components()
+    waiting = _readiness(components)
+    states = [components["backend"]["state"], components["gallery"]["state"], components["node"]["state"]] + [d["state"] for d in components["devices"].values()]
+    status = "ok" if "failed" not in states and not waiting else ("degraded" if "failed" in states else "starting")
+    ready_at = startup_state["ready_at"]
+    return jsonify({"status": status, "ready": not waiting, "uptime": round(time.time() - PROCESS_STARTED, 3),
+                    "startup": {"state": startup_state["state"], "steps": startup_state["steps"],
+                                "ready_seconds": round(ready_at - PROCESS_STARTED, 3) if ready_at else None},
+                    "components": components})
+
+@app.route('/api/ready')
+def ready():
+    """Readiness: 200 bila agent bisa melayani capture & identifikasi, selain itu 503 dengan komponen yang ditunggu."""
+    waiting = _readiness(_health_components())
+    if waiting: return jsonify({"ready": False, "waiting_for": waiting}), 503
+    return jsonify({"ready": True, "ready_seconds": round(startup_state["ready_at"] - PROCESS_STARTED, 3)})
+
+@app.route('/api/metrics')
+def metrics():
+    return METRICS.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@device_route('create_template', methods=['POST'])
+def create_template_manual(device):
     data = request.get_json()
     if not data or 'template_no' not in data or 'capture_type' not in data:
         return jsonify({"success": False, "message": "Data tidak lengkap"}), 400
-    return jsonify(fingerprint_device.create_template_manual(data['template_no'], data['capture_type']))
+    return jsonify(device.create_template_manual(data['template_no'], data['capture_type']))
+
+@device_route('match_templates', methods=['POST'])
+def match_templates(device): return jsonify(device.match_templates())
 
-@app.route('/api/match_templates', methods=['POST'])
-def match_templates(): return jsonify(fingerprint_device.match_templates())
+@device_route('start_enrollment', methods=['POST'])
+def start_enrollment(device):
+    return jsonify(device.start_enrollment_sequence())
 
-@app.route('/api/start_enrollment', methods=['POST'])
-def start_enrollment():
-    return jsonify(fingerprint_device.start_enrollment_sequence())
+def _image_shape(raw):
+    if len(raw) == RAW_IMAGE_WIDTH * RAW_IMAGE_HEIGHT: return RAW_IMAGE_WIDTH, RAW_IMAGE_HEIGHT
+    return SPLIT_IMAGE_WIDTH, SPLIT_IMAGE_HEIGHT
 
-@app.route('/api/get_enrollment_data', methods=['GET'])
-def get_enrollment_data():
-    if len(fingerprint_device.enrollment_data["templates"]) < 10 or len(fingerprint_device.enrollment_data["images"]) < 13:
+@device_route('get_enrollment_data', methods=['GET'])
+def get_enrollment_data(device):
+    # ?session_id=<enrollment_id dari enrollment_step "finished">; tanpa parameter: sesi selesai terbaru perangkat ini
+    session_id = request.args.get("session_id")
+    session = enrollment_sessions.get(session_id) if session_id else enrollment_sessions.latest(device.device_id)
+    if session is None or len(session.templates) < 10 or session.image_count < 13:
         return jsonify({"success": False, "message": "Data enrollment tidak lengkap atau tidak ada."}), 404
-        
-    templates_b64 = {key: base64.b64encode(val).decode('utf-8') for key, val in fingerprint_device.enrollment_data["templates"].items()}
-    images_b64 = {key: base64.b64encode(val).decode('utf-8') for key, val in fingerprint_device.enrollment_data["images"].items()}
+    session = enrollment_sessions.take(session.id)
+    if session is None: return jsonify({"success": False, "message": "Data enrollment sudah diambil."}), 404
 
-    response_data = { "success": True, "templates_base64": templates_b64, "images_base64": images_b64 }
-    
-    fingerprint_device._clear_enrollment_data()
-    return jsonify(response_data)
+    # Gambar yang di-spill dibaca dari disk satu per satu saat dikirim. Sesi ditutup saat respons ditutup server,
+    # juga bila klien memutus di tengah stream atau pengiriman gagal
+    try:
+        templates, images = dict(session.templates), session.images
+        if prefers_msgpack(request.accept_mimetypes):
+            image_format = "raw" if request.args.get("image_format") == "raw" else "png"
+            response = Response(iter_enrollment_msgpack(templates, images, _image_shape, image_format, run_in_thread=tpool.execute),
+                                mimetype=MSGPACK_MIMETYPE)
+        else:
+            response = jsonify(enrollment_json(templates, images))
+    except Exception:
+        session.close()
+        raise
+    response.call_on_close(session.close)
+    return response
 
 # --- TAMBAHAN: Endpoint baru untuk identifikasi ---
-@app.route('/api/identify', methods=['POST'])
-def identify():
-    return jsonify(fingerprint_device.start_identification())
+@device_route('identify', methods=['POST'])
+def identify(device):
+    return jsonify(device.start_identification(request.get_json(silent=True)))
 # --- AKHIR TAMBAHAN ---
 
+@device_route('jobs', methods=['GET'])
+def list_jobs(device):
+    return jsonify({"success": True, "jobs": device.scheduler.list_jobs(), **device.scheduler.get_status()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    device, job = device_pool.find_job(job_id)
+    if job is None: return jsonify({"success": False, "message": "Job tidak ditemukan."}), 404
+    return jsonify({"success": True, "device_id": device.device_id, "job": job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    device, job = device_pool.find_job(job_id)
+    if job is None or not device.scheduler.cancel(job_id): return jsonify({"success": False, "message": "Job tidak ditemukan atau sudah selesai."}), 404
+    return jsonify({"success": True, "message": "Job dibatalkan."})
+
+@app.route('/api/gallery/sync', methods=['POST'])
+def sync_gallery():
+    # Lewat penjaga yang sama dengan sinkronisasi berkala: tidak ada sync paralel dan last_error ikut diperbarui
+    if gallery_sync_state["running"]: return jsonify({"success": False, "message": "Sinkronisasi galeri sedang berjalan."}), 409
+    changed = _sync_gallery_once()
+    if gallery_cache.last_error: return jsonify({"success": False, "message": f"Sinkronisasi galeri gagal: {gallery_cache.last_error}"}), 502
+    return jsonify({"success": True, "changed": changed, "gallery": gallery_cache.get_status()})
+
+@app.route('/api/dedup/start', methods=['POST'])
+def start_dedup():
+    try: return jsonify(start_dedup_job(request.get_json(silent=True) or {}))
+    except (OSError, ValueError) as e:
+        log_error("Failed to start dedup job", e)
+        return jsonify({"success": False, "message": f"Job deduplikasi gagal dimulai: {str(e)}"}), 400
+
+@app.route('/api/dedup/status', methods=['GET'])
+def dedup_status():
+    job = dedup_state["job"]
+    if job is None: return jsonify({"success": True, "status": None})
+    return jsonify({"success": True, "status": job.get_status()})
+
+@app.route('/api/dedup/cancel', methods=['POST'])
+def cancel_dedup():
+    job = dedup_state["job"]
+    if job is None or job.state != "running": return jsonify({"success": False, "message": "Tidak ada job deduplikasi yang berjalan."})
+    job.cancel()
+    return jsonify({"success": True, "message": "Job deduplikasi dibatalkan; progres tersimpan di checkpoint."})
+
+@app.route('/api/dedup/report', methods=['GET'])
+def dedup_report():
+    report_path = os.path.join(DEDUP_DIR, 'report.json')
+    if not os.path.exists(report_path): return jsonify({"success": False, "message": "Laporan deduplikasi belum tersedia."}), 404
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return jsonify({"success": True, "report": json.load(f)})
+
+
+def _subscribe(device):
+    join_room(device.room)
+    device.preview.add_client(request.sid)
 
 @socketio.on('connect')
-def handle_connect(): log_debug(f'Klien terhubung: {request.sid}')
+def handle_connect():
+    log_debug(f'Klien terhubung: {request.sid}')
+    # Klien lama (satu scanner) otomatis menerima event & preview perangkat default
+    _subscribe(device_pool.default)
 
 @socketio.on('disconnect')
-def handle_disconnect(): log_debug(f'Klien terputus: {request.sid}')
+def handle_disconnect():
+    log_debug(f'Klien terputus: {request.sid}')
+    for device in device_pool: device.preview.remove_client(request.sid)
+
+@socketio.on('join_device')
+def handle_join_device(data):
+    """Berlangganan event & preview perangkat lain: { device_id }."""
+    device = device_pool.get((data or {}).get("device_id"))
+    if device is None: return {"success": False, "message": "Perangkat tidak ditemukan."}
+    _subscribe(device)
+    return {"success": True, "device_id": device.device_id}
+
+@socketio.on('leave_device')
+def handle_leave_device(data):
+    device = device_pool.get((data or {}).get("device_id"))
+    if device is None: return {"success": False, "message": "Perangkat tidak ditemukan."}
+    leave_room(device.room)
+    device.preview.remove_client(request.sid)
+    return {"success": True, "device_id": device.device_id}
+
+@socketio.on('preview_settings')
+def handle_preview_settings(data):
+    """Klien mengatur preview-nya sendiri: { fps, max_width, binary, device_id? } (tanpa device_id: semua perangkat)."""
+    data = data or {}
+    devices = [device_pool.get(data["device_id"])] if "device_id" in data else list(device_pool)
+    updated = [device.preview.update_client(request.sid, data) for device in devices if device is not None]
+    return {"success": any(updated)}
 
 # =============================================
 # MAIN EXECUTION
 # =============================================
 if __name__ == '__main__':
+    socketio.start_background_task(_startup_task)
+    if upload_queue is not None: socketio.start_background_task(upload_queue.run)
+    socketio.start_background_task(enrollment_sessions.run, socketio.sleep)
+    device_pool.start()
     log_debug("Memulai server Flask-SocketIO...")
-    socketio.run(app, host='127.0.0.1', port=5000, debug=False)
+    socketio.run(app, host=AGENT_HOST, port=AGENT_PORT, debug=False)
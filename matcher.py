@@ -0,0 +1,278 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from common import FMR_TEMPLATE_SIZE
+
+# Hasil pencarian 1:N. slot bernilai None jika tidak ada template yang melewati threshold.
+MatchOutcome = namedtuple("MatchOutcome", ["slot", "probe_index", "score", "compares"])
+
+# =============================================
+# COMPARATOR
+# =============================================
+class Comparator:
+    """Antarmuka pembanding template. prepare() dipanggil sekali per probe, compare() per pasangan."""
+
+    def prepare(self, template):
+        return template
+
+    def compare(self, probe, stored):
+        raise NotImplementedError
+
+    def close(self):
+        """Melepas sumber daya milik comparator (mis. handle algoritma). Default: tidak ada."""
+
+class XorComparator(Comparator):
+    """Pengganti murni Python untuk benchmark: skor 0..100 dari jarak Hamming."""
+
+    def prepare(self, template):
+        return int.from_bytes(template, 'little')
+
+    def compare(self, probe, stored):
+        bits = len(stored) * 8
+        diff = bin(probe ^ int.from_bytes(stored, 'little')).count('1')
+        return max(0, int(100 - 200 * diff / bits))
+
+class NumpyXorComparator(Comparator):
+    """Varian NumPy dari XorComparator (numpy diimpor saat dibuat)."""
+
+    def __init__(self):
+        import numpy as np
+        self._np = np
+        self._popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+    def prepare(self, template):
+        return self._np.frombuffer(bytes(template), dtype=self._np.uint8)
+
+    def compare(self, probe, stored):
+        stored_arr = self._np.frombuffer(stored, dtype=self._np.uint8)
+        diff = int(self._popcount[probe ^ stored_arr].sum())
+        return max(0, int(100 - 200 * diff / (len(stored_arr) * 8)))
+
+# =============================================
+# MESIN PENCOCOKAN BERSHARD
+# =============================================
+class _ScanState:
+    def __init__(self, threading_module, slot_total, shard_size):
+        self.lock = threading_module.Lock()
+        self.next_start = 0
+        self.slot_total = slot_total
+        self.shard_size = shard_size
+        self.best_pos = slot_total   # posisi terendah yang sudah cocok (slot_total = belum ada)
+        self.best = None
+        self.cancelled = False
+        self.compares = 0
+
+    def next_shard(self):
+        with self.lock:
+            if self.cancelled or self.next_start >= min(self.slot_total, self.best_pos): return None
+            start = self.next_start
+            self.next_start += self.shard_size
+            return start, min(start + self.shard_size, self.slot_total)
+
+class MatchEngine:
+    """Membagi galeri menjadi shard dan memindainya paralel; kecocokan pertama membatalkan shard lain.
+
+    Dengan deterministic=True hasilnya selalu slot dengan posisi terendah yang melewati threshold,
+    sama seperti pemindaian sekuensial. mode="process" memakai comparator_factory di setiap proses.
+    """
+
+    def __init__(self, comparator, workers=4, shard_size=256, deterministic=True, mode="thread",
+                 comparator_factory=None, threading_module=threading):
+        self.comparator = comparator
+        self.workers = max(1, int(workers))
+        self.shard_size = max(1, int(shard_size))
+        self.deterministic = deterministic
+        self.mode = mode
+        self.comparator_factory = comparator_factory
+        self._threading = threading_module
+        self._process_pool = None
+        # Pemindaian berjalan di thread OS (tpool), jadi lock ini harus dari threading_module (threading asli di agent eventlet)
+        self._process_lock = threading_module.Lock()
+
+    def find_first(self, probes, buffer, slots, threshold):
+        """Mencari template galeri pertama (berdasarkan urutan slots) dengan skor > threshold."""
+        if not probes or not slots:
+            return MatchOutcome(None, None, 0, 0)
+        if self.mode == "process":
+            return self._find_first_process(probes, buffer, slots, threshold)
+        return self._find_first_thread(probes, buffer, slots, threshold)
+
+    def score_all(self, probes, buffer, candidates):
+        """Menghitung skor setiap probe terhadap daftar slot kandidatnya (tanpa berhenti di kecocokan pertama).
+
+        candidates[i] adalah urutan slot untuk probes[i]; hasilnya list skor dengan urutan yang sama.
+        """
+        chunks = []
+        for probe_index, slots in enumerate(candidates):
+            for start in range(0, len(slots), self.shard_size):
+                chunks.append((probe_index, start, min(start + self.shard_size, len(slots))))
+        scores = [[0] * len(slots) for slots in candidates]
+        if not chunks:
+            return scores
+        if self.mode == "process":
+            return self._score_all_process(probes, buffer, candidates, chunks, scores)
+
+        comparator = self.comparator
+        prepared = [comparator.prepare(p) for p in probes]
+        lock = self._threading.Lock()
+        pending = list(reversed(chunks))
+
+        def score_chunks():
+            while True:
+                with lock:
+                    if not pending: return
+                    probe_index, start, end = pending.pop()
+                probe = prepared[probe_index]
+                slots = candidates[probe_index]
+                out = scores[probe_index]
+                for pos in range(start, end):
+                    offset = int(slots[pos]) * FMR_TEMPLATE_SIZE
+                    out[pos] = comparator.compare(probe, buffer[offset:offset + FMR_TEMPLATE_SIZE])
+
+        worker_count = min(self.workers, len(chunks))
+        if worker_count <= 1:
+            score_chunks()
+        else:
+            threads = [self._threading.Thread(target=score_chunks, daemon=True) for _ in range(worker_count)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        return scores
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._process_pool = None
+        self.comparator.close()
+
+    # ---------------------------------------------
+    # Mode thread (ctypes melepas GIL selama pemanggilan DLL)
+    # ---------------------------------------------
+    def _find_first_thread(self, probes, buffer, slots, threshold):
+        comparator = self.comparator
+        prepared = [comparator.prepare(p) for p in probes]
+        state = _ScanState(self._threading, len(slots), self.shard_size)
+
+        def scan_shards():
+            compares = 0
+            while True:
+                shard = state.next_shard()
+                if shard is None: break
+                start, end = shard
+                for pos in range(start, end):
+                    if state.cancelled or pos > state.best_pos: break
+                    offset = slots[pos] * FMR_TEMPLATE_SIZE
+                    stored = buffer[offset:offset + FMR_TEMPLATE_SIZE]
+                    hit = None
+                    for probe_index, probe in enumerate(prepared):
+                        score = comparator.compare(probe, stored)
+                        compares += 1
+                        if score > threshold:
+                            hit = (probe_index, score)
+                            break
+                    if hit is not None:
+                        with state.lock:
+                            if pos < state.best_pos:
+                                state.best_pos = pos
+                                state.best = (slots[pos], hit[0], hit[1])
+                            if not self.deterministic: state.cancelled = True
+                        break
+            with state.lock:
+                state.compares += compares
+
+        worker_count = min(self.workers, (len(slots) + self.shard_size - 1) // self.shard_size)
+        if worker_count <= 1:
+            scan_shards()
+        else:
+            threads = [self._threading.Thread(target=scan_shards, daemon=True) for _ in range(worker_count)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+
+        if state.best is None:
+            return MatchOutcome(None, None, 0, state.compares)
+        slot, probe_index, score = state.best
+        return MatchOutcome(slot, probe_index, score, state.compares)
+
+    # ---------------------------------------------
+    # Mode proses (untuk comparator yang tidak melepas GIL)
+    # ---------------------------------------------
+    def _ensure_process_pool(self):
+        import multiprocessing
+        if self._process_pool is None:
+            self._cancel_event = multiprocessing.Event()
+            self._best_pos = multiprocessing.Value('q', 0)
+            self._process_pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_process_init,
+                                                     initargs=(self.comparator_factory, self._cancel_event, self._best_pos))
+        return self._process_pool
+
+    def _score_all_process(self, probes, buffer, candidates, chunks, scores):
+        with self._process_lock:
+            pool = self._ensure_process_pool()
+            futures = []
+            for probe_index, start, end in chunks:
+                chunk_bytes = b"".join(buffer[int(s) * FMR_TEMPLATE_SIZE:(int(s) + 1) * FMR_TEMPLATE_SIZE] for s in candidates[probe_index][start:end])
+                futures.append((probe_index, start, pool.submit(_process_score, bytes(probes[probe_index]), chunk_bytes)))
+            for probe_index, start, future in futures:
+                chunk_scores = future.result()
+                scores[probe_index][start:start + len(chunk_scores)] = chunk_scores
+        return scores
+
+    def _find_first_process(self, probes, buffer, slots, threshold):
+        with self._process_lock:
+            self._ensure_process_pool()
+            self._cancel_event.clear()
+            self._best_pos.value = len(slots)
+
+            futures = []
+            probe_bytes = [bytes(p) for p in probes]
+            for start in range(0, len(slots), self.shard_size):
+                shard_slots = slots[start:start + self.shard_size]
+                shard_bytes = b"".join(buffer[s * FMR_TEMPLATE_SIZE:(s + 1) * FMR_TEMPLATE_SIZE] for s in shard_slots)
+                futures.append(self._process_pool.submit(_process_scan, probe_bytes, shard_bytes, start, threshold, self.deterministic))
+
+            best = None
+            compares = 0
+            for future in futures:
+                hit, shard_compares = future.result()
+                compares += shard_compares
+                if hit is not None and (best is None or hit[0] < best[0]):
+                    best = hit
+
+        if best is None:
+            return MatchOutcome(None, None, 0, compares)
+        pos, probe_index, score = best
+        return MatchOutcome(slots[pos], probe_index, score, compares)
+
+_process_state = {}
+
+def _process_init(comparator_factory, cancel_event, best_pos):
+    _process_state["comparator"] = comparator_factory()
+    _process_state["cancel"] = cancel_event
+    _process_state["best_pos"] = best_pos
+
+def _process_scan(probes, shard_bytes, start, threshold, deterministic):
+    comparator = _process_state["comparator"]
+    cancel_event = _process_state["cancel"]
+    best_pos = _process_state["best_pos"]
+    prepared = [comparator.prepare(p) for p in probes]
+    view = memoryview(shard_bytes)
+    compares = 0
+    for i in range(len(view) // FMR_TEMPLATE_SIZE):
+        pos = start + i
+        if cancel_event.is_set() or pos > best_pos.value: break
+        stored = view[i * FMR_TEMPLATE_SIZE:(i + 1) * FMR_TEMPLATE_SIZE]
+        for probe_index, probe in enumerate(prepared):
+            score = comparator.compare(probe, stored)
+            compares += 1
+            if score > threshold:
+                with best_pos.get_lock():
+                    if pos < best_pos.value: best_pos.value = pos
+                if not deterministic: cancel_event.set()
+                return (pos, probe_index, score), compares
+    return None, compares
+
+def _process_score(probe, chunk_bytes):
+    comparator = _process_state["comparator"]
+    prepared = comparator.prepare(probe)
+    view = memoryview(chunk_bytes)
+    return [comparator.compare(prepared, view[i:i + FMR_TEMPLATE_SIZE]) for i in range(0, len(view), FMR_TEMPLATE_SIZE)]
@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FPS_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 60)
+RATE_BUCKETS = (100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+
+def _format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values) or {(): 0}
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in sorted(values.items())]
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def render(self):
+        counts, total, count = self.snapshot()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+class Trace:
+    """Jejak per permintaan: durasi setiap tahap (ms) dalam urutan eksekusi."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def add(self, stage, seconds, **extra):
+        self.stages.append(dict(stage=stage, ms=round(seconds * 1000, 3), **extra))
+
+    def as_dict(self):
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 3), "stages": self.stages}
+
+class MetricsRegistry:
+    """Registri metrik dalam proses, dirender dalam format teks Prometheus untuk /api/metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, help_text):
+        return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DURATION_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def get(self, name):
+        return self._metrics[name]
+
+    @contextmanager
+    def time(self, name, trace=None, stage=None):
+        """Mengukur blok ke histogram `name`; bila trace diberikan, tahap juga dicatat di trace."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._metrics[name].observe(elapsed)
+            if trace is not None: trace.add(stage or name, elapsed)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+# Registri global; metrik dideklarasikan di sini agar /api/metrics selalu lengkap walau belum ada sampel
+METRICS = MetricsRegistry()
+METRICS.histogram("fp_capture_fps", "Frames per second read from the scanner during one capture session", FPS_BUCKETS)
+METRICS.histogram("fp_frame_read_seconds", "LIVESCAN_GetFPRawData duration")
+METRICS.histogram("fp_quality_seconds", "MOSAIC_FingerQuality duration")
+METRICS.histogram("fp_split_seconds", "FPSPLIT_DoSplit duration")
+METRICS.histogram("fp_template_seconds", "ZAZ_FpStdLib_CreateISOTemplate duration per finger")
+METRICS.histogram("fp_identify_seconds", "1:N match duration (compare loop)")
+METRICS.histogram("fp_identify_compares_per_second", "Template compares per second during one 1:N match", RATE_BUCKETS)
+METRICS.histogram("fp_gallery_fetch_seconds", "HTTP fetch of /get-all-templates from the Node.js server")
+METRICS.histogram("fp_gallery_decode_seconds", "Base64 decode and load of fetched templates into the gallery")
+METRICS.histogram("fp_gallery_store_load_seconds", "Mapping the local template store at startup")
+METRICS.histogram("fp_gallery_store_commit_seconds", "fsync + commit record of gallery changes to the local template store")
+METRICS.counter("fp_frames_total", "Frames read from the scanner")
+METRICS.counter("fp_frames_dropped_total", "Frames not quality-scored, by reason")
+METRICS.counter("fp_split_failures_total", "Failed finger splits, by reason")
+METRICS.counter("fp_identifications_total", "Completed 1:N identifications, by result")
+METRICS.counter("fp_result_cache_total", "1:N result cache lookups, by result (exact, near_duplicate, miss)")
+METRICS.counter("fp_node_requests_total", "HTTP requests to the Node.js server, by endpoint and outcome (status code or error)")
+METRICS.counter("fp_upload_queue_total", "Outbound upload queue events (queued, spilled, sent, rejected, dropped)")
@@ -0,0 +1,268 @@
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common import log_debug, log_error
+from metrics import METRICS
+from transport import JSON_MIMETYPE, MSGPACK_MIMETYPE, msgpack_available
+
+RETRY_STATUSES = (502, 503, 504)
+# Status 4xx yang tetap layak dicoba lagi; 4xx lainnya berarti server menolak isi upload
+RETRYABLE_CLIENT_STATUSES = (408, 429)
+
+class NodeClient:
+    """Klien HTTP ke server Node.js: koneksi keep-alive dipakai bersama (pool), timeout connect/read
+    di setiap permintaan, retry dengan backoff untuk GET (5xx & koneksi gagal) dan respons gzip."""
+
+    def __init__(self, base_url, connect_timeout=3.0, read_timeout=10.0, retries=3, backoff=0.5, pool_size=4):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        # POST tidak diulang di sini: upload diulang oleh UploadQueue dengan Idempotency-Key
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(["GET", "HEAD"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.RequestException:
+            METRICS.get("fp_node_requests_total").inc(endpoint=path, outcome="error")
+            raise
+        METRICS.get("fp_node_requests_total").inc(endpoint=path, outcome=str(response.status_code))
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+def encode_upload(payload):
+    """Body upload: msgpack (bytes mentah) bila tersedia, selain itu JSON dengan bytes sebagai base64; lalu gzip."""
+    if msgpack_available():
+        import msgpack
+        body, content_type = msgpack.packb(payload, use_bin_type=True), MSGPACK_MIMETYPE
+    else:
+        body = json.dumps(payload, default=lambda value: base64.b64encode(value).decode('utf-8')).encode('utf-8')
+        content_type = JSON_MIMETYPE
+    return content_type, gzip.compress(body, compresslevel=1)
+
+class _Upload:
+    __slots__ = ("seq", "key", "path", "payload", "size", "spill_path")
+
+    def __init__(self, seq, key, path, payload, size, spill_path=None):
+        self.seq = seq
+        self.key = key
+        self.path = path
+        self.payload = payload        # dict di memori, atau None bila sudah di-spill ke disk
+        self.size = size
+        self.spill_path = spill_path
+
+class UploadQueue:
+    """Antrean upload keluar ke server Node.js, dikirim berurutan oleh satu background task.
+
+    Item di memori dibatasi max_memory_bytes. Item yang melebihi batas, dan setiap item selama server
+    Node tidak tersedia (termasuk yang sudah mengantre di memori saat pengiriman pertama gagal), di-encode
+    dan ditulis ke spill_dir, lalu dikirim dari sana dengan urutan yang sama. File spill
+    bertahan setelah restart agent dan dibatasi max_spill_bytes (yang tertua dibuang). Kegagalan koneksi
+    dan 5xx diulang dengan backoff eksponensial; setiap upload membawa Idempotency-Key agar pengiriman
+    ulang tidak menggandakan data di server.
+    """
+
+    def __init__(self, client, spill_dir=None, max_memory_bytes=64 << 20, max_spill_bytes=1 << 30,
+                 sleep=time.sleep, run_in_thread=None, retry_delay=1.0, max_retry_delay=60.0):
+        self.client = client
+        self.spill_dir = spill_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._sleep = sleep
+        self._run_in_thread = run_in_thread or (lambda fn, *args: fn(*args))
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._memory_bytes = 0
+        self._spill_bytes = 0
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._running = False
+        self.last_error = None
+        self.stats = {"queued": 0, "sent": 0, "spilled": 0, "dropped": 0, "rejected": 0, "retries": 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._load_spilled()
+
+    # ---------------------------------------------
+    # Sisi produsen
+    # ---------------------------------------------
+    def put(self, key, path, payload, size):
+        """Menambah upload (payload dict berisi bytes, size perkiraan ukurannya). Tidak pernah memblokir pada jaringan."""
+        with self._lock:
+            self._seq += 1
+            item = _Upload(self._seq, key, path, payload, size)
+            spill = self.spill_dir and (self._failures > 0 or self._memory_bytes + size > self.max_memory_bytes)
+            if not spill:
+                self._memory_bytes += size
+                self._items.append(item)
+            self.stats["queued"] += 1
+        METRICS.get("fp_upload_queue_total").inc(event="queued")
+        if spill:
+            # Ditulis ke disk dulu baru masuk antrean, agar worker tidak mengirim item yang sedang di-spill
+            if not self._spill(item):
+                with self._lock: self._memory_bytes += item.size
+            with self._lock: self._items.append(item)
+            while self._spill_bytes > self.max_spill_bytes and self._drop_oldest(spilled_only=True): pass
+        elif not self.spill_dir:
+            while self._memory_bytes > self.max_memory_bytes and len(self._items) > 1 and self._drop_oldest(): pass
+
+    def _spill(self, item):
+        """Menulis item ke spill_dir; True bila berhasil. Penghitung memori diurus pemanggil."""
+        try:
+            content_type, body = self._run_in_thread(encode_upload, item.payload)
+            spill_path = os.path.join(self.spill_dir, f"{item.seq:012d}.upload")
+            header = json.dumps({"key": item.key, "path": item.path, "content_type": content_type}).encode('utf-8')
+            self._run_in_thread(_write_spill_file, spill_path, header, body)
+        except Exception as e:
+            log_error(f"Spilling upload {item.key} to disk failed, keeping it in memory", e)
+            return False
+        with self._lock:
+            item.payload, item.spill_path, item.size = None, spill_path, len(body)
+            self._spill_bytes += item.size
+            self.stats["spilled"] += 1
+        METRICS.get("fp_upload_queue_total").inc(event="spilled")
+        return True
+
+    def _spill_in_memory(self):
+        """Server Node tidak tersedia: item yang masih di memori ditulis ke disk agar bertahan setelah restart."""
+        with self._lock:
+            items = [i for i in self._items if i.spill_path is None]
+        for item in items:
+            size = item.size
+            if not self._spill(item): return
+            with self._lock:
+                # Dibuang oleh _drop_oldest selama ditulis (saat itu masih terhitung di memori)
+                dropped = item not in self._items
+                if dropped: self._spill_bytes -= item.size
+                else: self._memory_bytes -= size
+            if dropped: _remove_file(item.spill_path)
+    def _drop_oldest(self, spilled_only=False):
+        with self._lock:
+            item = next((i for i in self._items if i.spill_path or not spilled_only), None)
+            if item is None: return False
+            self._items.remove(item)
+            self.stats["dropped"] += 1
+        self._forget(item)
+        log_error(f"Upload queue full, dropped {item.key} ({item.size} bytes).")
+        METRICS.get("fp_upload_queue_total").inc(event="dropped")
+        return True
+
+    def _load_spilled(self):
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith(".upload"): continue
+            spill_path = os.path.join(self.spill_dir, name)
+            try:
+                with open(spill_path, 'rb') as f: header = json.loads(f.readline())
+                size = os.path.getsize(spill_path)
+            except (OSError, ValueError) as e:
+                log_error(f"Unreadable spilled upload {name} removed: {e}")
+                _remove_file(spill_path)
+                continue
+            self._seq = max(self._seq, int(name.split(".")[0]))
+            self._items.append(_Upload(self._seq, header["key"], header["path"], None, size, spill_path))
+            self._spill_bytes += size
+        if self._items: log_debug(f"Resuming {len(self._items)} spilled upload(s) from {self.spill_dir}.")
+
+    # ---------------------------------------------
+    # Sisi pengiriman
+    # ---------------------------------------------
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            with self._lock:
+                item = self._items[0] if self._items else None
+            if item is None or time.time() < self._next_attempt:
+                self._sleep(0.2)
+                continue
+            self._send(item)
+
+    def _send(self, item):
+        try:
+            if item.spill_path:
+                content_type, body = self._run_in_thread(_read_spill_file, item.spill_path)
+            else:
+                content_type, body = self._run_in_thread(encode_upload, item.payload)
+            headers = {"Content-Type": content_type, "Content-Encoding": "gzip", "Idempotency-Key": item.key}
+            response = self.client.post(item.path, data=body, headers=headers)
+        except Exception as e:
+            self._retry_later(item, str(e))
+            return
+        if response.status_code >= 500 or response.status_code in RETRYABLE_CLIENT_STATUSES:
+            self._retry_later(item, f"HTTP {response.status_code}")
+            return
+        rejected = response.status_code >= 400
+        if rejected: log_error(f"Node.js server rejected upload {item.key}: HTTP {response.status_code}")
+        else: log_debug(f"Upload {item.key} delivered ({item.size} bytes).")
+        with self._lock:
+            # Bisa saja sudah dibuang oleh _drop_oldest selama dikirim
+            queued = bool(self._items) and self._items[0] is item
+            if queued: self._items.popleft()
+            self.stats["rejected" if rejected else "sent"] += 1
+            self._failures = 0
+            self.last_error = None
+        if queued: self._forget(item)
+        METRICS.get("fp_upload_queue_total").inc(event="rejected" if rejected else "sent")
+
+    def _retry_later(self, item, error):
+        with self._lock:
+            self._failures += 1
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self._failures - 1))
+            self._next_attempt = time.time() + delay
+            self.last_error = error
+            self.stats["retries"] += 1
+            first_failure = self._failures == 1
+        log_error(f"Upload {item.key} failed ({error}); retrying in {delay:.1f}s.")
+        if first_failure and self.spill_dir: self._spill_in_memory()
+
+    def _forget(self, item):
+        with self._lock:
+            if item.spill_path: self._spill_bytes -= item.size
+            else: self._memory_bytes -= item.size
+        if item.spill_path: _remove_file(item.spill_path)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._items), memory_bytes=self._memory_bytes, spill_bytes=self._spill_bytes,
+                        node_available=self._failures == 0, last_error=self.last_error)
+
+def _write_spill_file(spill_path, header, body):
+    with open(f"{spill_path}.tmp", 'wb') as f:
+        f.write(header + b"\n" + body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{spill_path}.tmp", spill_path)
+
+def _read_spill_file(spill_path):
+    with open(spill_path, 'rb') as f:
+        header = json.loads(f.readline())
+        return header["content_type"], f.read()
+
+def _remove_file(path):
+    try: os.remove(path)
+    except OSError: pass
@@ -0,0 +1,108 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from fmr import THUMB_POSITIONS
+
+# Satu kandidat hasil identifikasi top-K
+Candidate = namedtuple("Candidate", ["user_index", "slot", "probe_index", "score"])
+
+class PrefilterIndex:
+    """Indeks kandidat murah di atas field header FMR galeri (jumlah minutiae, posisi jari, kualitas).
+
+    Slot galeri diurutkan berdasarkan jumlah minutiae sehingga kandidat untuk satu probe cukup diambil
+    dengan dua pencarian biner. Indeks dibangun ulang hanya saat generasi galeri berubah.
+    """
+
+    def __init__(self, minutiae_tolerance=0.35, minutiae_slack=6, min_quality=0):
+        self.minutiae_tolerance = minutiae_tolerance
+        self.minutiae_slack = minutiae_slack
+        self.min_quality = min_quality
+        self._lock = threading.Lock()
+        self._generation = None
+        self.stats = {"identifications": 0, "compared": 0, "possible": 0, "audited": 0, "audit_agree": 0, "audit_missed": 0}
+
+    # ---------------------------------------------
+    # Pembangunan indeks
+    # ---------------------------------------------
+    def _ensure_index(self, gallery):
+        with self._lock:
+            if self._generation == gallery.generation: return
+            count = gallery.slot_count
+            live = np.asarray(gallery.live_slots, dtype=np.int64)
+            # Slice array() menghasilkan salinan, jadi galeri tetap bebas menambah slot
+            minutiae = np.frombuffer(gallery.slot_minutiae[:count], dtype=np.uint8)[live]
+            order = np.argsort(minutiae, kind='stable')
+            self._sorted_slots = live[order]
+            self._sorted_minutiae = minutiae[order]
+            self._position = np.frombuffer(gallery.slot_position[:count], dtype=np.uint8)
+            self._quality = np.frombuffer(gallery.slot_quality[:count], dtype=np.uint8)
+            self._owner = np.frombuffer(gallery.slot_owner[:count], dtype=np.int32)
+            self._generation = gallery.generation
+
+    # ---------------------------------------------
+    # Pencarian kandidat
+    # ---------------------------------------------
+    def candidates(self, gallery, probe_header, exclude_thumbs=False):
+        """Slot galeri (urut naik) yang layak dibandingkan dengan probe dengan header probe_header."""
+        self._ensure_index(gallery)
+        minutiae = probe_header.minutiae_count
+        if minutiae:
+            spread = max(self.minutiae_slack, int(minutiae * self.minutiae_tolerance))
+            lo = np.searchsorted(self._sorted_minutiae, max(1, minutiae - spread), side='left')
+            hi = np.searchsorted(self._sorted_minutiae, minutiae + spread, side='right')
+            # Slot tanpa header FMR (minutiae 0) tidak bisa dipangkas
+            unknown = np.searchsorted(self._sorted_minutiae, 1, side='left')
+            slots = np.concatenate((self._sorted_slots[:unknown], self._sorted_slots[lo:hi]))
+        else:
+            slots = self._sorted_slots
+
+        keep = np.ones(len(slots), dtype=bool)
+        positions = self._position[slots]
+        if probe_header.finger_position:
+            keep &= (positions == 0) | (positions == probe_header.finger_position)
+        if exclude_thumbs:
+            keep &= ~np.isin(positions, THUMB_POSITIONS)
+        if self.min_quality:
+            qualities = self._quality[slots]
+            keep &= (qualities == 0) | (qualities >= self.min_quality)
+        return np.sort(slots[keep])
+
+    def rank(self, candidates, scores, k):
+        """Skor terbaik per user, diurutkan menurun dan dipotong ke k kandidat."""
+        best = {}
+        for probe_index, (slots, probe_scores) in enumerate(zip(candidates, scores)):
+            if len(slots) == 0: continue
+            owners = self._owner[slots]
+            for slot, owner, score in zip(slots.tolist(), owners.tolist(), probe_scores):
+                if owner < 0: continue
+                current = best.get(owner)
+                if current is None or score > current.score:
+                    best[owner] = Candidate(owner, slot, probe_index, score)
+        return sorted(best.values(), key=lambda c: (-c.score, c.slot))[:k]
+
+    # ---------------------------------------------
+    # Metrik pemangkasan & akurasi
+    # ---------------------------------------------
+    def record(self, compared, possible):
+        with self._lock:
+            self.stats["identifications"] += 1
+            self.stats["compared"] += compared
+            self.stats["possible"] += possible
+
+    def record_audit(self, pruned_top, full_top, threshold):
+        """Membandingkan top-1 hasil prefilter dengan pemindaian penuh pada identifikasi yang sama."""
+        pruned_user = pruned_top.user_index if pruned_top and pruned_top.score > threshold else None
+        full_user = full_top.user_index if full_top and full_top.score > threshold else None
+        with self._lock:
+            self.stats["audited"] += 1
+            if pruned_user == full_user: self.stats["audit_agree"] += 1
+            elif full_user is not None: self.stats["audit_missed"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pruning_ratio"] = 1 - stats["compared"] / stats["possible"] if stats["possible"] else 0.0
+        stats["audit_accuracy_loss"] = stats["audit_missed"] / stats["audited"] if stats["audited"] else 0.0
+        return stats
@@ -0,0 +1,180 @@
+import base64
+import threading
+import time
+
+from common import log_error
+
+PREVIEW_MIN_WIDTH = 160
+PREVIEW_ACK_TIMEOUT = 1.0  # Detik; klien yang sudah pernah mengirim ack tetap dilayani setelah batas ini
+
+def encode_jpeg(frame, width, height, quality):
+    """Resize + JPEG encode (cv2 melepas GIL, aman dijalankan di thread pekerja)."""
+    import cv2
+    resized = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok: raise Exception("Encode JPEG preview gagal")
+    return buffer.tobytes()
+
+class _PreviewClient:
+    def __init__(self, max_width, fps, binary=False):
+        self.max_width = max_width
+        self.width = max_width
+        self.fps = fps
+        self.binary = binary
+        self.acked = False  # Sudah pernah mengakui frame; sebelum itu hanya cadence fps biasa
+        self.last_sent = 0.0
+        self.in_flight_since = None
+        self.rtt = 0.0
+
+    def due_in(self, now):
+        """Detik sampai klien boleh dikirimi frame berikutnya (<= 0: sekarang)."""
+        wait = self.last_sent + max(1.0 / self.fps, self.rtt) - now
+        # Klien lama tidak pernah mengirim ack: gating ack hanya untuk klien yang sudah terbukti mengirimnya
+        if self.acked and self.in_flight_since is not None: wait = max(wait, self.in_flight_since + PREVIEW_ACK_TIMEOUT - now)
+        return wait
+
+    def adapt(self, rtt):
+        """Menurunkan resolusi saat klien lambat mengakui frame, menaikkannya kembali saat lancar."""
+        self.rtt = rtt
+        interval = 1.0 / self.fps
+        if rtt > 2 * interval:
+            self.width = max(PREVIEW_MIN_WIDTH, int(self.width * 0.75))
+        elif rtt < 0.5 * interval:
+            self.width = min(self.max_width, int(self.width * 1.25))
+
+class PreviewPublisher:
+    """Tahap live preview terpisah dari loop capture.
+
+    Loop capture hanya memanggil submit(); hanya frame terbaru yang disimpan (frame lama dibuang).
+    run() berjalan sebagai background task yang dibangunkan oleh frame baru atau ack, meng-encode JPEG
+    di thread pekerja dan mengirim ke setiap klien sesuai fps/resolusi dan kecepatan ack klien tersebut.
+    Klien baru menerima format lama (data URL base64) sampai meminta binary lewat preview_settings.
+    """
+
+    def __init__(self, emit, run_in_thread=None, encoder=encode_jpeg, max_width=400, default_fps=10, jpeg_quality=70):
+        self._emit = emit
+        self._run_in_thread = run_in_thread or (lambda fn, *args: fn(*args))
+        self._encoder = encoder
+        self.max_width = max_width
+        self.default_fps = default_fps
+        self.jpeg_quality = jpeg_quality
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()  # Frame baru, ack, klien baru atau stop()
+        self._latest = None
+        self._latest_seq = 0
+        self._taken_seq = 0
+        self._running = False
+        self.stats = {"submitted": 0, "skipped": 0, "dropped": 0, "encoded": 0, "sent": 0}
+
+    # ---------------------------------------------
+    # Registrasi klien
+    # ---------------------------------------------
+    def add_client(self, sid, settings=None):
+        with self._lock:
+            self._clients[sid] = _PreviewClient(self.max_width, self.default_fps)
+        if settings: self.update_client(sid, settings)
+        self._wakeup.set()
+
+    def update_client(self, sid, settings):
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None: return False
+            if "fps" in settings: client.fps = min(30.0, max(0.5, float(settings["fps"])))
+            if "max_width" in settings:
+                client.max_width = min(self.max_width, max(PREVIEW_MIN_WIDTH, int(settings["max_width"])))
+                client.width = client.max_width
+            if "binary" in settings: client.binary = bool(settings["binary"])
+            return True
+
+    def remove_client(self, sid):
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    def has_clients(self):
+        return bool(self._clients)
+
+    # ---------------------------------------------
+    # Sisi capture
+    # ---------------------------------------------
+    def submit(self, frame):
+        """Menyimpan frame terbaru (ndarray 2D). Dipanggil dari loop capture; tidak pernah meng-encode."""
+        if not self._clients:
+            self.stats["skipped"] += 1
+            return
+        # Salinan kecil yang sudah di-downsample: buffer frame capture dipakai ulang
+        step = max(1, frame.shape[1] // self.max_width)
+        small = frame[::step, ::step].copy()
+        with self._lock:
+            if self._latest_seq > self._taken_seq: self.stats["dropped"] += 1
+            self._latest = small
+            self._latest_seq += 1
+            self.stats["submitted"] += 1
+        self._wakeup.set()
+
+    # ---------------------------------------------
+    # Sisi pengiriman
+    # ---------------------------------------------
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+    def run(self):
+        self._running = True
+        while self._running:
+            # clear() sebelum memeriksa pekerjaan: set() yang datang sesudahnya tidak terlewat
+            self._wakeup.clear()
+            work, wait = self._take_work()
+            if work is None:
+                self._wakeup.wait(wait)
+                continue
+            frame, seq, clients = work
+            try:
+                self._publish(frame, seq, clients)
+            except Exception as e:
+                log_error("Live preview publish failed", e)
+
+    def _take_work(self):
+        """(frame, seq, klien jatuh tempo), atau (None, detik menunggu; None = sampai dibangunkan)."""
+        now = time.time()
+        with self._lock:
+            if self._latest is None or self._latest_seq == self._taken_seq or not self._clients: return None, None
+            waits = {sid: c.due_in(now) for sid, c in self._clients.items()}
+            due = [(sid, self._clients[sid]) for sid, wait in waits.items() if wait <= 0]
+            if not due: return None, min(waits.values())
+            self._taken_seq = self._latest_seq
+            return (self._latest, self._latest_seq, due), None
+
+    def _publish(self, frame, seq, clients):
+        src_h, src_w = frame.shape[:2]
+        encoded = {}
+        for sid, client in clients:
+            width = min(client.width, src_w)
+            if width not in encoded:
+                height = max(1, round(width * src_h / src_w))
+                encoded[width] = (self._run_in_thread(self._encoder, frame, width, height, self.jpeg_quality), height)
+                self.stats["encoded"] += 1
+            jpeg, height = encoded[width]
+            sent_at = time.time()
+            client.last_sent = sent_at
+            if client.binary:
+                client.in_flight_since = sent_at
+                self._emit('live_preview', {'image': jpeg, 'format': 'jpeg', 'width': width, 'height': height, 'seq': seq},
+                           to=sid, callback=self._ack_callback(client, sent_at))
+            else:
+                self._emit('live_preview', {'image_data': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('utf-8')}, to=sid)
+            self.stats["sent"] += 1
+
+    def _ack_callback(self, client, sent_at):
+        def on_ack(*_):
+            client.acked = True
+            client.in_flight_since = None
+            client.adapt(time.time() - sent_at)
+            self._wakeup.set()
+        return on_ack
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["clients"] = {sid: {"fps": c.fps, "width": c.width, "binary": c.binary, "acked": c.acked, "rtt": round(c.rtt, 4)} for sid, c in self._clients.items()}
+        return stats
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+# kind: "exact" (hash probe identik) atau "near_duplicate" (capture ulang jari yang sama)
+CacheHit = namedtuple("CacheHit", ["kind", "payload", "age"])
+_RecentProbe = namedtuple("_RecentProbe", ["time", "params", "probes", "key"])
+
+def template_hash(template):
+    """Hash konten template (BLAKE2b 128-bit, hex): identitas template tanpa membandingkan byte per byte."""
+    return hashlib.blake2b(bytes(template), digest_size=16).hexdigest()
+
+def probe_key(hashes, *params):
+    """Kunci satu permintaan identifikasi: himpunan hash probe (urutan jari diabaikan) + parameter mode."""
+    material = "|".join(sorted(hashes)) + "#" + "|".join(str(p) for p in params)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()
+
+class ResultCache:
+    """LRU hasil identifikasi 1:N per (hash probe, generasi galeri).
+
+    Seluruh isi dibuang saat generasi galeri berubah, jadi hasil tidak pernah basi terhadap galeri.
+    Capture ulang jari yang sama tidak menghasilkan byte yang identik; untuk itu probe dari
+    permintaan terakhir (dalam near_duplicate_window detik) dibandingkan 1:1 dengan probe baru.
+    Bila setiap probe baru cocok dengan skor >= near_duplicate_score, hasil sebelumnya dipakai ulang.
+    Beberapa perbandingan 1:1 jauh lebih murah daripada memindai seluruh galeri.
+
+    lookup() boleh dipanggil dari thread pekerja; dengan eventlet berikan threading_module asli
+    (eventlet.patcher.original('threading')) agar lock-nya bukan lock hijau.
+    """
+
+    def __init__(self, capacity=256, near_duplicate_window=60.0, near_duplicate_score=80, recent_size=8, threading_module=threading):
+        self.capacity = capacity
+        self.near_duplicate_window = near_duplicate_window
+        self.near_duplicate_score = near_duplicate_score
+        self.generation = None
+        self._entries = OrderedDict()  # kunci probe -> payload identification_result
+        self._recent = deque(maxlen=recent_size)
+        self._lock = threading_module.Lock()
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _sync_generation_locked(self, generation):
+        if generation == self.generation: return
+        if self._entries: self.stats["invalidations"] += 1
+        self._entries.clear()
+        self._recent.clear()
+        self.generation = generation
+
+    def lookup(self, probes, params, generation, compare=None):
+        """Mengembalikan (kunci, CacheHit atau None). compare(a, b) -> skor mengaktifkan deteksi near-duplicate."""
+        key = probe_key([template_hash(p) for p in probes], *params)
+        now = time.time()
+        with self._lock:
+            self._sync_generation_locked(generation)
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return key, CacheHit("exact", payload, None)
+            recent = [r for r in reversed(self._recent)
+                      if now - r.time <= self.near_duplicate_window and r.params == params and len(r.probes) == len(probes)]
+
+        if compare is not None:
+            for entry in recent:
+                if not self._is_near_duplicate(probes, entry.probes, compare): continue
+                with self._lock:
+                    payload = self._entries.get(entry.key) if generation == self.generation else None
+                    if payload is None: continue
+                    self.stats["near_hits"] += 1
+                return key, CacheHit("near_duplicate", payload, round(now - entry.time, 3))
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return key, None
+
+    def _is_near_duplicate(self, probes, previous, compare):
+        remaining = list(previous)
+        for probe in probes:
+            match = next((p for p in remaining if compare(probe, p) >= self.near_duplicate_score), None)
+            if match is None: return False
+            remaining.remove(match)
+        return True
+
+    def store(self, key, probes, params, generation, payload):
+        with self._lock:
+            # Galeri berubah selama pemindaian: hasilnya mungkin sudah tidak berlaku
+            if generation != self.generation: return
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._recent.append(_RecentProbe(time.time(), params, [bytes(p) for p in probes], key))
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["near_hits"] + self.stats["misses"]
+            hit_rate = (self.stats["hits"] + self.stats["near_hits"]) / lookups if lookups else 0.0
+            return dict(self.stats, entries=len(self._entries), generation=self.generation, hit_rate=round(hit_rate, 4))
+
+class ScoreCache:
+    """LRU skor perbandingan 1:1 per pasangan hash template (match_templates manual)."""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_compute(self, template1, template2, compare):
+        key = (template_hash(template1), template_hash(template2))
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+                self.stats["hits"] += 1
+                return score, True
+            self.stats["misses"] += 1
+        score = compare(template1, template2)
+        with self._lock:
+            self._scores[key] = score
+            while len(self._scores) > self.capacity: self._scores.popitem(last=False)
+        return score, False
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._scores))
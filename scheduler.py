@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from enum import Enum
+
+from common import log_debug, log_error
+
+class JobState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+FINISHED_STATES = (JobState.SUCCEEDED, JobState.FAILED, JobState.CANCELLED)
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, kind, fn, args, options=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.options = options or {}
+        self.state = JobState.QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self._fn = fn
+        self._args = args
+        self._done = threading.Event()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state.value,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobScheduler:
+    """Penjadwal job perangkat: capture, enroll dan identify dijalankan satu per satu oleh satu worker.
+
+    Job memegang scanner secara eksklusif, jadi eksekusi berurutan; permintaan berikutnya masuk
+    antrean (dibatasi per jenis) alih-alih ditolak. fn(job, *args) mengembalikan False bila gagal;
+    pembatalan bersifat kooperatif lewat job.cancelled. on_update dipanggil setiap perubahan status.
+    """
+
+    def __init__(self, on_update=None, queue_limits=None, history=100):
+        self.on_update = on_update or (lambda job: None)
+        self.queue_limits = queue_limits or {}
+        self.history = history
+        self.current = None
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def submit(self, kind, fn, *args, options=None, exclusive=False):
+        """Menambah job ke antrean. exclusive=True menolak job bila ada job lain yang aktif/mengantre."""
+        with self._lock:
+            active = [j for j in self._jobs.values() if j.state in (JobState.QUEUED, JobState.RUNNING)]
+            if exclusive and active: raise QueueFull("Proses lain sedang berjalan.")
+            limit = self.queue_limits.get(kind)
+            if limit is not None and sum(1 for j in active if j.kind == kind and j.state is JobState.QUEUED) >= limit:
+                raise QueueFull(f"Antrean {kind} penuh.")
+            job = Job(kind, fn, args, options)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.state not in FINISHED_STATES: break
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        log_debug(f"Job {job.id} ({kind}) queued; {self.queued_count()} job(s) waiting.")
+        self.on_update(job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.state in FINISHED_STATES: return False
+        job.cancel()
+        if job.state is JobState.QUEUED: self._finish(job, JobState.CANCELLED)
+        return True
+
+    def queued_count(self):
+        return sum(1 for j in list(self._jobs.values()) if j.state is JobState.QUEUED)
+
+    @property
+    def busy(self):
+        return self.current is not None or self.queued_count() > 0
+
+    def stop(self):
+        self._running = False
+        self._queue.put(None)
+
+    def run(self):
+        """Loop worker (background task). Menunggu job tanpa polling."""
+        self._running = True
+        while self._running:
+            job = self._queue.get()
+            if job is None or job.state is not JobState.QUEUED: continue
+            self.current = job
+            job.state = JobState.RUNNING
+            job.started = time.time()
+            self.on_update(job)
+            try:
+                ok = job._fn(job, *job._args)
+                if job.cancelled: final = JobState.CANCELLED
+                else: final = JobState.FAILED if ok is False else JobState.SUCCEEDED
+            except Exception as e:
+                log_error(f"Job {job.id} ({job.kind}) crashed", e)
+                job.error = str(e)
+                final = JobState.FAILED
+            self.current = None
+            self._finish(job, final)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        job._done.set()
+        log_debug(f"Job {job.id} ({job.kind}) {state.value}.")
+        self.on_update(job)
+
+    def get_status(self):
+        return {"current": self.current.to_dict() if self.current else None, "queued": self.queued_count()}
+
+    def list_jobs(self):
+        return [job.to_dict() for job in reversed(list(self._jobs.values()))]
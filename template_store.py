@@ -0,0 +1,256 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+from common import FMR_TEMPLATE_SIZE, log_debug, log_error
+from metrics import METRICS
+
+STORE_MAGIC = b"FPTS"
+STORE_FORMAT_VERSION = 1
+DATA_OFFSET = 4096     # Header satu halaman; slot template dimulai selaras halaman
+SLOT_META_SIZE = 4     # Per slot di .idx: urutan jari, posisi, kualitas, jumlah minutiae
+_HEADER = struct.Struct("<4sHHI")  # magic, versi format, ukuran slot, generasi (+ CRC32 4 byte)
+
+# Isi store pada commit terakhir. slot_meta: SLOT_META_SIZE byte per slot;
+# users: [id_number, name, slot_awal, jumlah_slot] dalam urutan pendaftaran.
+StoredGallery = namedtuple("StoredGallery", ["buffer", "slot_count", "slot_meta", "users", "version", "etag"])
+
+class StoreCorrupted(Exception):
+    pass
+
+def _pack_header(generation):
+    header = _HEADER.pack(STORE_MAGIC, STORE_FORMAT_VERSION, FMR_TEMPLATE_SIZE, generation)
+    return header + struct.pack("<I", zlib.crc32(header))
+
+def _check_header(raw, generation):
+    # File terpotong (crash saat membuat generasi) harus berakhir di StoreCorrupted, bukan struct.error
+    if len(raw) < _HEADER.size + 4: raise StoreCorrupted(f"Header terpotong ({len(raw)} byte)")
+    header, (crc,) = raw[:_HEADER.size], struct.unpack_from("<I", raw, _HEADER.size)
+    if zlib.crc32(header) != crc: raise StoreCorrupted("Checksum header tidak cocok")
+    magic, version, slot_size, file_generation = _HEADER.unpack(header)
+    if magic != STORE_MAGIC: raise StoreCorrupted("Bukan file template store")
+    if version != STORE_FORMAT_VERSION: raise StoreCorrupted(f"Versi format {version} tidak didukung")
+    if slot_size != FMR_TEMPLATE_SIZE: raise StoreCorrupted(f"Ukuran slot {slot_size} tidak cocok")
+    if file_generation != generation: raise StoreCorrupted(f"Generasi file {file_generation} != {generation}")
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+class TemplateStore:
+    """Galeri template persisten di disk, di-mmap sehingga siap dipakai saat startup tanpa server Node.js.
+
+    Satu generasi terdiri dari tiga file: .dat (header + slot FMR 1024 byte, di-mmap dan dibaca
+    langsung oleh matcher), .idx (metadata slot berukuran tetap) dan .log (JSON per baris: put/del
+    user dan record commit). Perubahan ditambahkan di ujung; slot lama tidak pernah ditimpa.
+    Saat commit, data & indeks di-fsync lebih dulu baru record commit ditulis, sehingga setelah
+    crash store kembali ke commit utuh terakhir. Muat ulang penuh dan kompaksi menulis generasi
+    baru; file CURRENT menunjuk generasi aktif dan hanya diganti secara atomik.
+
+    Tidak thread-safe: dipanggil oleh GalleryCache dengan lock-nya terkunci.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.committed_generation = self._read_current()
+        self.generation = None
+        self.committed_slots = 0
+        self._dat = self._idx = self._log = None
+        self._mmap = None
+        self._capacity = 0
+        self._pending = []
+        self._fresh = False
+        self._remove_stale_files()
+
+    def _path(self, generation, ext):
+        return os.path.join(self.directory, f"store-{generation:06d}.{ext}")
+
+    def _read_current(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT"), 'r', encoding='utf-8') as f:
+                return int(json.load(f)["generation"])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            log_error(f"Template store CURRENT file is unreadable, starting empty: {e}")
+            return None
+
+    def _write_current(self, generation):
+        path = os.path.join(self.directory, "CURRENT")
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({"format": STORE_FORMAT_VERSION, "generation": generation}, f)
+            _fsync(f)
+        os.replace(f"{path}.tmp", path)
+
+    def _remove_stale_files(self):
+        for name in os.listdir(self.directory):
+            if not name.startswith("store-"): continue
+            try: generation = int(name[6:].split(".")[0])
+            except ValueError: continue
+            if generation in (self.committed_generation, self.generation): continue
+            try: os.remove(os.path.join(self.directory, name))
+            except OSError: pass  # Windows: masih di-mmap oleh snapshot lama, dihapus pada startup berikutnya
+
+    # ---------------------------------------------
+    # Pemuatan saat startup
+    # ---------------------------------------------
+    def load(self):
+        """Memetakan generasi aktif. Mengembalikan StoredGallery, atau None bila store kosong/rusak."""
+        generation = self.committed_generation
+        if generation is None: return None
+        try:
+            with METRICS.time("fp_gallery_store_load_seconds"):
+                return self._load(generation)
+        except (OSError, StoreCorrupted) as e:
+            log_error(f"Template store generation {generation} is unusable, waiting for a full sync: {e}")
+            self._close()
+            self.committed_generation = None
+            self.generation = generation  # Dihapus & dilewati oleh begin_generation berikutnya
+            return None
+
+    def _load(self, generation):
+        self._dat = open(self._path(generation, "dat"), 'r+b')
+        _check_header(self._dat.read(_HEADER.size + 4), generation)
+        self._idx = open(self._path(generation, "idx"), 'r+b')
+        self._log = open(self._path(generation, "log"), 'r+b')
+
+        users, slot_count, version, etag, end = self._replay_log()
+        self._log.truncate(end)  # Buang ekor yang belum di-commit (crash di tengah penulisan)
+        self._log.seek(end)
+
+        size = os.fstat(self._dat.fileno()).st_size
+        self._capacity = (size - DATA_OFFSET) // FMR_TEMPLATE_SIZE
+        slot_meta = self._idx.read(slot_count * SLOT_META_SIZE)
+        if slot_count > self._capacity or len(slot_meta) != slot_count * SLOT_META_SIZE:
+            raise StoreCorrupted(f"Commit menunjuk {slot_count} slot, file hanya memuat {self._capacity}")
+        if any(start + count > slot_count for _, _, start, count in users):
+            raise StoreCorrupted("Indeks user menunjuk slot di luar commit")
+
+        self._mmap = mmap.mmap(self._dat.fileno(), size) if self._capacity else None
+        self.generation = generation
+        self.committed_slots = slot_count
+        self._pending = []
+        self._fresh = False
+        log_debug(f"Template store generation {generation} mapped: {len(users)} user(s), {slot_count} slot(s).")
+        return StoredGallery(self.buffer, slot_count, slot_meta, users, version, etag)
+
+    def _replay_log(self):
+        users = {}
+        ops = []
+        slot_count, version, etag, end, offset = 0, None, None, 0, 0
+        self._log.seek(0)
+        for line in self._log:
+            offset += len(line)
+            if not line.endswith(b"\n"): break
+            try: record = json.loads(line)
+            except ValueError: break
+            if record[0] != "commit":
+                ops.append(record)
+                continue
+            for op in ops:
+                if op[0] == "snapshot": users = {user[0]: user for user in op[1]}
+                elif op[0] == "put": users[op[1]] = op[1:]
+                elif op[0] == "del": users.pop(op[1], None)
+            ops = []
+            _, slot_count, version, etag = record
+            end = offset
+        return list(users.values()), slot_count, version, etag, end
+
+    # ---------------------------------------------
+    # Penulisan (dipanggil dengan lock GalleryCache)
+    # ---------------------------------------------
+    @property
+    def buffer(self):
+        if self._mmap is None: return memoryview(bytearray(0))
+        return memoryview(self._mmap)[DATA_OFFSET:DATA_OFFSET + self._capacity * FMR_TEMPLATE_SIZE]
+
+    def begin_generation(self, capacity):
+        """Generasi baru (muat ulang penuh/kompaksi). Generasi lama tetap aktif sampai commit."""
+        self._close()
+        if self.generation is not None and self.generation != self.committed_generation:
+            self._remove_generation(self.generation)
+        self.generation = max(self.generation or 0, self.committed_generation or 0) + 1
+        with open(self._path(self.generation, "dat"), 'wb') as f:
+            f.write(_pack_header(self.generation))
+        self._dat = open(self._path(self.generation, "dat"), 'r+b')
+        self._idx = open(self._path(self.generation, "idx"), 'w+b')
+        self._log = open(self._path(self.generation, "log"), 'w+b')
+        self._capacity = 0
+        self._map(max(capacity, 1))
+        self.committed_slots = 0
+        self._pending = []
+        self._fresh = True
+        return self.buffer
+
+    def grow(self, slot_count):
+        """Memperbesar file .dat dan memetakannya ulang. Mapping lama tidak ditutup: snapshot yang
+        masih memegangnya tetap valid, dan slot yang sudah ada tidak pernah berubah."""
+        if slot_count > self._capacity: self._map(max(slot_count, self._capacity * 2))
+        return self.buffer
+
+    def _map(self, capacity):
+        length = DATA_OFFSET + capacity * FMR_TEMPLATE_SIZE
+        # Di Windows mmap sendiri yang memperbesar file; ftruncate ditolak selama file masih di-mmap
+        if os.name != 'nt': os.ftruncate(self._dat.fileno(), length)
+        self._mmap = mmap.mmap(self._dat.fileno(), length)
+        self._capacity = capacity
+
+    def record_put(self, id_number, name, start, slot_meta):
+        """Slot [start, start + n) sudah ditulis ke buffer; catat metadata & pemiliknya."""
+        self._idx.seek(start * SLOT_META_SIZE)
+        self._idx.write(slot_meta)
+        self._pending.append(["put", id_number, name, start, len(slot_meta) // SLOT_META_SIZE])
+
+    def record_delete(self, id_number):
+        self._pending.append(["del", id_number])
+
+    def commit(self, slot_count, version, etag):
+        """Menjadikan semua perubahan sejak commit sebelumnya tahan crash."""
+        if self.generation is None: return
+        with METRICS.time("fp_gallery_store_commit_seconds"):
+            if self._mmap is not None: self._mmap.flush()
+            _fsync(self._idx)
+            if self._fresh:
+                # Generasi baru ditulis sebagai satu snapshot: startup cukup satu json.loads
+                users = {}
+                for op in self._pending:
+                    if op[0] == "put": users[op[1]] = op[1:]
+                    else: users.pop(op[1], None)
+                self._pending = [["snapshot", list(users.values())]]
+            lines = [json.dumps(op, separators=(',', ':')) for op in self._pending]
+            lines.append(json.dumps(["commit", slot_count, version, etag], separators=(',', ':')))
+            self._log.write(("\n".join(lines) + "\n").encode('utf-8'))
+            _fsync(self._log)
+            if self._fresh:
+                self._write_current(self.generation)
+                previous, self.committed_generation = self.committed_generation, self.generation
+                if previous is not None: self._remove_generation(previous)
+                self._fresh = False
+        self._pending = []
+        self.committed_slots = slot_count
+
+    def _remove_generation(self, generation):
+        for ext in ("dat", "idx", "log"):
+            try: os.remove(self._path(generation, ext))
+            except OSError: pass  # Lihat _remove_stale_files
+
+    def _close(self):
+        # mmap sengaja tidak di-close: buffer snapshot galeri mungkin masih merujuknya
+        for f in (self._dat, self._idx, self._log):
+            if f is not None: f.close()
+        self._dat = self._idx = self._log = None
+        self._mmap = None
+        self._capacity = 0
+
+    def get_stats(self):
+        return {
+            "directory": self.directory,
+            "generation": self.committed_generation,
+            "slots": self.committed_slots,
+            "capacity": self._capacity,
+            "pending_ops": len(self._pending),
+        }
@@ -0,0 +1,155 @@
+"""Protokol sinkronisasi galeri (ETag, ?since=, delta + deleted) terhadap server HTTP pengganti Node.js.
+
+Jalankan: python -m pytest tests
+"""
+import base64
+import json
+import os
+import random
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import FMR_TEMPLATE_SIZE
+from gallery import GalleryCache
+
+def make_user(rng, id_number, fingers=2):
+    combined = rng.getrandbits(8 * FMR_TEMPLATE_SIZE * fingers).to_bytes(FMR_TEMPLATE_SIZE * fingers, 'little')
+    return {"name": f"user {id_number}", "id_number": id_number, "combined_template_base64": base64.b64encode(combined).decode()}
+
+class StandInNode:
+    """/get-all-templates seperti server Node.js: ETag per versi, 304, delta dengan deleted bila ?since= dikirim."""
+
+    def __init__(self):
+        self.version = 1
+        self.users = {}
+        self.changes = []  # (versi, id_number, dihapus)
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                since = parse_qs(url.query).get("since", [None])[0]
+                server.requests.append({"path": url.path, "since": since, "if_none_match": self.headers.get("If-None-Match")})
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                if since is None:
+                    body = {"success": True, "version": server.version, "data": list(server.users.values())}
+                else:
+                    changed = {id_number: deleted for version, id_number, deleted in server.changes if version > int(since)}
+                    body = {"success": True, "delta": True, "version": server.version,
+                            "data": [server.users[i] for i, deleted in changed.items() if not deleted],
+                            "deleted": [i for i, deleted in changed.items() if deleted]}
+                raw = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.send_header("ETag", server.etag)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def etag(self):
+        return f'"v{self.version}"'
+
+    def put(self, user):
+        self.version += 1
+        self.users[user["id_number"]] = user
+        self.changes.append((self.version, user["id_number"], False))
+
+    def delete(self, id_number):
+        self.version += 1
+        del self.users[id_number]
+        self.changes.append((self.version, id_number, True))
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class GallerySyncTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(5)
+        self.node = StandInNode()
+        for id_number in ("a", "b", "c"): self.node.put(make_user(self.rng, id_number))
+        self.cache = GalleryCache(self.node.url)
+
+    def tearDown(self):
+        self.node.close()
+
+    def ids(self):
+        return sorted(u["id_number"] for u in self.cache.snapshot().users if u is not None)
+
+    def test_full_sync_then_not_modified(self):
+        self.assertTrue(self.cache.sync())
+        self.assertEqual(self.ids(), ["a", "b", "c"])
+        self.assertEqual(len(self.cache.snapshot().live_slots), 6)
+        generation = self.cache.generation
+
+        self.assertFalse(self.cache.sync())
+        last = self.node.requests[-1]
+        self.assertEqual(last["if_none_match"], self.node.etag)
+        self.assertEqual(last["since"], str(self.node.version))
+        self.assertEqual(self.cache.generation, generation)
+        self.assertIsNotNone(self.cache.last_sync)
+
+    def test_delta_with_deletions(self):
+        self.cache.sync()
+        old_c = bytes(self.cache.snapshot().buffer[4 * FMR_TEMPLATE_SIZE:5 * FMR_TEMPLATE_SIZE])
+        self.node.delete("b")
+        updated_c = make_user(self.rng, "c", fingers=3)
+        self.node.put(updated_c)
+        self.node.put(make_user(self.rng, "d"))
+
+        self.assertTrue(self.cache.sync())
+        self.assertIsNotNone(self.node.requests[-1]["since"])
+        self.assertEqual(self.ids(), ["a", "c", "d"])
+        self.assertEqual(self.cache.version, self.node.version)
+
+        gallery = self.cache.snapshot()
+        c_index = next(i for i, u in enumerate(gallery.users) if u is not None and u["id_number"] == "c")
+        c_slots = [s for s in gallery.live_slots if gallery.slot_owner[s] == c_index]
+        self.assertEqual(len(c_slots), 3)
+        stored = b"".join(bytes(gallery.buffer[s * FMR_TEMPLATE_SIZE:(s + 1) * FMR_TEMPLATE_SIZE]) for s in c_slots)
+        self.assertEqual(stored, base64.b64decode(updated_c["combined_template_base64"]))
+        self.assertNotIn(old_c, [bytes(gallery.buffer[s * FMR_TEMPLATE_SIZE:(s + 1) * FMR_TEMPLATE_SIZE]) for s in gallery.live_slots])
+        self.assertEqual(len(gallery.live_slots), 2 + 3 + 2)
+
+    def test_decode_runs_in_thread_hook(self):
+        calls = []
+        cache = GalleryCache(self.node.url, run_in_thread=lambda fn, *args: calls.append(fn.__name__) or fn(*args))
+        cache.sync()
+        self.assertEqual(calls, ["decode_response", "_build_index"])
+
+    def test_old_snapshot_unchanged_by_delta(self):
+        self.cache.sync()
+        old = self.cache.snapshot()
+        owners, users, live = list(old.slot_owner), list(old.users), old.live_slots
+        self.node.delete("a")
+        self.node.put(make_user(self.rng, "b", fingers=3))
+        self.node.put(make_user(self.rng, "e"))
+
+        self.assertTrue(self.cache.sync())
+        self.assertEqual(list(old.slot_owner), owners)
+        self.assertEqual(old.users, users)
+        self.assertEqual(old.live_slots, live)
+        self.assertEqual(old.slot_count, 6)
+        new = self.cache.snapshot()
+        self.assertIsNot(new.slot_owner, old.slot_owner)
+        self.assertGreater(new.generation, old.generation)
+
+if __name__ == "__main__":
+    unittest.main()
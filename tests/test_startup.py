@@ -0,0 +1,71 @@
+"""Cold start agent di atas ReplayBackend: /api/health menjawab selama inisialisasi perangkat, /api/ready 200 dalam batas waktu.
+
+Jalankan: python -m pytest tests
+"""
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_pipeline import build_replay_file
+from bench_startup import poll
+from bench_store import make_user
+from gallery import GalleryCache
+from template_store import TemplateStore
+
+INIT_DELAY = 1.5         # Detik LIVESCAN_Init replay memblokir
+READY_LIMIT = 20.0       # Batas proses dijalankan -> /api/ready 200
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        directory = self.directory.name
+        store_dir = os.path.join(directory, "store")
+        GalleryCache(None, store=TemplateStore(store_dir)).load_users([make_user(random.Random(11), i, 2) for i in range(50)])
+        replay_path = os.path.join(directory, "frames.raw")
+        build_replay_file(replay_path, 2)
+        port = free_port()
+        self.base = f"http://127.0.0.1:{port}/api"
+        env = dict(os.environ, FP_BACKEND="replay", FP_REPLAY_PATH=replay_path, FP_TEMPLATE_STORE=store_dir, FP_ENROLLMENT_UPLOAD="0",
+                   FP_ENROLLMENT_SPILL=os.path.join(directory, "spill"), FP_PORT=str(port), FP_REPLAY_INIT_DELAY=str(INIT_DELAY),
+                   PYTHONDONTWRITEBYTECODE="1")
+        self.agent = subprocess.Popen([sys.executable, os.path.join(ROOT, "local_agent.py")], env=env, cwd=directory,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def tearDown(self):
+        self.agent.terminate()
+        self.agent.wait()
+        self.directory.cleanup()
+
+    def test_health_during_device_init_and_ready_within_limit(self):
+        started = time.perf_counter()
+        seconds, report = poll(f"{self.base}/health", started, READY_LIMIT)
+        # Waktu jawaban /api/health setelah galeri dipetakan dan sebelum inisialisasi perangkat selesai
+        during_init = []
+        while not report["ready"]:
+            steps = report["startup"]["steps"]
+            if report["startup"]["state"] == "running" and "gallery_warm_start" in steps and "device_init" not in steps:
+                during_init.append(seconds)
+            seconds, report = poll(f"{self.base}/health", started, READY_LIMIT)
+        self.assertTrue(during_init, "/api/health tidak menjawab selama perangkat diinisialisasi (hub terblokir)")
+        self.assertGreater(during_init[-1] - during_init[0], INIT_DELAY / 2)
+
+        ready_seconds, _ = poll(f"{self.base}/ready", started, READY_LIMIT)
+        self.assertLess(ready_seconds, READY_LIMIT)
+        self.assertGreaterEqual(ready_seconds, INIT_DELAY)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import base64
+import json
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/x-msgpack"
+ENROLLMENT_STREAM_FORMAT = "fp-enrollment/1"
+PNG_COMPRESSION = 1  # 0-9; level rendah jauh lebih cepat dengan ukuran yang hampir sama untuk gambar sidik jari
+
+def msgpack_available():
+    try:
+        import msgpack  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def binary_accept_header():
+    """Header Accept untuk klien: msgpack bila tersedia, JSON tetap diterima sebagai fallback."""
+    if msgpack_available(): return f"{MSGPACK_MIMETYPE}, {JSON_MIMETYPE};q=0.5"
+    return JSON_MIMETYPE
+
+def prefers_msgpack(accept_mimetypes):
+    """Negosiasi konten sisi server (request.accept_mimetypes Flask); JSON bila tidak diminta eksplisit."""
+    if not msgpack_available(): return False
+    return accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE) == MSGPACK_MIMETYPE
+
+def decode_response(content_type, content):
+    """Mendekode body respons HTTP sesuai Content-Type (msgpack atau JSON)."""
+    if content_type and content_type.split(";")[0].strip() == MSGPACK_MIMETYPE:
+        import msgpack
+        return msgpack.unpackb(content, raw=False)
+    return json.loads(content)
+
+def encode_png(raw, width, height, compression=PNG_COMPRESSION):
+    """Kompresi lossless gambar grayscale mentah (cv2 melepas GIL, aman di thread pekerja)."""
+    import cv2
+    import numpy as np
+    image = np.frombuffer(raw, dtype=np.uint8).reshape(height, width)
+    ok, buffer = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, compression])
+    if not ok: raise Exception("Encode PNG gagal")
+    return buffer.tobytes()
+
+def decode_png(data):
+    import cv2
+    import numpy as np
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED).tobytes()
+
+def enrollment_json(templates, images):
+    """Format lama: semua template & gambar mentah sebagai base64 di satu objek JSON."""
+    return {
+        "success": True,
+        "templates_base64": {key: base64.b64encode(val).decode('utf-8') for key, val in templates.items()},
+        "images_base64": {key: base64.b64encode(val).decode('utf-8') for key, val in images.items()},
+    }
+
+def iter_enrollment_msgpack(templates, images, image_shapes, image_format="png", run_in_thread=None):
+    """Aliran objek msgpack berurutan (dibaca klien dengan msgpack.Unpacker) untuk respons chunked.
+
+    Objek pertama berisi template mentah dan daftar kunci gambar, lalu satu objek per gambar
+    ({key, format, width, height, data}), diakhiri {"end": true}. Gambar di-encode satu per satu
+    sehingga potongan pertama terkirim sebelum semua kompresi selesai.
+    """
+    import msgpack
+    run_in_thread = run_in_thread or (lambda fn, *args: fn(*args))
+    packer = msgpack.Packer(use_bin_type=True)
+    yield packer.pack({"success": True, "format": ENROLLMENT_STREAM_FORMAT, "templates": templates, "images": list(images)})
+    for key, raw in images.items():
+        width, height = image_shapes(raw)
+        data = run_in_thread(encode_png, raw, width, height) if image_format == "png" else raw
+        yield packer.pack({"key": key, "format": image_format, "width": width, "height": height, "data": data})
+    yield packer.pack({"end": True})
+
+def read_enrollment_stream(chunks):
+    """Sisi klien (Python): menyusun kembali aliran msgpack enrollment ke dict {templates, images}."""
+    import msgpack
+    unpacker = msgpack.Unpacker(raw=False)
+    result = {"templates": {}, "images": {}}
+    for chunk in chunks:
+        unpacker.feed(chunk)
+        for obj in unpacker:
+            if "templates" in obj: result["templates"] = obj["templates"]
+            elif "key" in obj: result["images"][obj["key"]] = decode_png(obj["data"]) if obj["format"] == "png" else obj["data"]
+    return result